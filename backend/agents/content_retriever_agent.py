@@ -1,6 +1,33 @@
+import logging
+import os
+from typing import Optional
+
+from config import SEARCH_INDEX_PATH, CURRICULUM_DATA_DIR, RETRIEVAL_TOP_K
+from services.search_index import SearchIndex
+
+logger = logging.getLogger(__name__)
+
+
 class ContentRetrieverAgent:
-    def retrieve(self, query):
-        # For Phase 1, return a simple context
-        # In future phases, this will integrate with a vector database
-        return f"""This is a placeholder context for the query: {query}
-In future implementations, this will retrieve relevant educational content from a vector database.""" 
\ No newline at end of file
+    """Retrieves curriculum passages from the local BM25 index to ground explanations"""
+
+    def __init__(self, index: Optional[SearchIndex] = None):
+        if index is None:
+            if os.path.exists(SEARCH_INDEX_PATH):
+                index = SearchIndex(SEARCH_INDEX_PATH)
+            else:
+                logger.info(f"Search index not found, building {SEARCH_INDEX_PATH}")
+                index = SearchIndex.build(SEARCH_INDEX_PATH, CURRICULUM_DATA_DIR)
+        self.index = index
+
+    def search(self, query, board=None, class_level=None, subject=None, k=RETRIEVAL_TOP_K):
+        """Top-k passages for the query, most relevant first"""
+        return self.index.search(query, k, board=board, class_level=class_level, subject=subject)
+
+    def retrieve(self, query, board=None, class_level=None, subject=None, k=RETRIEVAL_TOP_K):
+        """Context text for the query, or None when nothing relevant is indexed"""
+        passages = self.search(query, board, class_level, subject, k)
+        if not passages:
+            return None
+        return "\n".join(
+            f"- [{p['board']} {p['class_level']} {p['subject']}] {p['text']}" for p in passages)
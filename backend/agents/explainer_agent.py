@@ -1,11 +1,10 @@
-from ..models.openai_client import OpenAIClient
-from ..config import COMPLEX_TASK_MODEL
+from models.openai_client import OpenAIClient
 
 class ExplainerAgent:
-    def __init__(self):
-        self.client = OpenAIClient()
+    def __init__(self, client=None):
+        self.client = client or OpenAIClient()
 
-    def explain(self, query, context=None):
+    def explain(self, query, context=None, class_level=None, subject=None):
         # Construct the prompt with context if available
         if context:
             prompt = f"""Context: {context}
@@ -15,6 +14,7 @@ Please provide a clear, age-appropriate explanation suitable for elementary scho
             prompt = f"""Question: {query}
 Please provide a clear, age-appropriate explanation suitable for elementary school students."""
 
-        # Use GPT-4 for complex explanations
-        response = self.client.generate(prompt, model=COMPLEX_TASK_MODEL)
-        return response 
\ No newline at end of file
+        # The router picks GPT-4 for complex questions unless it is over the latency budget
+        model = self.client.router.choose('explain', query, class_level=class_level, subject=subject)
+        response = self.client.generate(prompt, model=model)
+        return response
@@ -0,0 +1,111 @@
+import json
+import logging
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Characters that continue a word: \w plus combining marks and Devanagari letters
+# and vowel signs (which are not all \w), but not the danda marks U+0964/U+0965
+_WORD_CHARS = r'\w\u0300-\u036f\u0900-\u0963\u0966-\u097f'
+
+
+def normalize_text(text: str) -> str:
+    """Unicode-normalize and casefold text so terms match regardless of case or encoding"""
+    return unicodedata.normalize('NFKC', text).casefold()
+
+
+def _normalize_term(term: str) -> str:
+    return ' '.join(normalize_text(term).split())
+
+
+def _trie_pattern(terms: Iterable[str]) -> str:
+    """Build a regex alternation shaped like a trie of the terms.
+
+    Shared prefixes are matched once, so the work per character depends on
+    the branching of the trie rather than on the number of terms.
+    """
+    trie: Dict = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: Dict) -> str:
+        branches = []
+        for char in sorted(key for key in node if key):
+            atom = r'\s+' if char == ' ' else re.escape(char)
+            branches.append(atom + build(node[char]))
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            body = '(?:' + body + ')?'
+        return body
+
+    return build(trie)
+
+
+class SafetyFilter:
+    """Multi-term content filter compiled once into a single regex.
+
+    Terms are grouped into named rules; a match reports the rule and term
+    that fired. Matching is case-insensitive (Unicode casefold) and respects
+    word boundaries, including for Devanagari text.
+    """
+
+    def __init__(self, rules: Dict[str, Iterable[str]]):
+        self._rule_by_term: Dict[str, str] = {}
+        for rule, terms in rules.items():
+            for term in terms:
+                key = _normalize_term(term)
+                if key:
+                    self._rule_by_term.setdefault(key, rule)
+
+        # Longest term, used to bound how far back a streaming scan must look
+        self.max_term_length = max((len(term) for term in self._rule_by_term), default=0)
+        self._pattern = None
+        if self._rule_by_term:
+            self._pattern = re.compile(
+                rf'(?<![{_WORD_CHARS}])({_trie_pattern(self._rule_by_term)})(?![{_WORD_CHARS}])')
+        logger.info(f"Compiled safety filter with {len(self._rule_by_term)} terms")
+
+    @classmethod
+    def from_file(cls, path: str) -> 'SafetyFilter':
+        """Load rules from a JSON file of {"rule_name": ["term", ...]}"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def __len__(self) -> int:
+        return len(self._rule_by_term)
+
+    def find(self, content: str) -> Optional[Tuple[str, str]]:
+        """Return (rule, term) for the first banned term in content, or None"""
+        if self._pattern is None:
+            return None
+        match = self._pattern.search(normalize_text(content))
+        if match is None:
+            return None
+        return self.describe(match)
+
+    def search_normalized(self, text: str, pos: int = 0):
+        """Search already-normalized text from pos; the word-boundary check still sees text before pos"""
+        if self._pattern is None:
+            return None
+        return self._pattern.search(text, pos)
+
+    def describe(self, match) -> Tuple[str, str]:
+        """Return (rule, term) for a match from search_normalized"""
+        term = ' '.join(match.group(1).split())
+        return self._rule_by_term[term], term
+
+    def find_all(self, content: str) -> List[Tuple[str, str]]:
+        """Return (rule, term) for every banned term occurrence in content"""
+        if self._pattern is None:
+            return []
+        results = []
+        for match in self._pattern.finditer(normalize_text(content)):
+            results.append(self.describe(match))
+        return results
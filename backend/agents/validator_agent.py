@@ -1,10 +1,21 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+from agents.safety_filter import SafetyFilter, normalize_text
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
+# Moderation terms, grouped by rule name: {"rule_name": ["term", ...]}
+SAFETY_TERMS_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'safety_terms.json')
+
 class ValidatorAgent:
-    def __init__(self):
+    # Accepted response length in characters
+    MIN_LENGTH = 10
+    MAX_LENGTH = 2000
+
+    def __init__(self, safety_filter: Optional[SafetyFilter] = None):
+        # Compiled once; matching cost does not grow with the number of terms
+        self.safety_filter = safety_filter or SafetyFilter.from_file(SAFETY_TERMS_PATH)
         self.validation_rules = {
             'content_length': self.validate_content_length,
             'response_format': self.validate_response_format,
@@ -13,8 +24,8 @@ class ValidatorAgent:
 
     def validate_content_length(self, content: str) -> Dict[str, Any]:
         """Validate if the content length is appropriate"""
-        min_length = 10
-        max_length = 2000
+        min_length = self.MIN_LENGTH
+        max_length = self.MAX_LENGTH
         
         if len(content) < min_length:
             return {
@@ -41,15 +52,16 @@ class ValidatorAgent:
         return {'valid': True}
 
     def validate_safety(self, content: str) -> Dict[str, Any]:
-        """Basic safety check for inappropriate content"""
-        inappropriate_words = ['bad_word1', 'bad_word2']  # Add your list of inappropriate words
-        
-        for word in inappropriate_words:
-            if word.lower() in content.lower():
-                return {
-                    'valid': False,
-                    'message': 'Response contains inappropriate content'
-                }
+        """Safety check for inappropriate content (see data/safety_terms.json)"""
+        match = self.safety_filter.find(content)
+        if match:
+            rule, term = match
+            return {
+                'valid': False,
+                'message': 'Response contains inappropriate content',
+                'rule': rule,
+                'term': term
+            }
         
         return {'valid': True}
 
@@ -73,4 +85,89 @@ class ValidatorAgent:
         return {
             'is_valid': all_valid,
             'validation_results': validation_results
-        } 
\ No newline at end of file
+        } 
+
+    def incremental(self) -> 'IncrementalValidator':
+        """Start validating a response that arrives in chunks"""
+        return IncrementalValidator(self)
+
+    def validate_many(self, contents: List[str]) -> List[Dict[str, Any]]:
+        """Run all validation rules on each content item, in order"""
+        return [self.validate(content) for content in contents]
+
+
+class IncrementalValidator:
+    """Validates a streamed response chunk by chunk.
+
+    Keeps rolling state for the length, sentence and safety rules so that
+    feed() can report a violation as soon as it is definitive, letting the
+    caller cancel the upstream generation. finish() returns the same result
+    shape as ValidatorAgent.validate().
+    """
+
+    # Extra characters re-scanned past the longest term, for whitespace runs inside terms
+    SCAN_MARGIN = 32
+
+    def __init__(self, validator: ValidatorAgent):
+        self.validator = validator
+        self.length = 0
+        self.has_sentence = False
+        self._parts: List[str] = []
+        self._normalized = ''
+        self._scan_from = 0
+        self._violation: Optional[Dict[str, Any]] = None
+
+    @property
+    def text(self) -> str:
+        return ''.join(self._parts)
+
+    def _fail(self, rule_name: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        self._violation = {
+            'is_valid': False,
+            'validation_results': {rule_name: result},
+            'aborted': True
+        }
+        return self._violation
+
+    def feed(self, chunk: str) -> Optional[Dict[str, Any]]:
+        """Consume the next chunk; returns a failed validation result once a rule is violated"""
+        if self._violation is not None:
+            return self._violation
+
+        self._parts.append(chunk)
+        self.length += len(chunk)
+        if not self.has_sentence and any(char in chunk for char in '.!?'):
+            self.has_sentence = True
+
+        # Length only grows, so exceeding the maximum is final
+        if self.length > self.validator.MAX_LENGTH:
+            return self._fail('content_length', {
+                'valid': False,
+                'message': f'Response is too long (maximum {self.validator.MAX_LENGTH} characters)'
+            })
+
+        safety_filter = self.validator.safety_filter
+        self._normalized += normalize_text(chunk)
+        match = safety_filter.search_normalized(self._normalized, self._scan_from)
+        # A match touching the end of the buffer may still grow into a longer word
+        if match is not None and match.end() < len(self._normalized):
+            rule, term = safety_filter.describe(match)
+            return self._fail('safety_check', {
+                'valid': False,
+                'message': 'Response contains inappropriate content',
+                'rule': rule,
+                'term': term
+            })
+
+        window = safety_filter.max_term_length + self.SCAN_MARGIN
+        scan_from = max(self._scan_from, len(self._normalized) - window)
+        if match is not None:
+            scan_from = min(scan_from, match.start())
+        self._scan_from = scan_from
+        return None
+
+    def finish(self) -> Dict[str, Any]:
+        """Final validation result once the stream has ended (or was aborted)"""
+        if self._violation is not None:
+            return self._violation
+        return self.validator.validate(self.text)
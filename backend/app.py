@@ -1,19 +1,38 @@
-from fastapi import FastAPI, HTTPException
-from flask import Flask, request, jsonify
+"""Flask application: create_app() builds the app; the routes live on the api blueprint.
+
+Importing this module is cheap. The OpenAI client, stores and indexes are
+registered with services.startup and built on first use or by the warm-up
+(see production.py for preloading them before workers fork).
+"""
+from flask import Blueprint, Flask, Response, current_app, request, jsonify, stream_with_context
+from flask.json import JSONEncoder
 from flask_jwt_extended import create_access_token, jwt_required, JWTManager, get_jwt_identity
 from flask_cors import CORS, cross_origin
+import atexit
 import datetime
-import json, os, requests
-import openai
+import json, os
 from typing import List, Dict, Optional
 
-from pydantic import BaseModel
-from models.openai_client import OpenAIClient
-from agents.validator_agent import ValidatorAgent
+from models.single_flight import SingleFlightTimeout
+from models.resilience import CircuitOpenError
+from models.admission import AdmissionRejected
+from services.answer_store import match_precomputed
+from services.startup import startup
+from services.instrumentation import (LOOKUP, PARSE, SERIALIZE, VALIDATION, PROMETHEUS_CONTENT_TYPE, REGISTRY,
+                                      cache_samples, configure_logging, current_request, finish_request,
+                                      stage, start_request)
+from config import (PROGRESS_DB_PATH, PROGRESS_FLUSH_INTERVAL_SECONDS, PROGRESS_BULK_MAX_EVENTS,
+                    ANALYTICS_REFRESH_SECONDS, ANSWER_STORE_PATH, PRECOMPUTED_ANSWERS_ENABLED,
+                    METRICS_ENABLED, LOG_LEVEL, CHAT_SESSIONS_ENABLED, CHAT_SESSION_TTL_SECONDS,
+                    CHAT_SESSION_MAX_SESSIONS, CHAT_HISTORY_TOKEN_BUDGET, CHAT_HISTORY_MAX_TURNS,
+                    CHAT_SUMMARY_TOKEN_BUDGET, CHAT_SUMMARY_MODE, QUIZ_POOL_PATH, QUIZ_POOL_SIZE,
+                    QUIZ_POOL_LOW_WATERMARK, QUIZ_POOL_BATCH_SIZE, QUIZ_POOL_REFILL_WORKERS,
+                    QUIZ_DEFAULT_QUESTIONS, QUIZ_MAX_QUESTIONS, CURRICULUM_DATA_DIR, CURRICULUM_INDEX_PATH,
+                    TOPIC_SEARCH_MAX_RESULTS, SIMPLE_TASK_MODEL, SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS)
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (records are written by a background thread, never by the request thread)
+configure_logging(LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
 # Load config file
@@ -25,33 +44,128 @@ except Exception as e:
     logger.error(f"Error loading config: {str(e)}")
     config = {}
 
-class ExplanationRequest(BaseModel):
-    topic: str
-    question: str
-    student_id: Optional[str] = None
+# Load data paths
+# These paths should match your project structure
+STUDENTS_DATA_PATH = os.path.join(os.path.dirname(__file__), 'data', 'students.json')
+SCHOOLS_DATA_PATH = os.path.join(os.path.dirname(__file__), 'data', 'schools.json')
+BOARDS_DATA_PATH = os.path.join(os.path.dirname(__file__), 'data', 'boards.json')
+
+
+# --- Components ---
+# Built on first use or by the warm-up. Preloaded ones are read-only and fork-safe, so
+# production.py builds them once before forking workers; the others own threads,
+# connection pools or SQLite connections and are built in each worker.
+def build_reference_data():
+    # Indexed store for student, school, and board data
+    # The JSON files are parsed once and reloaded only when they change on disk
+    from services.reference_data import ReferenceDataStore
+    store = ReferenceDataStore(STUDENTS_DATA_PATH, SCHOOLS_DATA_PATH, BOARDS_DATA_PATH)
+    store.load()
+    return store
+
+
+def build_curriculum_index():
+    # Every board's curriculum compiled into one memory-mapped file, for topic search
+    from services.curriculum_index import CurriculumIndex
+    index = CurriculumIndex.open(CURRICULUM_INDEX_PATH, CURRICULUM_DATA_DIR)
+    atexit.register(index.close)
+    return index
+
+
+def build_curriculum_catalog():
+    # Parsed, indexed curriculum for every {board}-SUBJECTS.json file, other boards from the compiled index
+    from services.curriculum_catalog import CurriculumCatalog
+    return CurriculumCatalog(os.path.join(os.path.dirname(__file__), 'data'), index=curriculum_index)
+
+
+def build_retriever():
+    from agents.content_retriever_agent import ContentRetrieverAgent
+    return ContentRetrieverAgent()
+
+
+def build_validator():
+    from agents.validator_agent import ValidatorAgent
+    return ValidatorAgent()
+
+
+def build_client():
+    from models.openai_client import OpenAIClient
+    return OpenAIClient()
+
+
+def build_answer_store():
+    # Explanations and quizzes generated ahead of time by `python -m services.precompute`
+    from services.answer_store import AnswerStore
+    return AnswerStore(ANSWER_STORE_PATH)
+
+
+def build_progress_store():
+    # Durable storage for progress tracking (SQLite, shared by all worker processes)
+    from services.progress_store import ProgressStore
+    store = ProgressStore(PROGRESS_DB_PATH, flush_interval=PROGRESS_FLUSH_INTERVAL_SECONDS)
+    atexit.register(store.close)
+    return store
+
+
+def build_chat_sessions():
+    # Per-student, per-topic chat history sent with follow-up questions
+    from models.chat_sessions import ChatSessionStore
+    store = ChatSessionStore(max_sessions=CHAT_SESSION_MAX_SESSIONS, ttl_seconds=CHAT_SESSION_TTL_SECONDS,
+                             history_token_budget=CHAT_HISTORY_TOKEN_BUDGET,
+                             summary_token_budget=CHAT_SUMMARY_TOKEN_BUDGET, max_turns=CHAT_HISTORY_MAX_TURNS,
+                             summarize=summarize_turns if CHAT_SUMMARY_MODE == 'model' else None)
+    atexit.register(store.close)
+    return store
+
+
+def build_quiz_pool():
+    # Parsed quiz questions per topic, shared by all worker processes and refilled in the background
+    from services.quiz_pool import QuizPool
+    pool = QuizPool(QUIZ_POOL_PATH, client, answer_store=answer_store if PRECOMPUTED_ANSWERS_ENABLED else None,
+                    pool_size=QUIZ_POOL_SIZE, low_watermark=QUIZ_POOL_LOW_WATERMARK,
+                    batch_size=QUIZ_POOL_BATCH_SIZE, refill_workers=QUIZ_POOL_REFILL_WORKERS,
+                    model_for=lambda key, prompt: client.router.choose('quiz', prompt, class_level=key[1],
+                                                                       subject=key[2], intent='quiz'),
+                    validator=validator)
+    atexit.register(pool.close)
+    return pool
+
+
+def build_generation_budgets():
+    # Output length per endpoint, class level and intent, within the validator's limits
+    from models.generation_budget import GenerationBudgetPolicy
+    return GenerationBudgetPolicy()
+
 
-class ProgressData(BaseModel):
-    student_id: str
-    board: str
-    class_level: str
-    subject: str
-    topic: str
-    understanding_level: int  # 1-5 scale
-    questions_asked: int
-    time_spent: int  # in minutes
+def build_progress_analytics():
+    # Columnar copy of the progress rows for class-wide analytics
+    from services.progress_analytics import ProgressAnalytics
+    analytics = ProgressAnalytics.from_rows(progress_store.all_topic_rows())
+    analytics.start_refresher(progress_store.all_topic_rows, ANALYTICS_REFRESH_SECONDS)
+    return analytics
 
-# In-memory storage for progress tracking
-progress_db = {}
+
+reference_data = startup.component('reference_data', build_reference_data, preload=True)
+curriculum_index = startup.component('curriculum_index', build_curriculum_index, preload=True)
+curriculum_catalog = startup.component('curriculum_catalog', build_curriculum_catalog, preload=True)
+retriever = startup.component('retriever', build_retriever, preload=True)
+validator = startup.component('validator', build_validator, preload=True)
+progress_store = startup.component('progress_store', build_progress_store)
+progress_analytics = startup.component('progress_analytics', build_progress_analytics)
+answer_store = startup.component('answer_store', build_answer_store)
+client = startup.component('openai_client', build_client)
+chat_sessions = startup.component('chat_sessions', build_chat_sessions)
+quiz_pool = startup.component('quiz_pool', build_quiz_pool)
+generation_budgets = startup.component('generation_budgets', build_generation_budgets)
+# Imported by per-worker components and request handlers; loaded before forking so workers share them
+startup.preload_modules('models.openai_client', 'models.chat_sessions', 'models.schemas',
+                        'services.progress_analytics', 'services.progress_store', 'services.answer_store',
+                        'services.quiz_pool', 'models.generation_budget')
 
 
 def update_progress(student_id: str, topic: str):
-    if student_id in progress_db:
-        # Update the last accessed time for the topic
-        for subject in progress_db[student_id]["subjects"].values():
-            if topic in subject["topics"]:
-                subject["topics"][topic]["last_accessed"] = datetime.now().isoformat()
-                subject["topics"][topic]["questions_asked"] += 1
-                break 
+    # Update the last accessed time and question count for the topic
+    progress_store.touch_topic(student_id, topic)
 
 
 # Load configuration values
@@ -68,68 +182,327 @@ if not OPENAI_API_KEY:
         logger.error("Invalid OpenAI API key format. Key should start with 'sk-' and not contain 'proj-'")
         OPENAI_API_KEY = ''
 
-openai.api_key = OPENAI_API_KEY
 
 
-class ChatRequest(BaseModel):
-    message: str
-    studentId: str = None
-    board: str = None
-    classLevel: str = None
-    subject: str = None
-    skipValidation: bool = False
+# Upstream generation settings per endpoint (shared with the ASGI routes in asgi.py)
+# The model is chosen per request by client.router (see route_model); max_tokens and
+# temperature are replaced per request by the generation budget (see generation_budget)
+SEARCH_GENERATION = dict(
+    system_prompt="You are a helpful educational assistant.",
+    max_tokens=500,
+    temperature=0.7
+)
+EXPLAIN_GENERATION = dict(
+    system_prompt="You are a helpful educational assistant. Explain concepts clearly and concisely, using age-appropriate language and examples.",
+    max_tokens=500,
+    temperature=0.7
+)
+CHAT_SUMMARY_GENERATION = dict(
+    system_prompt="You summarize tutoring conversations for the tutor. In a few short sentences, keep what the student asked, what was explained, and what they found difficult.",
+    temperature=0.3
+)
+VALIDATION_FAILED_RESPONSE = "I apologize, but I need to rephrase my response to meet our quality standards."
+
+
+def upstream_unavailable(e: CircuitOpenError):
+    """503 telling the client when the circuit breaker will let calls through again"""
+    response = jsonify({'error': 'AI service temporarily unavailable, please retry shortly'})
+    response.headers['Retry-After'] = str(int(e.retry_after + 0.999))
+    return response, 503
+
+
+def server_error(e: Exception):
+    """500 with the same body shape the ASGI routes return"""
+    return jsonify({'detail': str(e)}), 500
+
+
+def admission_rejected(e: AdmissionRejected):
+    """429 telling the client when its LLM call is likely to be admitted"""
+    response = jsonify({'error': str(e)})
+    response.headers['Retry-After'] = str(int(e.retry_after + 0.999))
+    return response, 429
+
+
+def use_completion_cache(data: dict) -> bool:
+    """Clients opt out of cached answers with noCache (or a cache-busting timestamp)"""
+    return not (data.get('noCache') or data.get('timestamp'))
+
+
+def class_name(class_level) -> Optional[str]:
+    """The curriculum's name for a class: "Class 5" for 5 or "5", anything else unchanged"""
+    if isinstance(class_level, int) or (isinstance(class_level, str) and class_level.strip().isdigit()):
+        return f"Class {str(class_level).strip()}"
+    return class_level
+
+
+def question_scope(data: dict) -> tuple:
+    """Curriculum scope a question is asked in; near-duplicate answers are only shared within it"""
+    return (data.get('board'), class_name(data.get('class_level') or data.get('classLevel')), data.get('subject'))
+
+
+def precomputed_answer(data: dict, message: str) -> Optional[dict]:
+    """Stored answer for a standard per-topic request ("Explain the concept of ..." or a quiz), if any"""
+    if not PRECOMPUTED_ANSWERS_ENABLED or data.get('noCache'):
+        return None
+    request = match_precomputed(message)
+    board, class_level, subject = question_scope(data)
+    if request is None or not (board and class_level and subject):
+        return None
+    kind, topic = request
+    with stage(LOOKUP):
+        return answer_store.get(kind, board, class_level, subject, topic)
+
+
+def route_model(endpoint: str, data: dict, question: str) -> str:
+    """Model tier for this request, from the question and the student's class and subject"""
+    _, class_level, subject = question_scope(data)
+    return client.router.choose(endpoint, question, class_level=class_level, subject=subject)
+
+
+def generation_budget(endpoint: str, data: dict, question: str):
+    """max_tokens, temperature and length instruction for this request (None while budgets are disabled)"""
+    return generation_budgets.choose(endpoint, question, class_level=question_scope(data)[1])
+
+
+def budgeted(budget, settings: Optional[dict] = None) -> dict:
+    """Generation arguments: settings (e.g. SEARCH_GENERATION or a session context) sized by budget"""
+    if budget is None:
+        return dict(settings or {})
+    return budget.arguments(settings)
+
+
+def budget_used(budget, answer: Optional[str]) -> None:
+    """Record the answer's length against its budget, for tuning the policy"""
+    if budget is not None:
+        generation_budgets.observe(budget, answer)
+
+
+def request_admission(endpoint: str, data: dict, question: str, client_address: Optional[str]) -> dict:
+    """Admission queue priority and per-student key for an LLM call.
+
+    Chat is interactive, search and explain are standard, and quiz generation
+    (or a client asking for "priority": "bulk") waits behind both. Anonymous
+    callers are limited per client address.
+    """
+    if data.get('priority') == 'bulk' or client.router.features(question)['intent'] == 'quiz':
+        priority = 'bulk'
+    else:
+        priority = 'interactive' if endpoint == 'chat' else 'standard'
+    student = data.get('student_id') or data.get('studentId') or client_address
+    return {'priority': priority, 'student': student}
+
+
+def explain_question(data: dict) -> str:
+    return f"{data.get('topic') or ''} {data.get('question') or ''}".strip()
+
+
+def explain_prompt(data: dict) -> str:
+    """Explain prompt grounded in the curriculum passages most relevant to the topic and question"""
+    board, class_level, subject = question_scope(data)
+    with stage(LOOKUP):
+        context = retriever.retrieve(explain_question(data), board=board, class_level=class_level,
+                                     subject=subject)
+    prompt = f"Topic: {data.get('topic')}\nQuestion: {data.get('question')}"
+    if context:
+        prompt = f"Context:\n{context}\n{prompt}"
+    return prompt
+
+
+def tutor_prompt(data: dict) -> str:
+    """System prompt of a chat session: who the student is and which topic the conversation is about"""
+    board, class_level, subject = question_scope(data)
+    student = ' '.join(part for part in (board, class_level) if part)
+    prompt = f"You are a helpful educational assistant tutoring a {student + ' ' if student else ''}student"
+    prompt += f" on {data.get('topic')}" + (f" in {subject}" if subject else '') + "."
+    return prompt + " Answer follow-up questions in the context of the conversation, using age-appropriate language."
+
+
+def chat_session(data: dict):
+    """The student's chat session on the request's topic, or None for one-off questions.
+
+    Requests join a session by carrying a student id and a topic; "resetSession": true starts it over.
+    """
+    student = data.get('student_id') or data.get('studentId')
+    if not (CHAT_SESSIONS_ENABLED and student and data.get('topic')):
+        return None
+    key = chat_sessions.make_key(str(student), *question_scope(data), str(data['topic']))
+    with stage(LOOKUP):
+        if data.get('resetSession'):
+            chat_sessions.reset(key)
+        return chat_sessions.get(key, tutor_prompt(data))
+
+
+def session_context(session) -> dict:
+    """system_prompt and history generation arguments for a message in session (none outside one)"""
+    if session is None:
+        return {}
+    system_prompt, history = chat_sessions.context(session)
+    return {'system_prompt': system_prompt, 'history': history}
+
+
+def remember_turn(session, question: str, result: dict, answer: str) -> None:
+    """Add an answered exchange to the session; answers that failed validation are left out"""
+    if session is not None and 'validation_errors' not in result:
+        chat_sessions.record(session, question, answer)
+
+
+def summarize_turns(summary: str, turns: List[dict]) -> str:
+    """Model-written rolling summary of a chat session (runs on the session store's background thread)"""
+    transcript = '\n'.join(f"{'Student' if turn['role'] == 'user' else 'Tutor'}: {turn['content']}" for turn in turns)
+    prompt = f"Summary so far:\n{summary or '(none)'}\n\nNew turns:\n{transcript}\n\nUpdated summary:"
+    return client.generate(prompt, max_tokens=CHAT_SUMMARY_TOKEN_BUDGET, use_cache=False, priority='bulk',
+                           **CHAT_SUMMARY_GENERATION)
 
 
-# Initialize OpenAI client and validator agent
-client = OpenAIClient()
-validator = ValidatorAgent()
+def should_skip_validation(data: dict, query: str) -> bool:
+    """Skip validation if requested or if the message is a numerical operation"""
+    #if request.skipValidation or any(op in request.message for op in ['+', '-', '*', '/']):
+    return bool(data.get('skipValidation')) or any(op in query for op in ['+', '-', '*', '/'])
+
+
+def validation_error_messages(validation_result: dict) -> List[str]:
+    return [
+        result['message']
+        for result in validation_result['validation_results'].values()
+        if not result['valid']
+    ]
+
+
+def chat_result(response: str, skip_validation: bool, validation_result: Optional[dict] = None) -> dict:
+    """Build the /api/chat reply, validating the response unless skipped or already validated"""
+    if skip_validation:
+        return {
+            "response": response,
+            "validation": {"is_valid": True}
+        }
+
+    # Validate the response
+    if validation_result is None:
+        with stage(VALIDATION):
+            validation_result = validator.validate(response)
+    logger.info(f"Validation result: {validation_result}")
+
+    # If validation fails, return an error message
+    if not validation_result['is_valid']:
+        return {
+            "response": VALIDATION_FAILED_RESPONSE,
+            "validation_errors": validation_error_messages(validation_result)
+        }
+
+    return {
+        "response": response,
+        "validation": validation_result
+    }
 
 logger.info(f"Frontend port: {FRONTEND_PORT}")
 #OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 
-app = Flask(__name__)
+def stored_stream(text: str):
+    """Replay a stored answer through the streaming path"""
+    from models.openai_client import CompletionStream
+    return CompletionStream(text=text)
 
-# --- JWT Configuration ---
-# You can generate a strong secret key using: import os; os.urandom(24).hex()
-app.config["JWT_SECRET_KEY"] = "your-super-secret-jwt-key" # Change this in production!
-#app.config["JWT_ACCESS_TOKEN_EXPIRES"] = datetime.timedelta(hours=1) # Access tokens expire in 1 hour
-app.config["JWT_ACCESS_TOKEN_EXPIRES"] = datetime.timedelta(minutes=60) # Access tokens expire in 1 Minute
 
-jwt = JWTManager(app)
+class TimedJSONEncoder(JSONEncoder):
+    """Counts JSON encoding (jsonify and returned dicts) as the request's serialize stage"""
 
+    def encode(self, o):
+        with stage(SERIALIZE):
+            return super().encode(o)
 
-# Load data paths
-# These paths should match your project structure
-STUDENTS_DATA_PATH = os.path.join(os.path.dirname(__file__), 'data', 'students.json')
-SCHOOLS_DATA_PATH = os.path.join(os.path.dirname(__file__), 'data', 'schools.json')
-BOARDS_DATA_PATH = os.path.join(os.path.dirname(__file__), 'data', 'boards.json')
 
-# Function to load student, school, and board data from JSON files
-# This function is used to read the data from the JSON files
-def load_students():
-    with open(STUDENTS_DATA_PATH, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-# Function to load schools data from JSON file
-def load_schools():
-    with open(SCHOOLS_DATA_PATH, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-# Function to load boards data from JSON file
-def load_Boards():
-    with open(BOARDS_DATA_PATH, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-
-# --- CORS Configuration ---
-# Enable CORS for all routes
-CORS(app, 
-     resources={r"/*": {
-         "origins": ["http://localhost:3000", f"http://localhost:{FRONTEND_PORT}"],
-         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-         "allow_headers": ["Content-Type", "Authorization"],
-         "supports_credentials": True
-     }})
+# How long browsers may reuse /api/subjects responses before revalidating (seconds)
+SUBJECTS_CACHE_MAX_AGE = 300
+
+api = Blueprint('api', __name__)
+
+
+# --- Instrumentation ---
+# Each request's stage timings are recorded when it ends (after the last byte of a stream)
+# and reported in a Server-Timing header; aggregates are served by /api/metrics
+def start_request_timer():
+    start_request(request.url_rule.rule if request.url_rule else 'unmatched', request.method)
+
+
+def add_server_timing(response):
+    timer = current_request()
+    if timer is not None:
+        timer.status = response.status_code
+        response.headers['Server-Timing'] = timer.server_timing()
+    return response
+
+
+def finish_request_timer(exc):
+    finish_request(500 if exc is not None else None)
+
+
+def serving_metrics():
+    """Cache hit counts and queue depths, read from the components' own counters at scrape time"""
+    # Components this worker has not built yet are skipped rather than built by a scrape
+    caches = {}
+    shared = None
+    if client.built:
+        caches.update(completion=client.cache.stats(), near_duplicate=client.near_duplicates.stats())
+        if client.cache.shared is not None:
+            shared = caches['completion_shared'] = client.cache.shared.stats()
+    if answer_store.built:
+        caches['precomputed'] = {'hits': answer_store.hits, 'misses': answer_store.misses}
+    yield ('edu_cache_lookups_total', 'counter', 'Answer cache lookups by cache and result', cache_samples(caches))
+    if shared is not None:
+        # Host-wide: every worker reports the same totals
+        yield ('edu_shared_cache_entries', 'gauge', 'Entries in the completion cache shared by the workers',
+               [({}, shared['entries'] or 0)])
+        yield ('edu_shared_cache_bytes', 'gauge', 'Bytes in the completion cache shared by the workers',
+               [({}, shared['bytes'] or 0)])
+    if chat_sessions.built:
+        sessions = chat_sessions.stats()
+        yield ('edu_chat_sessions', 'gauge', 'Live chat sessions', [({}, sessions['sessions'])])
+        yield ('edu_chat_session_compactions_total', 'counter', 'Chat histories compacted into their summary',
+               [({}, sessions['compactions'])])
+    if quiz_pool.built:
+        pool = quiz_pool.stats()
+        yield ('edu_quiz_pool_questions', 'gauge', 'Questions in the quiz pools (all workers)',
+               [({}, pool['questions'])])
+        yield ('edu_quiz_questions_served_total', 'counter', 'Quiz questions served', [({}, pool['served'])])
+        yield ('edu_quiz_questions_generated_total', 'counter', 'New quiz questions added by refills',
+               [({}, pool['generated'])])
+    if generation_budgets.built:
+        usage = generation_budgets.stats()['usage']
+        yield ('edu_generation_answers_total', 'counter', 'Generated answers by endpoint and intent',
+               [({'endpoint': u['endpoint'], 'intent': u['intent']}, u['answers']) for u in usage])
+        yield ('edu_generation_tokens_total', 'counter',
+               'Output tokens of generated answers: allowed by their budgets, and estimated used',
+               [({'endpoint': u['endpoint'], 'intent': u['intent'], 'kind': kind}, u[f'{kind}_tokens'])
+                for u in usage for kind in ('budget', 'used')])
+        yield ('edu_generation_truncated_total', 'counter', 'Generated answers that ran into max_tokens',
+               [({'endpoint': u['endpoint'], 'intent': u['intent']}, u['truncated']) for u in usage])
+    if progress_store.built:
+        yield ('edu_progress_pending_writes', 'gauge', 'Progress writes queued for the background flusher',
+               [({}, progress_store.pending_writes())])
+    if not client.built:
+        return
+    admission = client.admission.stats()
+    yield ('edu_admission_queue_depth', 'gauge', 'LLM calls waiting for admission',
+           [({'priority': priority}, queued) for priority, queued in admission['queued'].items()])
+    yield ('edu_admission_queued_tokens', 'gauge', 'Estimated tokens of the LLM calls waiting for admission',
+           [({}, admission['queued_tokens'])])
+    yield ('edu_admission_admitted_total', 'counter', 'LLM calls admitted', [({}, admission['admitted'])])
+    yield ('edu_admission_rejected_total', 'counter', 'LLM calls rejected by admission control',
+           [({'reason': reason}, count) for reason, count in admission['rejected'].items()])
+    yield ('edu_upstream_retries_total', 'counter', 'Upstream call retries (WSGI client)',
+           [({}, client.retry.retries)])
+    yield ('edu_circuit_breaker_open', 'gauge', '1 while the upstream circuit breaker is open',
+           [({}, 1 if client.breaker.state == 'open' else 0)])
+
+
+REGISTRY.collector(serving_metrics)
+
+
+def request_json(**kwargs):
+    """request.get_json, timed as the request's parse stage"""
+    with stage(PARSE):
+        return request.get_json(**kwargs)
+
 
 # --- User Data (for demonstration purposes) ---
 users = {
@@ -139,7 +512,7 @@ users = {
 
 
 # --- Routes ---
-@app.route("/api/login", methods=["POST", "OPTIONS"])
+@api.route("/api/login", methods=["POST", "OPTIONS"])
 @cross_origin(origins=[f"http://localhost:{FRONTEND_PORT}", "http://localhost:3000"], 
              allow_headers=["Content-Type", "Authorization"],
              supports_credentials=True)
@@ -151,58 +524,32 @@ def login():
     Handles user login.
     If credentials are valid, creates and returns a JWT access token.
     """
-    username = request.json.get("username", None)
-    password = request.json.get("password", None)
+    data = request_json(silent=True) or {}
+    username = data.get("username", None)
+    password = data.get("password", None)
     
-    """ 
-    Loading user information from backend and 
-    """
-    students = load_students()
-    schools = load_schools()
-    boards = load_Boards()
-    
-    #Variable declaration
-    schoolName = ''
-    boardName = ''
-    userfound = False
-    studentFullName = ''
-    studentGrade    = ''
-    studentDivision = ''
-
-
     if not username or not password:
         return jsonify({"msg": "Missing username or password"}), 400
 
-    for student in students:
-        if student['USERNAME'] == username and student['PASSWORD'] == password:
-            # Find the school and board for the student
-            for school in schools:
-                if school['ID'] == student['SCHOOL_ID']:
-                    schoolName= school['NAME']
-                    boardid=school['BOARD']
-                    break
-            
-            for board in boards:
-                if board['ID'] == boardid:
-                    boardName = board['NAME']
-                    break
-            studentFullName = student['FIRST_NAME'] + " " +  student['LAST_NAME']
-            studentGrade = student['GRADE']
-            studentDivision = student['DIVISION']
-            userfound = True
-            break;
+    """ 
+    Looking up user information from the indexed reference data
+    """
+    with stage(LOOKUP):
+        profile = reference_data.authenticate(username, password)
+    userfound = profile is not None
+    if userfound:
+        studentFullName = profile['studentFullName']
+        studentGrade = profile['studentGrade']
+        studentDivision = profile['studentDivision']
+        schoolName = profile['schoolName']
+        boardName = profile['boardName']
 
     #if users.get(username) == password:
 
     if userfound:
-        print("Student fullname:" + studentFullName)
-        print("Student Grade:" + studentGrade)
-        print("Student Division:" + studentDivision)
-        print("School Name:" +  schoolName) 
-        print("Board NAME:" + boardName)
         # Create an access token for the user
         access_token = create_access_token(identity=username)
-        print("Access Token Created is:" + access_token)
+        logger.info(f"Issued access token for {username}")
         return jsonify({"access_token" : access_token,
            "studentFullName": studentFullName,
             "studentGrade": studentGrade,
@@ -212,7 +559,7 @@ def login():
     else:
         return jsonify({"msg": "Bad username or password"}), 401
 
-@app.route("/api/protected", methods=["GET", "OPTIONS"])
+@api.route("/api/protected", methods=["GET", "OPTIONS"])
 @cross_origin(origins=[f"http://localhost:{FRONTEND_PORT}", "http://localhost:3000"], 
              allow_headers=["Content-Type", "Authorization"],
              supports_credentials=True)
@@ -228,7 +575,7 @@ def protected():
     current_user = get_jwt_identity() # Get the identity of the current user from the token
     return jsonify(logged_in_as=current_user, message="You have accessed protected data!"), 200
 
-@app.route("/api/status", methods=["GET"])
+@api.route("/api/status", methods=["GET"])
 @jwt_required(optional=True) # Optional JWT: allows access even without a token
 def status():
     """
@@ -242,7 +589,7 @@ def status():
     else:
         return jsonify(is_logged_in=False, username=None), 200
 
-@app.route("/api/subjects", methods=["GET", "OPTIONS"])
+@api.route("/api/subjects", methods=["GET", "OPTIONS"])
 @cross_origin(origins=[f"http://localhost:{FRONTEND_PORT}", "http://localhost:3000"], 
              allow_headers=["Content-Type", "Authorization"],
              supports_credentials=True,
@@ -259,43 +606,183 @@ def subjects():
     It retrieves the identity from the token and returns a message.
     """
     current_user = get_jwt_identity() # Get the identity of the current user from the token
-    print('Logged in with ' + current_user)
-    board = str(request.args.get('board'))
-    class_name = 'Class '+ str(request.args.get('class'))
-    print('board:' + board + ' and Class: ' + class_name)
-    if not board or not class_name:
+    board = request.args.get('board')
+    class_param = request.args.get('class')
+    if not board or not class_param:
         return jsonify({'error': 'Missing board or class parameter'}), 400
-    
-    subjects_file = os.path.join(os.path.dirname(__file__), 'data', f'{board}-SUBJECTS.json')
+    class_name = 'Class ' + class_param
 
-    if not os.path.exists(subjects_file):
+    # Served from the in-memory catalog: no file I/O or JSON work per request
+    if not curriculum_catalog.has_board(board):
         return jsonify({'error': f'{board}-SUBJECTS.json not found'}), 404
 
-    try:
-        with open(subjects_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        # Find the class entry
-        print(f"Looking for class entry: '{class_name}' in {board}-SUBJECTS.json")
-        print(f"Available classes: {[item.get('class') for item in data]}")
-        class_entry = next((item for item in data if item.get('class') == class_name), None)
-        if not class_entry:
-            return jsonify({'error': f'Class {class_name} not found', 'available_classes': [item.get('class') for item in data]}), 404
-        subjects = class_entry.get('subjects', {})
-        response = jsonify(logged_in_as=current_user, subjects=subjects)
-        return response
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    with stage(LOOKUP):
+        entry = curriculum_catalog.get(board, class_name)
+    if entry is None:
+        return jsonify({'error': f'Class {class_name} not found',
+                        'available_classes': curriculum_catalog.available_classes(board)}), 404
+
+    etag = entry.etag_for(current_user)
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(entry.response_body(current_user), mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'private, max-age={SUBJECTS_CACHE_MAX_AGE}, must-revalidate'
+    return response
    
 #return jsonify(logged_in_as=current_user, message="You have accessed protected data fro Subjecgts Screen!"), 200
 
 
-@app.route('/api/search', methods=['POST', 'OPTIONS'])
+@api.route("/api/topics/search", methods=["GET"])
+def search_topics():
+    """
+    Topic autocomplete across every board: topics whose name starts with q,
+    then topics containing all of its words, each with the boards, classes
+    and subjects it is taught in. Optional board, class (e.g. 2 or "Class 2")
+    and subject narrow the search; limit caps the number of topics.
+    """
+    query = request.args.get('q', '')
+    if not query.strip():
+        return jsonify({'error': 'Missing q parameter'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), TOPIC_SEARCH_MAX_RESULTS)
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+    class_level = class_name(request.args.get('class'))
+
+    with stage(LOOKUP):
+        results = curriculum_index.search(query, limit, board=request.args.get('board'), class_level=class_level,
+                                          subject=request.args.get('subject'))
+    return jsonify({'query': query, 'results': results})
+
+
+# --- Streaming (Server-Sent Events) helpers ---
+# Clients opt in with "stream": true in the body or an Accept: text/event-stream header.
+# Answers arrive as "token" events followed by one terminal "done" (or "error") event.
+def wants_stream(data: dict) -> bool:
+    return bool(data.get('stream')) or request.accept_mimetypes.best == 'text/event-stream'
+
+
+def sse_event(event: str, payload: dict) -> str:
+    with stage(SERIALIZE):
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def sse_response(events) -> Response:
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def relay_tokens(stream, checker=None):
+    """Yield token events; returns False if the upstream failed mid-stream.
+
+    With an IncrementalValidator, the upstream is cancelled (and the offending
+    chunk withheld) as soon as a validation rule is definitively violated.
+    """
+    try:
+        for delta in stream:
+            if checker is not None and feed_validator(checker, delta):
+                logger.info("Validation failed mid-stream, cancelled upstream generation")
+                break
+            yield sse_event('token', {'text': delta})
+    except Exception as e:
+        logger.error(f"Error while streaming OpenAI response: {str(e)}")
+        yield sse_event('error', {'error': str(e)})
+        return False
+    finally:
+        # Also runs when the client disconnects, so the call is settled either way
+        stream.close()
+    return True
+
+
+def feed_validator(checker, delta: str) -> bool:
+    with stage(VALIDATION):
+        return checker.feed(delta)
+
+
+def stream_search(stream, budget=None):
+    if not (yield from relay_tokens(stream)):
+        return
+    budget_used(budget, stream.text)
+    yield sse_event('done', {'usage': stream.usage, 'cached': stream.cached})
+
+
+def chat_done_event(stream, skip_validation: bool, checker=None) -> dict:
+    """Terminal event payload; the apology text is only sent when validation fails"""
+    final = {'usage': stream.usage, 'cached': stream.cached}
+    with stage(VALIDATION):
+        validation_result = checker.finish() if checker else None
+    result = chat_result(stream.text, skip_validation, validation_result)
+    if 'validation_errors' not in result:
+        # The client already has the answer from the token events
+        del result['response']
+    final.update(result)
+    return final
+
+
+def stream_chat(stream, skip_validation: bool, session=None, question: str = '', budget=None):
+    checker = None if skip_validation else validator.incremental()
+    if not (yield from relay_tokens(stream, checker)):
+        return
+    budget_used(budget, stream.text)
+    done = chat_done_event(stream, skip_validation, checker)
+    remember_turn(session, question, done, stream.text)
+    yield sse_event('done', done)
+
+
+def validated_key(query: str, use_cache: bool, model: Optional[str] = None,
+                  context: Optional[dict] = None) -> Optional[tuple]:
+    """Key under which identical validated generations are coalesced, or None if they must not be"""
+    from models.completion_cache import CompletionCache
+    context = context or {}
+    # Same rule as client.generate: opting out of the cache or a conversation history opts out of sharing
+    if not use_cache or context.get('history'):
+        return None
+    return ('validated',) + CompletionCache.make_key(query, model or SIMPLE_TASK_MODEL,
+                                                     context.get('temperature', 0.7),
+                                                     context.get('max_tokens', 500), context.get('system_prompt'))
+
+
+def generate_validated(query: str, use_cache: bool, scope: Optional[tuple] = None,
+                       model: Optional[str] = None, admission: Optional[dict] = None,
+                       context: Optional[dict] = None):
+    """Generate a chat answer while validating it chunk by chunk.
+
+    The upstream generation is cancelled on the first definitive violation,
+    so rejected answers stop costing time and tokens at that point.
+    Concurrent identical questions share one generation and its validation.
+    Returns (response, validation_result).
+    """
+    def generate():
+        stream = client.generate_stream(query, model=model, use_cache=use_cache, scope=scope,
+                                        **(admission or {}), **(context or {}))
+        checker = validator.incremental()
+        try:
+            for delta in stream:
+                if feed_validator(checker, delta):
+                    logger.info("Validation failed mid-generation, cancelled upstream generation")
+                    break
+        finally:
+            stream.close()
+        with stage(VALIDATION):
+            return stream.text, checker.finish()
+
+    key = validated_key(query, use_cache, model, context)
+    if key is None:
+        return generate()
+    return client.inflight.do(key, generate, timeout=SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS)
+
+
+@api.route('/api/search', methods=['POST', 'OPTIONS'])
 def search():
     if request.method == "OPTIONS":
         return jsonify({"status": "ok"}), 200
         
+    import openai
+
     try:
-        data = request.get_json()
+        data = request_json()
         if not data:
             return jsonify({'error': 'No data provided'}), 400
             
@@ -304,171 +791,427 @@ def search():
             return jsonify({'error': 'No message provided'}), 400
             
         logger.info(f"Received search query: {query}")
+
+        stored = precomputed_answer(data, query)
+        if stored is not None:
+            if wants_stream(data):
+                return sse_response(stream_search(stored_stream(stored['content'])))
+            return jsonify({'results': [stored['content']]})
         
         if not OPENAI_API_KEY:
             logger.error("OpenAI API key not configured")
             return jsonify({'error': 'OpenAI API key not configured'}), 500
             
-        # Call OpenAI ChatGPT API
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful educational assistant."},
-                {"role": "user", "content": query}
-            ],
-            max_tokens=500,
-            temperature=0.7
-        )
-        
-        answer = response.choices[0].message.content
+        # Call OpenAI ChatGPT API (repeated questions are served from the completion cache)
+        model = route_model('search', data, query)
+        admission = request_admission('search', data, query, request.remote_addr)
+        budget = generation_budget('search', data, query)
+        if wants_stream(data):
+            stream = client.generate_stream(query, model=model, **budgeted(budget, SEARCH_GENERATION),
+                                            use_cache=use_completion_cache(data), scope=question_scope(data),
+                                            **admission)
+            return sse_response(stream_search(stream, budget))
+
+        answer = client.generate(query, model=model, **budgeted(budget, SEARCH_GENERATION),
+                                 use_cache=use_completion_cache(data), scope=question_scope(data), **admission)
+        budget_used(budget, answer)
         logger.info("Successfully generated response")
         return jsonify({'results': [answer]})
         
     except openai.AuthenticationError as e:
         logger.error(f"OpenAI Authentication error: {str(e)}")
         return jsonify({'error': 'Invalid OpenAI API key'}), 401
+    except openai.APITimeoutError as e:
+        logger.error(f"OpenAI API timed out: {str(e)}")
+        return jsonify({'error': 'OpenAI API timed out'}), 504
+    except CircuitOpenError as e:
+        logger.error(f"OpenAI API circuit open: {str(e)}")
+        return upstream_unavailable(e)
+    except AdmissionRejected as e:
+        logger.warning(f"Search not admitted: {str(e)}")
+        return admission_rejected(e)
     except openai.APIError as e:
         logger.error(f"OpenAI API error: {str(e)}")
         return jsonify({'error': 'OpenAI API error'}), 503
+    except SingleFlightTimeout as e:
+        logger.error(f"Timed out waiting for shared OpenAI call: {str(e)}")
+        return jsonify({'error': 'OpenAI API timed out'}), 504
     except Exception as e:
         logger.error(f"Unexpected error in search: {str(e)}")
         return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
 
-@app.route("/api/chat", methods=["POST", "OPTIONS"])
+@api.route("/api/chat", methods=["POST", "OPTIONS"])
 def chat():
     if request.method == "OPTIONS":
         return jsonify({"status": "ok"}), 200
         
-    print("Inside /api/chat endpoint call")
-    data = request.get_json()
-    print("Data Sent from Client is ::" + str(data))
-    query = data.get('message', '')
     """Endpoint to handle chat messages"""
+    data = request_json()
+    query = data.get('message', '')
     try:
-        logger.info(f"Received message: {query}")
-        
+        logger.info(f"Received chat message ({len(query)} chars)")
+
+        skip_validation = should_skip_validation(data, query)
+        session = chat_session(data)
+        stored = precomputed_answer(data, query)
+        if stored is not None:
+            if wants_stream(data):
+                return sse_response(stream_chat(stored_stream(stored['content']), skip_validation, session, query))
+            result = chat_result(stored['content'], skip_validation, stored['validation'])
+            remember_turn(session, query, result, stored['content'])
+            return result
+
+        model = route_model('chat', data, query)
+        admission = request_admission('chat', data, query, request.remote_addr)
+        budget = generation_budget('chat', data, query)
+        # Earlier turns of the student's session on this topic, compacted to a fixed token budget
+        context = budgeted(budget, session_context(session))
+
+        if wants_stream(data):
+            stream = client.generate_stream(query, model=model, use_cache=use_completion_cache(data),
+                                            scope=question_scope(data), **admission, **context)
+            return sse_response(stream_chat(stream, skip_validation, session, query, budget))
+
         # Generate response using OpenAI
-        response = client.generate(query)
-        logger.info(f"Generated response: {response}")
-        
-        # Skip validation if requested or if the message is a numerical operation
-        #if request.skipValidation or any(op in request.message for op in ['+', '-', '*', '/']):
-        if data.get('skipValidation') or any(op in query for op in ['+', '-', '*', '/']):
-            return {
-                "response": response,
-                "validation": {"is_valid": True}
-            }
-        
-        # Validate the response
-        validation_result = validator.validate(response)
-        logger.info(f"Validation result: {validation_result}")
-        
-        # If validation fails, return an error message
-        if not validation_result['is_valid']:
-            error_messages = [
-                result['message'] 
-                for result in validation_result['validation_results'].values() 
-                if not result['valid']
-            ]
-            return {
-                "response": "I apologize, but I need to rephrase my response to meet our quality standards.",
-                "validation_errors": error_messages
-            }
-        
-        return {
-            "response": response,
-            "validation": validation_result
-        }
+        if skip_validation:
+            response = client.generate(query, model=model, use_cache=use_completion_cache(data),
+                                       scope=question_scope(data), **admission, **context)
+            validation_result = None
+        else:
+            response, validation_result = generate_validated(query, use_completion_cache(data),
+                                                             question_scope(data), model, admission, context)
+        budget_used(budget, response)
+        logger.info(f"Generated response ({len(response or '')} chars)")
+
+        result = chat_result(response, skip_validation, validation_result)
+        remember_turn(session, query, result, response)
+        return result
+    except CircuitOpenError as e:
+        return upstream_unavailable(e)
+    except AdmissionRejected as e:
+        return admission_rejected(e)
+    except SingleFlightTimeout as e:
+        logger.error(f"Timed out waiting for shared OpenAI call: {str(e)}")
+        return jsonify({'error': 'OpenAI API timed out'}), 504
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        return server_error(e)
 
-@app.route("/api/explain", methods=["POST", "OPTIONS"])
+@api.route("/api/quiz", methods=["POST", "OPTIONS"])
+def quiz():
+    """
+    A quiz on a topic, served from the topic's question pool: questions this
+    student has not been given yet, in random order. Only a topic with no pool
+    yet waits for the model (one batched call).
+    """
+    if request.method == "OPTIONS":
+        return jsonify({"status": "ok"}), 200
+
+    data = request_json(silent=True) or {}
+    board, class_level, subject = question_scope(data)
+    topic = data.get('topic')
+    if not (board and class_level and subject and topic):
+        return jsonify({"error": "board, classLevel, subject and topic are required"}), 400
+    try:
+        count = min(max(int(data.get('count') or QUIZ_DEFAULT_QUESTIONS), 1), QUIZ_MAX_QUESTIONS)
+    except (TypeError, ValueError):
+        return jsonify({"error": "count must be a number"}), 400
+    # Anonymous students are kept apart by client address
+    student = str(data.get('student_id') or data.get('studentId') or request.remote_addr)
+    key = (board, class_level, subject, topic)
+
+    try:
+        with stage(LOOKUP):
+            questions = quiz_pool.sample(key, student, count)
+        source = 'pool'
+        if not questions:
+            source = quiz_pool.ensure(key, count)
+            with stage(LOOKUP):
+                questions = quiz_pool.sample(key, student, count)
+    except CircuitOpenError as e:
+        return upstream_unavailable(e)
+    except AdmissionRejected as e:
+        return admission_rejected(e)
+    except Exception as e:
+        logger.error(f"Error in quiz endpoint: {str(e)}")
+        return server_error(e)
+    if not questions:
+        return jsonify({"error": "No quiz questions could be generated for this topic, please retry"}), 503
+    return {"topic": topic, "questions": questions, "source": source}
+
+
+@api.route("/api/explain", methods=["POST", "OPTIONS"])
 def explain_concept():
     if request.method == "OPTIONS":
         return jsonify({"status": "ok"}), 200
         
-    data = request.get_json()
+    data = request_json()
     try:
-        # Generate AI response
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful educational assistant. Explain concepts clearly and concisely, using age-appropriate language and examples."},
-                {"role": "user", "content": f"Topic: {data.get('topic')}\nQuestion: {data.get('question')}"}
-            ],
-            max_tokens=500,
-            temperature=0.7
-        )
-        
-        explanation = response.choices[0].message.content
+        stored = precomputed_answer(data, data.get('question') or '')
+        if stored is not None:
+            explanation = stored['content']
+        else:
+            # Generate AI response
+            model = route_model('explain', data, explain_question(data))
+            budget = generation_budget('explain', data, explain_question(data))
+            explanation = client.generate(explain_prompt(data), model=model, **budgeted(budget, EXPLAIN_GENERATION),
+                                          use_cache=use_completion_cache(data),
+                                          **request_admission('explain', data, explain_question(data),
+                                                              request.remote_addr))
+            budget_used(budget, explanation)
 
         # Update progress if student_id is provided
-        if request.student_id:
-            update_progress(request.student_id, request.topic)
+        if data.get('student_id'):
+            update_progress(data.get('student_id'), data.get('topic'))
 
         return {"explanation": explanation}
+    except CircuitOpenError as e:
+        return upstream_unavailable(e)
+    except AdmissionRejected as e:
+        return admission_rejected(e)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        return server_error(e)
 
 
-@app.route("/api/progress", methods=["POST", "OPTIONS"])
+@api.route("/api/progress", methods=["POST", "OPTIONS"])
 def update_student_progress():
     if request.method == "OPTIONS":
         return jsonify({"status": "ok"}), 200
         
-    data = request.get_json()
-    try:
-        student_id = data.get("student_id")
-        if student_id not in progress_db:
-            progress_db[student_id] = {
-                "board": data.get("board"),
-                "class_level": data.get("class_level"),
-                "subjects": {}
-            }
-
-        subject = data.get("subject")
-        if subject not in progress_db[student_id]["subjects"]:
-            progress_db[student_id]["subjects"][subject] = {
-                "topics": {},
-                "total_time_spent": 0,
-                "total_questions_asked": 0
-            }
-
-        subject_data = progress_db[student_id]["subjects"][subject]
-        topic = data.get("topic")
-        time_spent = data.get("time_spent", 0)
-        questions_asked = data.get("questions_asked", 0)
-        
-        subject_data["topics"][topic] = {
-            "understanding_level": data.get("understanding_level"),
-            "questions_asked": questions_asked,
-            "time_spent": time_spent,
-            "last_updated": datetime.now().isoformat()
-        }
+    from pydantic import ValidationError
+    from models.schemas import ProgressData
 
-        subject_data["total_time_spent"] += time_spent
-        subject_data["total_questions_asked"] += questions_asked
+    data = request_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    try:
+        # Validated like /api/progress/bulk events; the counters default to 0
+        progress = ProgressData(**{"questions_asked": 0, "time_spent": 0, **data})
+    except ValidationError as e:
+        return jsonify({"error": "Invalid progress update", "errors": validation_error_details(e)}), 400
+    try:
+        progress_store.record_topic(
+            progress.student_id,
+            progress.board,
+            progress.class_level,
+            progress.subject,
+            progress.topic,
+            progress.understanding_level,
+            questions_asked=progress.questions_asked,
+            time_spent=progress.time_spent
+        )
+        progress_analytics.upsert(progress.student_id, progress.board, progress.class_level, progress.subject,
+                                  progress.topic, progress.understanding_level, progress.questions_asked,
+                                  progress.time_spent)
 
         return {"status": "success", "message": "Progress updated successfully"}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        return server_error(e)
+
+
+def validation_error_details(e) -> List[str]:
+    """One 'field: message' line per error of a pydantic ValidationError"""
+    return [f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()]
+
+
+def parse_progress_events():
+    """Read bulk progress events from a JSON array, {"events": [...]}, or an NDJSON body.
+
+    Returns (events, parse_errors) where parse_errors maps an event index to its error.
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        events, parse_errors = [], {}
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                events.append(json.loads(line))
+            except ValueError as e:
+                parse_errors[len(events)] = f"Invalid JSON: {str(e)}"
+                events.append(None)
+        return events, parse_errors
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get("events")
+    if not isinstance(data, list):
+        return None, {}
+    return data, {}
+
+
+@api.route("/api/progress/bulk", methods=["POST", "OPTIONS"])
+def bulk_update_student_progress():
+    """
+    Bulk variant of /api/progress for study sessions and offline sync.
+    Every event is validated against ProgressData; the valid ones are applied
+    in a single batch and the response reports the outcome per event.
+    """
+    if request.method == "OPTIONS":
+        return jsonify({"status": "ok"}), 200
+
+    with stage(PARSE):
+        events, parse_errors = parse_progress_events()
+    if events is None:
+        return jsonify({"error": "Expected a JSON array of progress events, {\"events\": [...]}, or NDJSON"}), 400
+    if len(events) > PROGRESS_BULK_MAX_EVENTS:
+        return jsonify({"error": f"Too many events (maximum {PROGRESS_BULK_MAX_EVENTS} per request)"}), 413
+
+    from pydantic import ValidationError
+    from models.schemas import ProgressData
+
+    results = []
+    accepted = []
+    for index, event in enumerate(events):
+        if index in parse_errors:
+            results.append({"index": index, "status": "error", "errors": [parse_errors[index]]})
+            continue
+        try:
+            progress = ProgressData(**event) if isinstance(event, dict) else ProgressData.parse_obj(event)
+        except ValidationError as e:
+            results.append({"index": index, "status": "error", "errors": validation_error_details(e)})
+            continue
+        accepted.append(progress.dict())
+        results.append({"index": index, "status": "ok"})
 
-@app.route("/api/progress/{student_id}", methods=["GET"])
-async def get_student_progress(student_id: str):
     try:
-        if student_id not in progress_db:
-            raise HTTPException(status_code=404, detail="Student not found")
-        return progress_db[student_id]
+        progress_store.record_topics(accepted)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.error(f"Error applying bulk progress: {str(e)}")
+        return jsonify({"error": "Failed to store progress updates"}), 500
+    for event in accepted:
+        progress_analytics.upsert(event["student_id"], event["board"], event["class_level"],
+                                  event["subject"], event["topic"], event["understanding_level"],
+                                  event["questions_asked"], event["time_spent"])
+
+    return jsonify({
+        "status": "success",
+        "accepted": len(accepted),
+        "rejected": len(results) - len(accepted),
+        "results": results
+    }), 200
+
+@api.route("/api/progress/<student_id>", methods=["GET"])
+def get_student_progress(student_id: str):
+    with stage(LOOKUP):
+        progress = progress_store.get_student(student_id)
+    if progress is None:
+        return jsonify({"detail": "Student not found"}), 404
+    return jsonify(progress)
+
+
+@api.route("/api/analytics/progress", methods=["GET"])
+@jwt_required() # Class-wide data: requires a valid JWT
+def progress_analytics_summary():
+    """
+    Class-wide progress dashboard data for a board/class/subject filter:
+    understanding distribution and percentiles per topic, time spent per
+    subject, and the students lagging on each topic.
+    """
+    try:
+        lagging_threshold = int(request.args.get("lagging_threshold", 2))
+        lagging_limit = int(request.args.get("lagging_limit", 50))
+    except ValueError:
+        return jsonify({"error": "lagging_threshold and lagging_limit must be integers"}), 400
+
+    filters = {
+        "board": request.args.get("board"),
+        "class_level": request.args.get("class_level"),
+        "subject": request.args.get("subject")
+    }
+    with stage(LOOKUP):
+        summary = progress_analytics.summary(lagging_threshold=lagging_threshold,
+                                             lagging_limit=lagging_limit, **filters)
+    summary["filters"] = filters
+    return jsonify(summary)
 
 
 # --- Health Check Endpoint ---
-@app.route("/api/health", methods=["GET"])
+@api.route("/api/health", methods=["GET"])
 def health():
-    return jsonify({"status": "healthy"}), 200
+    return jsonify({
+        "status": "healthy",
+        **built_stats({
+            "completion_cache": (client, lambda: client.cache.stats()),
+            "near_duplicate_cache": (client, lambda: client.near_duplicates.stats()),
+            "model_router": (client, lambda: client.router.stats()),
+            "precomputed_answers": (answer_store, lambda: answer_store.stats()),
+            "chat_sessions": (chat_sessions, lambda: chat_sessions.stats()),
+            "quiz_pool": (quiz_pool, lambda: quiz_pool.stats()),
+            "curriculum_index": (curriculum_index, lambda: curriculum_index.stats()),
+            "generation_budgets": (generation_budgets, lambda: generation_budgets.stats()),
+            "upstream": (client, lambda: client.upstream_stats()),
+        })
+    }), 200
+
+
+def built_stats(sources: Dict[str, tuple]) -> dict:
+    """Stats of the components this worker has built, keyed by name: (component, read) pairs.
+
+    Like serving_metrics, a health check never builds a component (read must
+    not touch it before it is called), and one whose stats fail reports the
+    error instead of failing the check.
+    """
+    stats = {}
+    for name, (component, read) in sources.items():
+        if not component.built:
+            continue
+        try:
+            stats[name] = read()
+        except Exception as e:
+            logger.error(f"Error reading {name} stats: {str(e)}")
+            stats[name] = {'error': str(e)}
+    return stats
+
+
+# --- Metrics Endpoint ---
+@api.route("/api/metrics", methods=["GET"])
+def metrics():
+    """Request, stage and upstream metrics of this process in Prometheus text format"""
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return current_app.response_class(REGISTRY.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+# --- Readiness Probe ---
+@api.route("/api/ready", methods=["GET"])
+def ready():
+    """200 once this worker has built its components; 503 while warming up or if a component failed"""
+    startup.start()
+    status = startup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+
+def create_app() -> Flask:
+    """Build the Flask app. Cheap: components are built by the warm-up or on first use."""
+    app = Flask(__name__)
+    app.json_encoder = TimedJSONEncoder
+
+    # --- JWT Configuration ---
+    # You can generate a strong secret key using: import os; os.urandom(24).hex()
+    app.config["JWT_SECRET_KEY"] = "your-super-secret-jwt-key" # Change this in production!
+    #app.config["JWT_ACCESS_TOKEN_EXPIRES"] = datetime.timedelta(hours=1) # Access tokens expire in 1 hour
+    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = datetime.timedelta(minutes=60) # Access tokens expire in 1 Minute
+    JWTManager(app)
+
+    # --- CORS Configuration ---
+    # Enable CORS for all routes
+    CORS(app,
+         resources={r"/*": {
+             "origins": ["http://localhost:3000", f"http://localhost:{FRONTEND_PORT}"],
+             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+             "allow_headers": ["Content-Type", "Authorization"],
+             "supports_credentials": True
+         }})
+
+    if METRICS_ENABLED:
+        app.before_request(start_request_timer)
+        app.after_request(add_server_timing)
+        app.teardown_request(finish_request_timer)
+
+    app.register_blueprint(api)
+    return app
+
 
 if __name__ == "__main__":
     # Run the Flask app on port 5000
-    app.run(debug=True, port=BACKEND_PORT)
+    startup.start()
+    create_app().run(debug=True, port=BACKEND_PORT)
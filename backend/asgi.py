@@ -0,0 +1,408 @@
+"""ASGI entry point.
+
+Serves the LLM-bound routes (/api/chat, /api/search, /api/explain) natively on
+asyncio, so a slow upstream call no longer parks a server thread, and mounts
+the Flask app for every other route. Request and response shapes match the
+Flask routes in app.py.
+
+Run with: uvicorn asgi:app --host 0.0.0.0 --port 4000
+"""
+import logging
+
+import openai
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse as BaseJSONResponse, Response, StreamingResponse
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.middleware.wsgi import WSGIMiddleware
+
+from app import (create_app, client, validator, answer_store, chat_sessions, quiz_pool, generation_budgets,
+                 update_progress, use_completion_cache, validated_key, precomputed_answer, explain_prompt,
+                 chat_session, session_context, remember_turn, should_skip_validation, question_scope, route_model,
+                 request_admission, generation_budget, budgeted, budget_used, explain_question, chat_result,
+                 chat_done_event, feed_validator, sse_event, built_stats, SEARCH_GENERATION, EXPLAIN_GENERATION,
+                 OPENAI_API_KEY, FRONTEND_PORT)
+from config import SHUTDOWN_GRACE_SECONDS, METRICS_ENABLED
+from models.async_openai_client import AsyncOpenAIClient, AsyncCompletionStream, UpstreamBusy, UpstreamTimeout
+from models.single_flight import SingleFlightTimeout
+from models.resilience import CircuitOpenError
+from models.admission import AdmissionRejected
+from services.startup import startup
+from services.instrumentation import (PARSE, SERIALIZE, VALIDATION, PROMETHEUS_CONTENT_TYPE, REGISTRY,
+                                      finish_request, stage, start_request)
+
+logger = logging.getLogger(__name__)
+
+
+def build_async_client() -> AsyncOpenAIClient:
+    # Shares the completion caches, model router, circuit breaker and admission control with the Flask routes' client
+    return AsyncOpenAIClient(cache=client.cache, near_duplicates=client.near_duplicates,
+                             router=client.router, breaker=client.breaker, admission=client.admission)
+
+
+async_client = startup.component('async_openai_client', build_async_client)
+
+class JSONResponse(BaseJSONResponse):
+    """JSON response whose encoding counts as the request's serialize stage"""
+
+    def render(self, content) -> bytes:
+        with stage(SERIALIZE):
+            return super().render(content)
+
+
+async def finish_after(events, timer):
+    """Pass a streamed body through and record the request once its last event is sent"""
+    try:
+        async for event in events:
+            yield event
+    finally:
+        timer.finish()
+
+
+class InstrumentedRoute(APIRoute):
+    """Times every request to a FastAPI route (the mounted Flask app times its own)"""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        endpoint = self.path
+
+        async def instrumented(request: Request):
+            timer = start_request(endpoint, request.method)
+            try:
+                response = await handler(request)
+            except StarletteHTTPException as e:
+                finish_request(e.status_code)
+                raise
+            except BaseException:
+                finish_request(500)
+                raise
+            timer.status = response.status_code
+            response.headers['Server-Timing'] = timer.server_timing()
+            if isinstance(response, StreamingResponse):
+                response.body_iterator = finish_after(response.body_iterator, timer)
+            else:
+                finish_request()
+            return response
+
+        return instrumented
+
+
+app = FastAPI(title="Educational Assistant", default_response_class=JSONResponse)
+if METRICS_ENABLED:
+    app.router.route_class = InstrumentedRoute
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["http://localhost:3000", f"http://localhost:{FRONTEND_PORT}"],
+    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    allow_headers=["Content-Type", "Authorization"],
+    allow_credentials=True,
+)
+
+
+@app.on_event("startup")
+async def warm_up():
+    # Build this worker's components in the background; /api/ready reports when they are done
+    startup.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Let in-flight upstream calls finish before closing the connection pool
+    if async_client.built:
+        await async_client.aclose(grace_seconds=SHUTDOWN_GRACE_SECONDS)
+
+
+async def read_json(request: Request) -> dict:
+    try:
+        with stage(PARSE):
+            data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def wants_stream(request: Request, data: dict) -> bool:
+    return bool(data.get('stream')) or request.headers.get('accept', '').startswith('text/event-stream')
+
+
+def upstream_unavailable(e: CircuitOpenError) -> JSONResponse:
+    return JSONResponse({'error': 'AI service temporarily unavailable, please retry shortly'}, status_code=503,
+                        headers={'Retry-After': str(int(e.retry_after + 0.999))})
+
+
+def admission_rejected(e: AdmissionRejected) -> JSONResponse:
+    return JSONResponse({'error': str(e)}, status_code=429,
+                        headers={'Retry-After': str(int(e.retry_after + 0.999))})
+
+
+def client_address(request: Request):
+    return request.client.host if request.client else None
+
+
+def sse_response(events) -> StreamingResponse:
+    return StreamingResponse(events, media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def relay_tokens(stream, sink: list, checker=None):
+    """Yield token events; sink gets False appended if the upstream failed mid-stream"""
+    try:
+        async for delta in stream:
+            if checker is not None and feed_validator(checker, delta):
+                # Stop paying for an answer that can no longer pass validation
+                logger.info("Validation failed mid-stream, cancelled upstream generation")
+                break
+            yield sse_event('token', {'text': delta})
+    except Exception as e:
+        logger.error(f"Error while streaming OpenAI response: {str(e)}")
+        sink.append(False)
+        yield sse_event('error', {'error': str(e)})
+    finally:
+        await stream.close()
+
+
+async def stream_search(stream, budget=None):
+    failed = []
+    async for event in relay_tokens(stream, failed):
+        yield event
+    if not failed:
+        budget_used(budget, stream.text)
+        yield sse_event('done', {'usage': stream.usage, 'cached': stream.cached})
+
+
+async def stream_chat(stream, skip_validation: bool, session=None, question: str = '', budget=None):
+    checker = None if skip_validation else validator.incremental()
+    failed = []
+    async for event in relay_tokens(stream, failed, checker):
+        yield event
+    if not failed:
+        budget_used(budget, stream.text)
+        done = chat_done_event(stream, skip_validation, checker)
+        await run_in_threadpool(remember_turn, session, question, done, stream.text)
+        yield sse_event('done', done)
+
+
+async def generate_validated(query: str, use_cache: bool, scope=None, model=None, admission=None, context=None):
+    """Async counterpart of app.generate_validated: returns (response, validation_result)"""
+    async def generate():
+        stream = await async_client.generate_stream(query, model=model, use_cache=use_cache, scope=scope,
+                                                    **(admission or {}), **(context or {}))
+        checker = validator.incremental()
+        try:
+            async for delta in stream:
+                if feed_validator(checker, delta):
+                    logger.info("Validation failed mid-generation, cancelled upstream generation")
+                    break
+        finally:
+            await stream.close()
+        with stage(VALIDATION):
+            return stream.text, checker.finish()
+
+    key = validated_key(query, use_cache, model, context)
+    if key is None:
+        return await generate()
+    return await async_client.coalesce(key, generate)
+
+
+@app.post("/api/search")
+async def search(request: Request):
+    data = await read_json(request)
+    if not data:
+        return JSONResponse({'error': 'No data provided'}, status_code=400)
+    query = data.get('message', '')
+    if not query:
+        return JSONResponse({'error': 'No message provided'}, status_code=400)
+
+    logger.info(f"Received search query: {query}")
+    # Store lookups and session/progress writes touch SQLite: keep them off the event loop
+    stored = await run_in_threadpool(precomputed_answer, data, query)
+    if stored is not None:
+        if wants_stream(request, data):
+            return sse_response(stream_search(AsyncCompletionStream(text=stored['content'])))
+        return {'results': [stored['content']]}
+
+    if not OPENAI_API_KEY:
+        logger.error("OpenAI API key not configured")
+        return JSONResponse({'error': 'OpenAI API key not configured'}, status_code=500)
+
+    try:
+        model = route_model('search', data, query)
+        admission = request_admission('search', data, query, client_address(request))
+        budget = generation_budget('search', data, query)
+        if wants_stream(request, data):
+            stream = await async_client.generate_stream(query, model=model, **budgeted(budget, SEARCH_GENERATION),
+                                                        use_cache=use_completion_cache(data),
+                                                        scope=question_scope(data), **admission)
+            return sse_response(stream_search(stream, budget))
+
+        answer = await async_client.generate(query, model=model, **budgeted(budget, SEARCH_GENERATION),
+                                             use_cache=use_completion_cache(data),
+                                             scope=question_scope(data), **admission)
+        budget_used(budget, answer)
+        logger.info("Successfully generated response")
+        return {'results': [answer]}
+    except openai.AuthenticationError as e:
+        logger.error(f"OpenAI Authentication error: {str(e)}")
+        return JSONResponse({'error': 'Invalid OpenAI API key'}, status_code=401)
+    except openai.APITimeoutError as e:
+        logger.error(f"OpenAI API timed out: {str(e)}")
+        return JSONResponse({'error': 'OpenAI API timed out'}, status_code=504)
+    except CircuitOpenError as e:
+        logger.error(f"OpenAI API circuit open: {str(e)}")
+        return upstream_unavailable(e)
+    except AdmissionRejected as e:
+        logger.warning(f"Search not admitted: {str(e)}")
+        return admission_rejected(e)
+    except openai.APIError as e:
+        logger.error(f"OpenAI API error: {str(e)}")
+        return JSONResponse({'error': 'OpenAI API error'}, status_code=503)
+    except UpstreamBusy as e:
+        logger.error(f"Upstream saturated: {str(e)}")
+        return JSONResponse({'error': 'Server busy, please retry'}, status_code=503)
+    except (UpstreamTimeout, SingleFlightTimeout) as e:
+        logger.error(f"OpenAI call timed out: {str(e)}")
+        return JSONResponse({'error': 'OpenAI API timed out'}, status_code=504)
+    except Exception as e:
+        logger.error(f"Unexpected error in search: {str(e)}")
+        return JSONResponse({'error': f'Unexpected error: {str(e)}'}, status_code=500)
+
+
+@app.post("/api/chat")
+async def chat(request: Request):
+    """Endpoint to handle chat messages"""
+    data = await read_json(request)
+    query = data.get('message', '')
+    try:
+        logger.info(f"Received chat message ({len(query)} chars)")
+        skip_validation = should_skip_validation(data, query)
+        session = await run_in_threadpool(chat_session, data)
+        stored = await run_in_threadpool(precomputed_answer, data, query)
+        if stored is not None:
+            if wants_stream(request, data):
+                return sse_response(stream_chat(AsyncCompletionStream(text=stored['content']), skip_validation,
+                                                session, query))
+            result = chat_result(stored['content'], skip_validation, stored['validation'])
+            await run_in_threadpool(remember_turn, session, query, result, stored['content'])
+            return result
+
+        model = route_model('chat', data, query)
+        admission = request_admission('chat', data, query, client_address(request))
+        budget = generation_budget('chat', data, query)
+        context = budgeted(budget, session_context(session))
+
+        if wants_stream(request, data):
+            stream = await async_client.generate_stream(query, model=model,
+                                                        use_cache=use_completion_cache(data),
+                                                        scope=question_scope(data), **admission, **context)
+            return sse_response(stream_chat(stream, skip_validation, session, query, budget))
+
+        if skip_validation:
+            response = await async_client.generate(query, model=model, use_cache=use_completion_cache(data),
+                                                   scope=question_scope(data), **admission, **context)
+            validation_result = None
+        else:
+            response, validation_result = await generate_validated(query, use_completion_cache(data),
+                                                                   question_scope(data), model, admission, context)
+        budget_used(budget, response)
+        result = chat_result(response, skip_validation, validation_result)
+        await run_in_threadpool(remember_turn, session, query, result, response)
+        return result
+    except CircuitOpenError as e:
+        return upstream_unavailable(e)
+    except AdmissionRejected as e:
+        return admission_rejected(e)
+    except UpstreamBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except (UpstreamTimeout, SingleFlightTimeout) as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in chat endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/explain")
+async def explain_concept(request: Request):
+    data = await read_json(request)
+    try:
+        stored = await run_in_threadpool(precomputed_answer, data, data.get('question') or '')
+        if stored is not None:
+            explanation = stored['content']
+        else:
+            model = route_model('explain', data, explain_question(data))
+            budget = generation_budget('explain', data, explain_question(data))
+            prompt = await run_in_threadpool(explain_prompt, data)
+            explanation = await async_client.generate(prompt, model=model,
+                                                      **budgeted(budget, EXPLAIN_GENERATION),
+                                                      use_cache=use_completion_cache(data),
+                                                      **request_admission('explain', data, explain_question(data),
+                                                                          client_address(request)))
+            budget_used(budget, explanation)
+
+        # Update progress if student_id is provided
+        if data.get('student_id'):
+            await run_in_threadpool(update_progress, data.get('student_id'), data.get('topic'))
+
+        return {"explanation": explanation}
+    except CircuitOpenError as e:
+        return upstream_unavailable(e)
+    except AdmissionRejected as e:
+        return admission_rejected(e)
+    except UpstreamBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except (UpstreamTimeout, SingleFlightTimeout) as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/health")
+async def health():
+    # Some stats are SQLite queries
+    stats = await run_in_threadpool(built_stats, {
+        "completion_cache": (async_client, lambda: async_client.cache.stats()),
+        "near_duplicate_cache": (async_client, lambda: async_client.near_duplicates.stats()),
+        "model_router": (async_client, lambda: async_client.router.stats()),
+        "precomputed_answers": (answer_store, lambda: answer_store.stats()),
+        "chat_sessions": (chat_sessions, lambda: chat_sessions.stats()),
+        "quiz_pool": (quiz_pool, lambda: quiz_pool.stats()),
+        "generation_budgets": (generation_budgets, lambda: generation_budgets.stats()),
+        "upstream": (async_client, lambda: {
+            "active": async_client.active,
+            "waiting": async_client.waiting,
+            "max_concurrency": async_client.max_concurrency,
+            **async_client.upstream_stats(),
+        }),
+    })
+    return {"status": "healthy", **stats}
+
+
+def async_serving_metrics():
+    """Upstream concurrency of the ASGI client; the shared caches and queues are reported by app.py"""
+    # Like serving_metrics, a scrape never builds the client
+    if not async_client.built:
+        return
+    yield ('edu_async_upstream_in_flight', 'gauge', 'Upstream calls in flight (ASGI client)',
+           [({}, async_client.active)])
+    yield ('edu_async_upstream_waiting', 'gauge', 'Calls waiting for an upstream slot (ASGI client)',
+           [({}, async_client.waiting)])
+    yield ('edu_async_upstream_retries_total', 'counter', 'Upstream call retries (ASGI client)',
+           [({}, async_client.retry.retries)])
+
+
+REGISTRY.collector(async_serving_metrics)
+
+
+@app.get("/api/metrics")
+async def metrics():
+    """Request, stage and upstream metrics of this process in Prometheus text format"""
+    if not METRICS_ENABLED:
+        return JSONResponse({'error': 'Metrics are disabled'}, status_code=404)
+    # The collectors read the SQLite-backed stores
+    return Response(await run_in_threadpool(REGISTRY.render), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+# Everything else (login, subjects, progress, ...) is served by the Flask app
+app.mount("/", WSGIMiddleware(create_app()))
@@ -0,0 +1,284 @@
+"""Load generator for the backend API.
+
+Simulated students log in, load their subjects and then ask questions,
+take quizzes and report progress, picking endpoints by a weighted mix.
+Every request is written as one JSON line (endpoint, status, latency,
+time to first byte for streams) for benchmarks.report.
+
+Closed loop (a fixed number of students with think time):
+    python -m benchmarks.loadgen --base-url http://127.0.0.1:4000 --users 50 --duration 60
+Open loop (Poisson arrivals at a fixed rate, latency measured from the
+scheduled start so a slow server cannot hide its queueing):
+    python -m benchmarks.loadgen --rate 40 --duration 60 --mix exam-week
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+
+ENDPOINTS = ('login', 'subjects', 'search', 'chat', 'quiz', 'progress')
+
+# Relative weights of each action per scenario
+MIXES = {
+    # A normal school day: mostly browsing topics and asking the occasional question
+    'default': {'login': 5, 'subjects': 20, 'search': 25, 'chat': 30, 'quiz': 5, 'progress': 15},
+    # Revision before exams: chat- and quiz-heavy
+    'exam-week': {'login': 2, 'subjects': 8, 'search': 20, 'chat': 45, 'quiz': 15, 'progress': 10},
+    # Start of a lesson: a class logs in and opens subjects together
+    'login-storm': {'login': 40, 'subjects': 40, 'search': 10, 'chat': 5, 'quiz': 0, 'progress': 5},
+    # No LLM calls: measures the backend itself
+    'no-llm': {'login': 20, 'subjects': 50, 'search': 0, 'chat': 0, 'quiz': 0, 'progress': 30},
+}
+
+QUESTION_TEMPLATES = [
+    "Explain the concept of {topic}",
+    "What is {topic}?",
+    "Can you give me an example of {topic} in {subject}?",
+    "Why is {topic} important?",
+    "How does {topic} work? Explain step by step.",
+]
+
+QUIZ_QUESTIONS = 5
+
+
+def load_students(path: str) -> List[Dict[str, Any]]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return [s for s in json.load(f) if s.get('USERNAME') and s.get('PASSWORD')]
+
+
+def load_topics(path: str) -> Dict[str, List[Tuple[str, str]]]:
+    """class name -> [(subject, topic)] from a {board}-SUBJECTS.json file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {item.get('class'): [(subject, topic) for subject, topics in item.get('subjects', {}).items()
+                                for topic in topics]
+            for item in data}
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """A named mix, or explicit weights like search=30,chat=50,progress=20"""
+    if value in MIXES:
+        return dict(MIXES[value])
+    mix = {endpoint: 0.0 for endpoint in ENDPOINTS}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in mix:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name!r}; expected one of {', '.join(ENDPOINTS)}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+class Student:
+    """One simulated student: credentials plus what the login told us"""
+
+    def __init__(self, record: Dict[str, Any], student_id: str):
+        self.username = record['USERNAME']
+        self.password = str(record['PASSWORD'])
+        self.student_id = student_id
+        self.grade = str(record.get('GRADE', '5'))
+        self.board = 'CBSE'
+        self.token: Optional[str] = None
+
+    @property
+    def class_level(self) -> str:
+        return f"Class {self.grade}"
+
+
+class LoadGenerator:
+    def __init__(self, base_url: str, students: List[Dict[str, Any]], topics: Dict[str, List[Tuple[str, str]]],
+                 mix: Dict[str, float], out, virtual_students: int = 500, stream_ratio: float = 0.0,
+                 unique_ratio: float = 0.2, timeout: float = 120.0, seed: Optional[int] = None):
+        self.base_url = base_url.rstrip('/')
+        # Few real accounts exist, so many students share their credentials but keep distinct ids
+        # (progress rows and per-student rate limits are keyed by id)
+        self.students = [Student(students[i % len(students)], f"bench-{i:05d}") for i in range(virtual_students)]
+        self.topics = topics
+        self.endpoints = [endpoint for endpoint in ENDPOINTS if mix.get(endpoint, 0) > 0]
+        self.weights = [mix[endpoint] for endpoint in self.endpoints]
+        self.out = out
+        self.stream_ratio = stream_ratio
+        self.unique_ratio = unique_ratio
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self.started = 0.0
+        self.in_flight = 0
+        self.dropped = 0
+
+    def record(self, endpoint: str, scheduled: float, status: int, ttfb: Optional[float] = None,
+               error: Optional[str] = None) -> None:
+        now = time.monotonic()
+        line = {'endpoint': endpoint, 'start': round(scheduled - self.started, 4), 'status': status,
+                'latency_ms': round((now - scheduled) * 1000, 2)}
+        if ttfb is not None:
+            line['ttfb_ms'] = round((ttfb - scheduled) * 1000, 2)
+        if error:
+            line['error'] = error
+        self.out.write(json.dumps(line) + '\n')
+
+    def _topic(self, student: Student) -> Tuple[str, str]:
+        choices = self.topics.get(student.class_level) or next(iter(self.topics.values()))
+        return self.random.choice(choices)
+
+    def _question(self, student: Student, template: str) -> Dict[str, Any]:
+        subject, topic = self._topic(student)
+        message = template.format(topic=topic, subject=subject, class_level=student.class_level)
+        if self.random.random() < self.unique_ratio:
+            # Defeats the answer caches, like a question nobody asked before
+            message += f" (ref {uuid.uuid4().hex[:8]})"
+        return {'message': message, 'studentId': student.student_id, 'board': student.board,
+                'classLevel': student.class_level, 'subject': subject}
+
+    async def _send(self, http: httpx.AsyncClient, endpoint: str, student: Student, scheduled: float) -> None:
+        ttfb = None
+        try:
+            if endpoint == 'login' or (student.token is None and endpoint == 'subjects'):
+                response = await http.post('/api/login', json={'username': student.username,
+                                                               'password': student.password})
+                if response.status_code == 200:
+                    body = response.json()
+                    student.token = body.get('access_token')
+                    student.board = body.get('boardName') or student.board
+                    student.grade = str(body.get('studentGrade') or student.grade)
+                if endpoint == 'login':
+                    return self.record(endpoint, scheduled, response.status_code)
+                scheduled = time.monotonic()
+            if endpoint == 'subjects':
+                response = await http.get('/api/subjects', params={'board': student.board, 'class': student.grade},
+                                          headers={'Authorization': f'Bearer {student.token}'})
+            elif endpoint == 'progress':
+                subject, topic = self._topic(student)
+                response = await http.post('/api/progress', json={
+                    'student_id': student.student_id, 'board': student.board, 'class_level': student.class_level,
+                    'subject': subject, 'topic': topic, 'understanding_level': self.random.randint(1, 5),
+                    'questions_asked': self.random.randint(0, 5), 'time_spent': self.random.randint(1, 30)})
+            elif endpoint == 'quiz':
+                # Served from the shared question pool; an empty pool is filled by one model call
+                subject, topic = self._topic(student)
+                response = await http.post('/api/quiz', json={
+                    'topic': topic, 'studentId': student.student_id, 'board': student.board,
+                    'classLevel': student.class_level, 'subject': subject, 'count': QUIZ_QUESTIONS})
+            else:
+                path = '/api/search' if endpoint == 'search' else '/api/chat'
+                payload = self._question(student, self.random.choice(QUESTION_TEMPLATES))
+                if self.random.random() < self.stream_ratio:
+                    payload['stream'] = True
+                    async with http.stream('POST', path, json=payload) as response:
+                        async for _ in response.aiter_bytes():
+                            if ttfb is None:
+                                ttfb = time.monotonic()
+                    return self.record(endpoint, scheduled, response.status_code, ttfb)
+                response = await http.post(path, json=payload)
+            self.record(endpoint, scheduled, response.status_code)
+        except httpx.HTTPError as e:
+            self.record(endpoint, scheduled, 0, ttfb, f"{type(e).__name__}: {str(e)}"[:200])
+
+    def _pick(self) -> str:
+        return self.random.choices(self.endpoints, self.weights)[0]
+
+    def _client(self, connections: int) -> httpx.AsyncClient:
+        return httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout,
+                                 limits=httpx.Limits(max_connections=connections,
+                                                     max_keepalive_connections=connections))
+
+    async def closed_loop(self, users: int, duration: float, think_ms: float) -> None:
+        """`users` students each send one request at a time, pausing think_ms (exponential) in between"""
+        deadline = time.monotonic() + duration
+
+        async def user(student: Student):
+            while time.monotonic() < deadline:
+                await self._send(http, self._pick(), student, time.monotonic())
+                if think_ms:
+                    await asyncio.sleep(self.random.expovariate(1000 / think_ms))
+
+        async with self._client(users) as http:
+            self.started = time.monotonic()
+            pool = [self.students[i % len(self.students)] for i in range(users)]
+            await asyncio.gather(*(user(student) for student in pool))
+
+    async def open_loop(self, rate: float, duration: float, max_in_flight: int) -> None:
+        """Poisson arrivals at `rate` per second regardless of how fast the server answers"""
+        tasks = set()
+
+        async def run(endpoint, student, scheduled):
+            try:
+                await self._send(http, endpoint, student, scheduled)
+            finally:
+                self.in_flight -= 1
+
+        async with self._client(max_in_flight) as http:
+            self.started = time.monotonic()
+            next_at = self.started
+            while next_at < self.started + duration:
+                delay = next_at - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                endpoint = self._pick()
+                if self.in_flight >= max_in_flight:
+                    # The client is saturated; count it rather than silently slowing the arrival rate
+                    self.dropped += 1
+                    self.record(endpoint, next_at, 0, error='dropped: client in-flight limit reached')
+                else:
+                    self.in_flight += 1
+                    task = asyncio.ensure_future(run(endpoint, self.random.choice(self.students), next_at))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                next_at += self.random.expovariate(rate)
+            if tasks:
+                await asyncio.gather(*tasks)
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--base-url', default='http://127.0.0.1:4000')
+    parser.add_argument('--mix', type=parse_mix, default='default',
+                        help=f"one of {', '.join(MIXES)} or weights like search=30,chat=50,progress=20")
+    parser.add_argument('--duration', type=float, default=60, help="seconds")
+    parser.add_argument('--users', type=int, default=20, help="closed loop: concurrent students")
+    parser.add_argument('--think-ms', type=float, default=1000, help="closed loop: mean pause between requests")
+    parser.add_argument('--rate', type=float, help="open loop: requests per second (overrides --users)")
+    parser.add_argument('--max-in-flight', type=int, default=1000, help="open loop: client concurrency cap")
+    parser.add_argument('--virtual-students', type=int, default=500,
+                        help="distinct student ids to spread requests over")
+    parser.add_argument('--stream-ratio', type=float, default=0.3, help="fraction of search/chat sent as streams")
+    parser.add_argument('--unique-ratio', type=float, default=0.2,
+                        help="fraction of questions made unique so they miss the answer caches")
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--students', default=os.path.join(DATA_DIR, 'students.json'))
+    parser.add_argument('--subjects', default=os.path.join(DATA_DIR, 'CBSE-SUBJECTS.json'))
+    parser.add_argument('--seed', type=int)
+
+
+async def run(args: argparse.Namespace, out) -> LoadGenerator:
+    generator = LoadGenerator(args.base_url, load_students(args.students), load_topics(args.subjects), args.mix,
+                              out, virtual_students=args.virtual_students, stream_ratio=args.stream_ratio,
+                              unique_ratio=args.unique_ratio, timeout=args.timeout, seed=args.seed)
+    if args.rate:
+        await generator.open_loop(args.rate, args.duration, args.max_in_flight)
+    else:
+        await generator.closed_loop(args.users, args.duration, args.think_ms)
+    return generator
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Drive the backend API with a realistic request mix")
+    add_arguments(parser)
+    parser.add_argument('--out', default='bench-results.jsonl', help="JSON lines file of per-request results")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    with open(args.out, 'w', encoding='utf-8') as out:
+        generator = asyncio.run(run(args, out))
+    logger.info(f"Results written to {args.out} ({generator.dropped} arrivals dropped)")
+
+
+if __name__ == '__main__':
+    main()
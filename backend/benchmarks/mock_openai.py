@@ -0,0 +1,311 @@
+"""Local OpenAI-compatible server for benchmarks.
+
+Answers POST /v1/chat/completions, plain and streamed (with the final usage
+chunk), with a lognormal latency distribution, optional upstream rate
+limits and injected errors, so the backend can be load-tested on one box
+with no network. Quiz-generation prompts (the [correct: x] format) get a
+parseable quiz so the backend's question pools fill. GET /stats returns
+what was served.
+
+Run with: python -m benchmarks.mock_openai --port 8089 --latency-median-ms 800
+and start the backend with OPENAI_BASE_URL=http://127.0.0.1:8089/v1
+"""
+import argparse
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+WORDS = """
+the a plant uses sunlight water and air to make its own food this process is called photosynthesis
+leaves have green pigment chlorophyll which captures light energy numbers can be added subtracted
+multiplied or divided to solve everyday problems for example sharing sweets equally among friends
+a force is a push or pull that changes the motion of an object the earth goes around the sun once
+every year while the moon goes around the earth living things grow breathe eat and reproduce
+""".split()
+
+
+QUIZ_COUNT = re.compile(r'Include (\d+) questions')
+
+
+class MockSettings:
+    """Latency and failure behaviour of the mock upstream"""
+
+    def __init__(self, latency_median_ms: float = 800, latency_sigma: float = 0.5,
+                 first_token_fraction: float = 0.25, min_tokens: int = 60, max_tokens: int = 250,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: float = 1.0,
+                 hang_rate: float = 0.0, hang_seconds: float = 120, tokens_per_minute: float = 0,
+                 seed: Optional[int] = None):
+        self.latency_median_ms = latency_median_ms
+        self.latency_sigma = latency_sigma
+        self.first_token_fraction = first_token_fraction
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.tokens_per_minute = tokens_per_minute
+        self.random = random.Random(seed)
+
+
+class MockUpstream:
+    """Shared state: the settings, an optional tokens-per-minute limit and counters"""
+
+    def __init__(self, settings: MockSettings):
+        self.settings = settings
+        self._lock = threading.Lock()
+        self._budget = settings.tokens_per_minute
+        self._budget_updated = time.monotonic()
+        self.counts: Counter = Counter()
+        self.tokens = 0
+
+    def _draw(self) -> float:
+        with self._lock:
+            return self.settings.random.random()
+
+    def latency_seconds(self) -> float:
+        s = self.settings
+        with self._lock:
+            return s.random.lognormvariate(math.log(s.latency_median_ms / 1000), s.latency_sigma)
+
+    def completion_tokens(self, max_tokens: Optional[int]) -> int:
+        s = self.settings
+        with self._lock:
+            tokens = s.random.randint(s.min_tokens, s.max_tokens)
+        return min(tokens, max_tokens) if max_tokens else tokens
+
+    def text(self, tokens: int) -> str:
+        """About `tokens` tokens of plausible sentences (validation needs at least one full stop)"""
+        with self._lock:
+            words = [self.settings.random.choice(WORDS) for _ in range(max(int(tokens * 0.75), 3))]
+        sentences = [' '.join(words[i:i + 12]).capitalize() + '.' for i in range(0, len(words), 12)]
+        return ' '.join(sentences)
+
+    def quiz(self, prompt: str) -> str:
+        """A numbered quiz in the [correct: x] format, with as many questions as the prompt asks for"""
+        match = QUIZ_COUNT.search(prompt)
+        count = int(match.group(1)) if match else 5
+        lines = []
+        with self._lock:
+            rng = self.settings.random
+            for n in range(1, count + 1):
+                stem = ' '.join(rng.choice(WORDS) for _ in range(8))
+                lines.append(f"{n}. Which statement about {stem} is correct?")
+                lines.extend(f"{letter}) {' '.join(rng.choice(WORDS) for _ in range(4)).capitalize()}."
+                             for letter in 'abcd')
+                lines.append(f"[correct: {rng.choice('abcd')}]")
+        return '\n'.join(lines)
+
+    def admit(self, tokens: int) -> bool:
+        """Apply the emulated tokens-per-minute limit; False means answer 429"""
+        limit = self.settings.tokens_per_minute
+        if not limit:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._budget = min(limit, self._budget + (now - self._budget_updated) * limit / 60)
+            self._budget_updated = now
+            if self._budget < tokens:
+                return False
+            self._budget -= tokens
+            return True
+
+    def count(self, outcome: str, tokens: int = 0) -> None:
+        with self._lock:
+            self.counts[outcome] += 1
+            self.tokens += tokens
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'responses': dict(self.counts), 'tokens': self.tokens}
+
+
+def prompt_tokens(messages) -> int:
+    return sum(len(str(m.get('content') or '')) for m in messages) // 4 + 1
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    upstream: MockUpstream = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str, kind: str, headers=None):
+        self._send_json(status, {'error': {'message': message, 'type': kind, 'code': None}}, headers)
+
+    def do_GET(self):
+        if self.path.rstrip('/') in ('/stats', '/v1/stats'):
+            self._send_json(200, self.upstream.stats())
+        elif self.path.rstrip('/') in ('/health', '/v1/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'mock', 'object': 'model'}]})
+        else:
+            self._error(404, 'Not found', 'invalid_request_error')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._error(400, 'Invalid JSON body', 'invalid_request_error')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            return self._error(404, 'Not found', 'invalid_request_error')
+
+        upstream = self.upstream
+        settings = upstream.settings
+        draw = upstream._draw()
+        if draw < settings.hang_rate:
+            upstream.count('hang')
+            time.sleep(settings.hang_seconds)
+            return self._error(504, 'Mock upstream hung', 'timeout')
+        draw -= settings.hang_rate
+        if draw < settings.error_rate:
+            upstream.count('error')
+            time.sleep(upstream.latency_seconds() * settings.first_token_fraction)
+            return self._error(500, 'Mock upstream error', 'server_error')
+        draw -= settings.error_rate
+        prompt = prompt_tokens(request.get('messages', []))
+        completion = upstream.completion_tokens(request.get('max_tokens'))
+        if draw < settings.rate_limit_rate or not upstream.admit(prompt + completion):
+            upstream.count('rate_limited')
+            return self._error(429, 'Rate limit reached (mock)', 'rate_limit_error',
+                               {'Retry-After': str(settings.retry_after)})
+
+        latency = upstream.latency_seconds()
+        prompt_text = str((request.get('messages') or [{}])[-1].get('content') or '')
+        text = upstream.quiz(prompt_text) if '[correct: x]' in prompt_text else upstream.text(completion)
+        usage = {'prompt_tokens': prompt, 'completion_tokens': completion,
+                 'total_tokens': prompt + completion}
+        model = request.get('model', 'mock')
+        if request.get('stream'):
+            include_usage = (request.get('stream_options') or {}).get('include_usage')
+            try:
+                self._stream(model, text, latency, usage if include_usage else None)
+            except (BrokenPipeError, ConnectionResetError):
+                # The backend cancelled the generation (e.g. validation failed mid-stream)
+                upstream.count('cancelled')
+                self.close_connection = True
+                return
+        else:
+            time.sleep(latency)
+            self._send_json(200, {
+                'id': f'chatcmpl-mock-{time.monotonic_ns()}',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text},
+                             'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+        upstream.count('ok', usage['total_tokens'])
+
+    def _stream(self, model: str, text: str, latency: float, usage: Optional[Dict[str, int]]):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        ident = f'chatcmpl-mock-{time.monotonic_ns()}'
+        created = int(time.time())
+
+        def send(choices, extra=None):
+            chunk = {'id': ident, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                     'choices': choices}
+            chunk.update(extra or {})
+            self._chunk(f"data: {json.dumps(chunk)}\n\n")
+
+        pieces = [word + ' ' for word in text.split(' ')]
+        first_token = latency * self.upstream.settings.first_token_fraction
+        interval = (latency - first_token) / max(len(pieces), 1)
+        time.sleep(first_token)
+        for piece in pieces:
+            send([{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}])
+            time.sleep(interval)
+        send([{'index': 0, 'delta': {}, 'finish_reason': 'stop'}])
+        if usage:
+            send([], {'usage': usage})
+        self._chunk("data: [DONE]\n\n")
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _chunk(self, data: str):
+        encoded = data.encode('utf-8')
+        self.wfile.write(f"{len(encoded):x}\r\n".encode('ascii') + encoded + b'\r\n')
+        self.wfile.flush()
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def serve(settings: MockSettings, host: str = '127.0.0.1', port: int = 8089) -> MockServer:
+    """Start the mock upstream on a background thread; call shutdown() on the result to stop it"""
+    handler = type('Handler', (MockHandler,), {'upstream': MockUpstream(settings)})
+    server = MockServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name='mock-openai', daemon=True).start()
+    logger.info(f"Mock OpenAI server listening on http://{host}:{server.server_address[1]}/v1")
+    return server
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--latency-median-ms', type=float, default=800)
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help="lognormal sigma of the latency")
+    parser.add_argument('--first-token-fraction', type=float, default=0.25,
+                        help="share of a streamed call's latency spent before the first token")
+    parser.add_argument('--min-tokens', type=int, default=60)
+    parser.add_argument('--max-tokens', type=int, default=250)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction answered with a 500")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="fraction answered with a 429")
+    parser.add_argument('--retry-after', type=float, default=1.0)
+    parser.add_argument('--hang-rate', type=float, default=0.0, help="fraction that hang for --hang-seconds")
+    parser.add_argument('--hang-seconds', type=float, default=120)
+    parser.add_argument('--tokens-per-minute', type=float, default=0,
+                        help="emulate an upstream token limit (0 = unlimited)")
+    parser.add_argument('--mock-seed', type=int, help="seed for the mock's latency and error draws")
+
+
+def settings_from_args(args: argparse.Namespace) -> MockSettings:
+    return MockSettings(latency_median_ms=args.latency_median_ms, latency_sigma=args.latency_sigma,
+                        first_token_fraction=args.first_token_fraction, min_tokens=args.min_tokens,
+                        max_tokens=args.max_tokens, error_rate=args.error_rate,
+                        rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+                        hang_rate=args.hang_rate, hang_seconds=args.hang_seconds,
+                        tokens_per_minute=args.tokens_per_minute, seed=args.mock_seed)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible mock server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    server = serve(settings_from_args(args), args.host, args.port)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Summarises a benchmarks.loadgen results file per endpoint.
+
+Prints count, throughput, error and rejection rates and p50/p95/p99/max
+latency (plus time to first byte for streams). With --baseline, compares
+against an earlier --json summary and exits non-zero on a regression.
+
+Run with: python -m benchmarks.report bench-results.jsonl [--json summary.json] [--baseline old.json]
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+# 429 (admission control) and 503 (circuit open, busy) are load shedding, not failures
+SHED_STATUSES = frozenset([429, 503])
+
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def read_results(path: str) -> List[Dict[str, Any]]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _summarise(results: List[Dict[str, Any]], wall_seconds: float) -> Dict[str, Any]:
+    latencies = sorted(r['latency_ms'] for r in results)
+    ttfbs = sorted(r['ttfb_ms'] for r in results if 'ttfb_ms' in r)
+    ok = sum(1 for r in results if 200 <= r['status'] < 400)
+    shed = sum(1 for r in results if r['status'] in SHED_STATUSES)
+    errors = len(results) - ok - shed
+    summary = {
+        'count': len(results),
+        'throughput_rps': round(len(results) / wall_seconds, 2) if wall_seconds else None,
+        'error_rate': round(errors / len(results), 4) if results else 0.0,
+        'shed_rate': round(shed / len(results), 4) if results else 0.0,
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'max_ms': latencies[-1] if latencies else None,
+    }
+    if ttfbs:
+        summary['ttfb_p50_ms'] = percentile(ttfbs, 0.50)
+        summary['ttfb_p95_ms'] = percentile(ttfbs, 0.95)
+    statuses = defaultdict(int)
+    for r in results:
+        statuses[str(r['status'])] += 1
+    summary['statuses'] = dict(sorted(statuses.items()))
+    return summary
+
+
+def summarise(results: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Per-endpoint and overall summaries; throughput is over the whole run's wall time"""
+    results = list(results)
+    if not results:
+        return {'wall_seconds': 0, 'endpoints': {}, 'all': _summarise([], 0)}
+    wall = max(r['start'] + r['latency_ms'] / 1000 for r in results) - min(r['start'] for r in results)
+    by_endpoint = defaultdict(list)
+    for r in results:
+        by_endpoint[r['endpoint']].append(r)
+    return {
+        'wall_seconds': round(wall, 2),
+        'endpoints': {endpoint: _summarise(rows, wall) for endpoint, rows in sorted(by_endpoint.items())},
+        'all': _summarise(results, wall),
+    }
+
+
+def format_table(summary: Dict[str, Any]) -> str:
+    columns = [('count', 'count'), ('req/s', 'throughput_rps'), ('err%', 'error_rate'), ('shed%', 'shed_rate'),
+               ('p50', 'p50_ms'), ('p95', 'p95_ms'), ('p99', 'p99_ms'), ('max', 'max_ms'),
+               ('ttfb p50', 'ttfb_p50_ms'), ('ttfb p95', 'ttfb_p95_ms')]
+
+    def cell(row, key):
+        value = row.get(key)
+        if value is None:
+            return '-'
+        if key.endswith('_rate'):
+            return f"{value * 100:.1f}"
+        if isinstance(value, float):
+            return f"{value:.0f}" if key.endswith('_ms') else f"{value:.1f}"
+        return str(value)
+
+    rows = [(name, row) for name, row in summary['endpoints'].items()] + [('all', summary['all'])]
+    table = [['endpoint'] + [title for title, _ in columns]]
+    table += [[name] + [cell(row, key) for _, key in columns] for name, row in rows]
+    widths = [max(len(line[i]) for line in table) for i in range(len(table[0]))]
+    lines = ['  '.join(value.rjust(width) if i else value.ljust(width) for i, (value, width)
+                       in enumerate(zip(line, widths))) for line in table]
+    lines.insert(1, '-' * len(lines[0]))
+    return f"Wall time {summary['wall_seconds']}s (latencies in ms)\n" + '\n'.join(lines)
+
+
+def regressions(summary: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.10,
+                error_tolerance: float = 0.01) -> List[str]:
+    """Endpoints whose p95/p99 grew by more than tolerance or whose error rate grew by more than error_tolerance"""
+    found = []
+    for endpoint, before in baseline.get('endpoints', {}).items():
+        after = summary['endpoints'].get(endpoint)
+        if after is None:
+            continue
+        for key in ('p95_ms', 'p99_ms'):
+            if before.get(key) and after.get(key) and after[key] > before[key] * (1 + tolerance):
+                found.append(f"{endpoint}: {key} {before[key]:.0f} -> {after[key]:.0f}")
+        if after['error_rate'] > before['error_rate'] + error_tolerance:
+            found.append(f"{endpoint}: error rate {before['error_rate']:.2%} -> {after['error_rate']:.2%}")
+    return found
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Summarise load test results per endpoint")
+    parser.add_argument('results', help="JSON lines file written by benchmarks.loadgen")
+    parser.add_argument('--json', help="also write the summary here")
+    parser.add_argument('--baseline', help="summary JSON of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="allowed relative p95/p99 growth")
+    args = parser.parse_args(argv)
+
+    summary = summarise(read_results(args.results))
+    print(format_table(summary))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            found = regressions(summary, json.load(f), args.tolerance)
+        if found:
+            print("\nRegressions against baseline:\n  " + '\n  '.join(found))
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
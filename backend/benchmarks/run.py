@@ -0,0 +1,119 @@
+"""One-command benchmark on a single machine with no network.
+
+Starts the mock OpenAI server, starts the backend (production.py) pointed
+at it, drives it with benchmarks.loadgen and prints benchmarks.report's
+summary. Pass several --workers values to compare worker counts.
+
+Run with:
+    python -m benchmarks.run --server asgi --workers 1 2 4 --rate 30 --duration 60 --mix exam-week
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks import loadgen, mock_openai, report
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_backend(server: str, workers: int, port: int, mock_url: str, data_dir: str, env_overrides) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        'OPENAI_API_KEY': env.get('OPENAI_API_KEY') or 'sk-benchmark',
+        'OPENAI_BASE_URL': mock_url,
+        'PORT': str(port),
+        'SERVER_MODE': server,
+        'WEB_CONCURRENCY': str(workers),
+        # Keep benchmark writes out of the real progress database
+        'PROGRESS_DB_PATH': os.path.join(data_dir, 'progress.db'),
+        # A fresh shared completion cache per run, so runs do not warm each other
+        'SHARED_CACHE_PATH': os.path.join(data_dir, 'completion_cache.db'),
+        # Quiz pools start empty and the curriculum index is compiled here, not in the real data directory
+        'QUIZ_POOL_PATH': os.path.join(data_dir, 'quiz_pool.db'),
+        'ANSWER_STORE_PATH': os.path.join(data_dir, 'answers.db'),
+        'CURRICULUM_INDEX_PATH': os.path.join(data_dir, 'curriculum.idx'),
+    })
+    env.update(env_overrides)
+    return subprocess.Popen([sys.executable, 'production.py'], cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 120) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited with code {process.returncode} during startup")
+        try:
+            if httpx.get(base_url + '/api/ready', timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Backend not ready after {timeout}s")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the backend against a local mock OpenAI server")
+    parser.add_argument('--server', choices=['wsgi', 'asgi'], default='asgi')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1], help="worker counts to compare (asgi)")
+    parser.add_argument('--port', type=int, default=4400)
+    parser.add_argument('--mock-port', type=int, default=8089)
+    parser.add_argument('--out-dir', default='bench-out')
+    parser.add_argument('--baseline', help="summary JSON of an earlier run to compare against")
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help="extra backend environment, e.g. --env UPSTREAM_TOKENS_PER_MINUTE=90000")
+    loadgen.add_arguments(parser)
+    mock_openai.add_arguments(parser)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    env_overrides = dict(item.split('=', 1) for item in args.env)
+    mock = mock_openai.serve(mock_openai.settings_from_args(args), port=args.mock_port)
+    mock_url = f"http://127.0.0.1:{mock.server_address[1]}/v1"
+    args.base_url = f"http://127.0.0.1:{args.port}"
+    failed = False
+    try:
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory(prefix='bench-') as data_dir:
+                backend = start_backend(args.server, workers, args.port, mock_url, data_dir, env_overrides)
+                try:
+                    wait_until_ready(args.base_url, backend)
+                    results_path = os.path.join(args.out_dir, f"{args.server}-{workers}w.jsonl")
+                    with open(results_path, 'w', encoding='utf-8') as out:
+                        asyncio.run(loadgen.run(args, out))
+                finally:
+                    backend.terminate()
+                    backend.wait(timeout=30)
+            summary = report.summarise(report.read_results(results_path))
+            summary['workers'] = workers
+            summary['server'] = args.server
+            with open(results_path[:-len('.jsonl')] + '.summary.json', 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2)
+            print(f"\n== {args.server}, {workers} worker(s) ==")
+            print(report.format_table(summary))
+            if args.baseline:
+                with open(args.baseline, 'r', encoding='utf-8') as f:
+                    found = report.regressions(summary, json.load(f))
+                for line in found:
+                    print(f"REGRESSION {line}")
+                failed = failed or bool(found)
+        print(f"\nMock upstream: {json.dumps(mock.RequestHandlerClass.upstream.stats())}")
+    finally:
+        mock.shutdown()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
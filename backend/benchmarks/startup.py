@@ -0,0 +1,138 @@
+"""Startup benchmark: import time, preload and warm-up, each in a fresh interpreter.
+
+Fails (exit 1) when `import app` pulls in a module that should only load on
+first use (the OpenAI SDK, FastAPI, numpy, pydantic, ...), when the median
+import time exceeds --max-import-ms, or, with --baseline, when a phase got
+slower than an earlier --json run by more than --tolerance.
+
+Run with: python -m benchmarks.startup --runs 5 [--json startup.json] [--baseline old.json] [--importtime]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded by the warm-up or on first use, never by `import app`
+LAZY_MODULES = ('openai', 'fastapi', 'numpy', 'pydantic', 'requests', 'httpx', 'models.openai_client',
+                'agents.content_retriever_agent', 'services.search_index', 'services.progress_analytics')
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+MODULES_AFTER_IMPORT = set(sys.modules)
+from services.startup import startup
+startup.preload()
+preloaded = time.perf_counter()
+startup.warm_up()
+warmed = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'preload_ms': (preloaded - imported) * 1000,
+    'warm_up_ms': (warmed - preloaded) * 1000,
+    'eager_modules': [m for m in LAZY_MODULES if m in MODULES_AFTER_IMPORT],
+    'failed': startup.failed,
+}))
+"""
+
+
+def probe_env(data_dir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault('OPENAI_API_KEY', 'sk-startup-benchmark')
+    # Keep the benchmark's writes out of the real databases
+    env['PROGRESS_DB_PATH'] = os.path.join(data_dir, 'progress.db')
+    env['SHARED_CACHE_PATH'] = os.path.join(data_dir, 'completion_cache.db')
+    env['QUIZ_POOL_PATH'] = os.path.join(data_dir, 'quiz_pool.db')
+    env['CURRICULUM_INDEX_PATH'] = os.path.join(data_dir, 'curriculum.idx')
+    env['LOG_LEVEL'] = 'WARNING'
+    return env
+
+
+def run_probe(env: Dict[str, str]) -> Dict[str, Any]:
+    script = f"LAZY_MODULES = {LAZY_MODULES!r}\n" + PROBE
+    result = subprocess.run([sys.executable, '-c', script], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(env: Dict[str, str], count: int = 15) -> List[str]:
+    """The modules with the largest cumulative import time under `python -X importtime -c 'import app'`"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=BACKEND_DIR,
+                            env=env, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.rstrip()))
+    rows.sort(reverse=True)
+    return [f"{cumulative / 1000:8.1f} ms  {name}" for cumulative, name in rows[:count]]
+
+
+def summarise(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    summary = {key: round(statistics.median(run[key] for run in runs), 1)
+               for key in ('import_ms', 'preload_ms', 'warm_up_ms')}
+    summary['runs'] = len(runs)
+    summary['eager_modules'] = sorted({m for run in runs for m in run['eager_modules']})
+    summary['failed'] = runs[-1]['failed']
+    return summary
+
+
+def regressions(summary: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+                max_import_ms: float) -> List[str]:
+    found = []
+    if summary['eager_modules']:
+        found.append(f"import app loads {', '.join(summary['eager_modules'])} eagerly")
+    if summary['import_ms'] > max_import_ms:
+        found.append(f"import app took {summary['import_ms']:.0f} ms (budget {max_import_ms:.0f} ms)")
+    for key in ('import_ms', 'preload_ms', 'warm_up_ms'):
+        if baseline.get(key) and summary[key] > baseline[key] * (1 + tolerance):
+            found.append(f"{key}: {baseline[key]:.0f} -> {summary[key]:.0f}")
+    return found
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Measure and guard backend startup time")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-import-ms', type=float, default=600,
+                        help="budget for the median `import app` time")
+    parser.add_argument('--json', help="also write the summary here")
+    parser.add_argument('--baseline', help="summary JSON of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative growth per phase")
+    parser.add_argument('--importtime', action='store_true', help="list the slowest imports of `import app`")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='startup-') as data_dir:
+        env = probe_env(data_dir)
+        runs = [run_probe(env) for _ in range(args.runs)]
+        summary = summarise(runs)
+        if args.importtime:
+            print("Slowest imports (cumulative):\n" + '\n'.join(slowest_imports(env)) + "\n")
+
+    print(f"import app {summary['import_ms']:.0f} ms, preload {summary['preload_ms']:.0f} ms, "
+          f"warm-up {summary['warm_up_ms']:.0f} ms (median of {summary['runs']})")
+    if summary['failed']:
+        print(f"Components that failed to build: {json.dumps(summary['failed'])}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    found = regressions(summary, baseline, args.tolerance, args.max_import_ms)
+    if found:
+        print("\nStartup regressions:\n  " + '\n  '.join(found))
+        sys.exit(1)
+    print("No startup regressions")
+
+
+if __name__ == '__main__':
+    main()
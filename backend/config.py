@@ -5,15 +5,171 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # OpenAI Configuration
+# A missing key does not stop the app from starting: the OpenAI client fails to build,
+# /api/ready reports it and the LLM routes answer with an error
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY environment variable is not set")
 
 # Model Configuration
 SIMPLE_TASK_MODEL = "gpt-3.5-turbo"  # For simpler tasks
 COMPLEX_TASK_MODEL = "gpt-4"  # For complex reasoning tasks
 
+# Model Router Configuration
+MODEL_ROUTER_ENABLED = os.getenv("MODEL_ROUTER_ENABLED", "true").lower() == "true"
+MODEL_TIERS = {"fast": SIMPLE_TASK_MODEL, "strong": COMPLEX_TASK_MODEL}
+# Latency budget per endpoint: the strong tier is skipped while its observed p95 exceeds it
+ENDPOINT_LATENCY_BUDGETS_MS = {
+    "search": float(os.getenv("SEARCH_LATENCY_BUDGET_MS", 5000)),
+    "chat": float(os.getenv("CHAT_LATENCY_BUDGET_MS", 8000)),
+    "explain": float(os.getenv("EXPLAIN_LATENCY_BUDGET_MS", 10000)),
+}
+# Completed calls per model used for the p95, and how many are needed before it is trusted
+MODEL_ROUTER_LATENCY_WINDOW = int(os.getenv("MODEL_ROUTER_LATENCY_WINDOW", 200))
+MODEL_ROUTER_MIN_SAMPLES = int(os.getenv("MODEL_ROUTER_MIN_SAMPLES", 20))
+# JSON-lines file that routing decisions are appended to (disabled when unset)
+MODEL_ROUTER_DECISIONS_PATH = os.getenv("MODEL_ROUTER_DECISIONS_PATH")
+
 # API Configuration
 OPENAI_API_HOST = "0.0.0.0"
 OPENAI_API_PORT = 4000
-OPENAI_API_DEBUG = True 
\ No newline at end of file
+OPENAI_API_DEBUG = True 
+
+# Generation Budget Configuration
+# Output length per endpoint, class level and intent: max_tokens, temperature and a length instruction
+GENERATION_BUDGETS_ENABLED = os.getenv("GENERATION_BUDGETS_ENABLED", "true").lower() == "true"
+# JSON-lines file that each answer's budget and actual length are appended to (disabled when unset)
+GENERATION_BUDGET_LOG_PATH = os.getenv("GENERATION_BUDGET_LOG_PATH")
+
+# Completion Cache Configuration
+COMPLETION_CACHE_ENABLED = os.getenv("COMPLETION_CACHE_ENABLED", "true").lower() == "true"
+COMPLETION_CACHE_MAX_ENTRIES = int(os.getenv("COMPLETION_CACHE_MAX_ENTRIES", 2048))
+COMPLETION_CACHE_TTL_SECONDS = int(os.getenv("COMPLETION_CACHE_TTL_SECONDS", 3600))
+
+# Single-flight Configuration
+# Seconds a request waits on an identical in-flight upstream call before giving up
+SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS = float(os.getenv("SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS", 60))
+
+# Async Serving Configuration (asgi.py)
+# Maximum concurrent upstream OpenAI calls per process
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", 200))
+# Seconds an upstream call, retries included, may take before it is abandoned (both clients)
+UPSTREAM_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_TIMEOUT_SECONDS", 60))
+# Seconds a request may wait for a free upstream slot before getting a 503
+UPSTREAM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT_SECONDS", 30))
+# Seconds to let in-flight upstream calls finish on shutdown
+SHUTDOWN_GRACE_SECONDS = float(os.getenv("SHUTDOWN_GRACE_SECONDS", 30))
+
+# Upstream Resilience Configuration (both OpenAI clients)
+# Shared keep-alive connection pool
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", 100))
+UPSTREAM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", 20))
+UPSTREAM_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY_SECONDS", 30))
+UPSTREAM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT_SECONDS", 5))
+# Attempts per call (within UPSTREAM_TIMEOUT_SECONDS) and the jittered exponential backoff between them
+UPSTREAM_MAX_ATTEMPTS = int(os.getenv("UPSTREAM_MAX_ATTEMPTS", 3))
+UPSTREAM_RETRY_BASE_DELAY_SECONDS = float(os.getenv("UPSTREAM_RETRY_BASE_DELAY_SECONDS", 0.5))
+UPSTREAM_RETRY_MAX_DELAY_SECONDS = float(os.getenv("UPSTREAM_RETRY_MAX_DELAY_SECONDS", 8))
+# Consecutive failures that open the circuit, and seconds before a trial call is let through
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", 5))
+CIRCUIT_BREAKER_RESET_SECONDS = float(os.getenv("CIRCUIT_BREAKER_RESET_SECONDS", 30))
+# Hedged requests: fire a duplicate once a call outlives the model's observed p95 (never sooner
+# than the minimum delay); the first answer wins. Doubles cost for the slowest calls.
+UPSTREAM_HEDGING_ENABLED = os.getenv("UPSTREAM_HEDGING_ENABLED", "false").lower() == "true"
+UPSTREAM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("UPSTREAM_HEDGE_MIN_DELAY_SECONDS", 1.0))
+
+# Admission Control Configuration (both OpenAI clients)
+# LLM calls are queued by priority and admitted at a steady pace just under the upstream limits
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() == "true"
+# The upstream account's limits; each worker process (WEB_CONCURRENCY) is paced to its share
+UPSTREAM_TOKENS_PER_MINUTE = float(os.getenv("UPSTREAM_TOKENS_PER_MINUTE", 200000))
+UPSTREAM_REQUESTS_PER_MINUTE = float(os.getenv("UPSTREAM_REQUESTS_PER_MINUTE", 3500))
+ADMISSION_WORKER_PROCESSES = int(os.getenv("WEB_CONCURRENCY", 1))
+# Fraction of the limits to use, and seconds of unused allowance that may be spent in one burst
+ADMISSION_UTILIZATION = float(os.getenv("ADMISSION_UTILIZATION", 0.9))
+ADMISSION_BURST_SECONDS = float(os.getenv("ADMISSION_BURST_SECONDS", 2))
+# Tokens per minute one student (or client address) may use
+STUDENT_TOKENS_PER_MINUTE = float(os.getenv("STUDENT_TOKENS_PER_MINUTE", 8000))
+# Seconds a call may wait in the queue per priority; calls that would wait longer get a 429
+ADMISSION_QUEUE_TIMEOUTS_SECONDS = {
+    "interactive": float(os.getenv("INTERACTIVE_QUEUE_TIMEOUT_SECONDS", 5)),
+    "standard": float(os.getenv("STANDARD_QUEUE_TIMEOUT_SECONDS", 10)),
+    "bulk": float(os.getenv("BULK_QUEUE_TIMEOUT_SECONDS", 30)),
+}
+
+# Progress Store Configuration
+PROGRESS_DB_PATH = os.getenv("PROGRESS_DB_PATH", os.path.join(os.path.dirname(__file__), 'data', 'progress.db'))
+# Seconds between background flushes of queued progress writes
+PROGRESS_FLUSH_INTERVAL_SECONDS = float(os.getenv("PROGRESS_FLUSH_INTERVAL_SECONDS", 0.5))
+# Maximum number of events accepted by one /api/progress/bulk request
+PROGRESS_BULK_MAX_EVENTS = int(os.getenv("PROGRESS_BULK_MAX_EVENTS", 5000))
+# Seconds between analytics reloads from the progress store (picks up other workers' writes)
+ANALYTICS_REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", 300))
+
+# Retrieval Configuration
+CURRICULUM_DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+# BM25 index built by `python -m services.search_index build` (built on first start if missing)
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", os.path.join(CURRICULUM_DATA_DIR, 'search_index.bm25'))
+# Passages added to the explain prompt as context
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 3))
+
+# Curriculum Index Configuration
+# Every board's curriculum compiled by `python -m services.curriculum_index build` (rebuilt on start when stale);
+# serves /api/topics/search and the boards that have no {board}-SUBJECTS.json
+CURRICULUM_INDEX_PATH = os.getenv("CURRICULUM_INDEX_PATH", os.path.join(CURRICULUM_DATA_DIR, 'curriculum.idx'))
+# Most topics one /api/topics/search request may return
+TOPIC_SEARCH_MAX_RESULTS = int(os.getenv("TOPIC_SEARCH_MAX_RESULTS", 50))
+
+# Precomputed Answers Configuration
+# Explanations and quizzes generated by `python -m services.precompute`, served before calling the model
+ANSWER_STORE_PATH = os.getenv("ANSWER_STORE_PATH", os.path.join(CURRICULUM_DATA_DIR, 'answers.db'))
+PRECOMPUTED_ANSWERS_ENABLED = os.getenv("PRECOMPUTED_ANSWERS_ENABLED", "true").lower() == "true"
+# Concurrent generations in a precompute run (admission control still paces them)
+PRECOMPUTE_WORKERS = int(os.getenv("PRECOMPUTE_WORKERS", 8))
+
+# Chat Session Configuration
+# /api/chat requests with a student id and topic continue that student's conversation on the topic
+CHAT_SESSIONS_ENABLED = os.getenv("CHAT_SESSIONS_ENABLED", "true").lower() == "true"
+# Sessions idle this long are dropped; at most this many are kept per worker process
+CHAT_SESSION_TTL_SECONDS = float(os.getenv("CHAT_SESSION_TTL_SECONDS", 1800))
+CHAT_SESSION_MAX_SESSIONS = int(os.getenv("CHAT_SESSION_MAX_SESSIONS", 10000))
+# Tokens (and exchanges) of recent turns sent with a follow-up; older ones are folded into a summary
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", 1200))
+CHAT_HISTORY_MAX_TURNS = int(os.getenv("CHAT_HISTORY_MAX_TURNS", 12))
+CHAT_SUMMARY_TOKEN_BUDGET = int(os.getenv("CHAT_SUMMARY_TOKEN_BUDGET", 250))
+# "model" rewrites the summary with SIMPLE_TASK_MODEL in the background (bulk priority); "extractive" never calls it
+CHAT_SUMMARY_MODE = os.getenv("CHAT_SUMMARY_MODE", "model").lower()
+
+# Quiz Pool Configuration
+# /api/quiz serves questions from per-topic pools shared by all workers, refilled in the background
+QUIZ_POOL_PATH = os.getenv("QUIZ_POOL_PATH", os.path.join(CURRICULUM_DATA_DIR, 'quiz_pool.db'))
+# Questions a topic's pool is refilled to, and the size below which a refill starts
+QUIZ_POOL_SIZE = int(os.getenv("QUIZ_POOL_SIZE", 40))
+QUIZ_POOL_LOW_WATERMARK = int(os.getenv("QUIZ_POOL_LOW_WATERMARK", 20))
+# Questions generated per upstream call, and concurrent refills per worker process
+QUIZ_POOL_BATCH_SIZE = int(os.getenv("QUIZ_POOL_BATCH_SIZE", 10))
+QUIZ_POOL_REFILL_WORKERS = int(os.getenv("QUIZ_POOL_REFILL_WORKERS", 2))
+# Questions per quiz: the default and the most a request may ask for
+QUIZ_DEFAULT_QUESTIONS = int(os.getenv("QUIZ_DEFAULT_QUESTIONS", 5))
+QUIZ_MAX_QUESTIONS = int(os.getenv("QUIZ_MAX_QUESTIONS", 20))
+
+# Shared Completion Cache Configuration
+# Completions are also written to a SQLite file that every worker process on the host reads,
+# so an answer fetched by one worker is served by all of them
+SHARED_CACHE_ENABLED = os.getenv("SHARED_CACHE_ENABLED", "true").lower() == "true"
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", os.path.join(CURRICULUM_DATA_DIR, 'completion_cache.db'))
+# Least recently used entries are evicted beyond either limit
+SHARED_CACHE_MAX_ENTRIES = int(os.getenv("SHARED_CACHE_MAX_ENTRIES", 200000))
+SHARED_CACHE_MAX_MB = float(os.getenv("SHARED_CACHE_MAX_MB", 256))
+# Threads the ASGI client uses for shared cache reads and write-throughs, so they never block the event loop
+SHARED_CACHE_IO_THREADS = int(os.getenv("SHARED_CACHE_IO_THREADS", 4))
+
+# Near-duplicate Question Cache Configuration
+NEAR_DUPLICATE_CACHE_ENABLED = os.getenv("NEAR_DUPLICATE_CACHE_ENABLED", "true").lower() == "true"
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.getenv("NEAR_DUPLICATE_MAX_ENTRIES", 100000))
+# Estimated Jaccard similarity of two questions' word shingles needed to reuse an answer
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", 0.7))
+
+# Observability Configuration
+# Per-stage request timings and upstream usage, exposed on /api/metrics in Prometheus text format
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Log records are written by a background thread; this is the root logger's level
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
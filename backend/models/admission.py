@@ -0,0 +1,316 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first: interactive chat, then search/explain, then bulk quiz generation
+PRIORITIES = {'interactive': 0, 'standard': 1, 'bulk': 2}
+
+
+class AdmissionRejected(Exception):
+    """Raised instead of queueing when a call could not be admitted within its queue deadline"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_tokens(prompt: str, system_prompt: Optional[str], max_tokens: int,
+                    history: Optional[List[Dict[str, str]]] = None) -> int:
+    """Upper bound on the tokens a call can use: its prompt and history (~4 characters per token) plus max_tokens"""
+    history_chars = sum(len(message['content']) for message in history) if history else 0
+    return (len(prompt) + len(system_prompt or '') + history_chars) // 4 + 1 + max_tokens
+
+
+class TokenBucket:
+    """Refills continuously at rate per second up to capacity.
+
+    The level may go below zero when the upstream reports that it is
+    throttling us; nothing is admitted until it has refilled.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        # now may predate a bucket created after the caller read the clock
+        if now <= self._updated:
+            return
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken"""
+        self._refill(now)
+        return max(amount - self.level, 0.0) / self.rate
+
+    def take(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.level -= amount
+
+    def give(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+
+class AdmissionTicket:
+    """An admitted call's token reservation; settle it with the tokens actually used"""
+
+    def __init__(self, controller: Optional['AdmissionController'], cost: int, student: Optional[str],
+                 reserved: int = 0, student_reserved: int = 0):
+        self._controller = controller
+        self.cost = cost
+        self.student = student
+        # Tokens actually taken from the global and the student's bucket: a call bigger than a bucket takes all of it
+        self.reserved = reserved
+        self.student_reserved = student_reserved
+        self.waited = 0.0
+
+    def settle(self, used_tokens: Optional[int]) -> None:
+        """Return the unused part of the reservation (e.g. max_tokens the answer did not need)"""
+        if self._controller is None or used_tokens is None:
+            return
+        self._controller._refund(self, max(self.cost - used_tokens, 0))
+        self._controller = None
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'cost', 'student', 'student_reserved', 'notify', 'ticket', 'abandoned',
+                 'enqueued')
+
+    def __init__(self, priority: int, seq: int, cost: int, student: Optional[str], student_reserved: int,
+                 notify: Callable[[], None]):
+        self.priority = priority
+        self.seq = seq
+        self.cost = cost
+        self.student = student
+        self.student_reserved = student_reserved
+        self.notify = notify
+        self.ticket: Optional[AdmissionTicket] = None
+        self.abandoned = False
+        self.enqueued = time.monotonic()
+
+    def __lt__(self, other: '_Waiter') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionController:
+    """Admits LLM calls at a steady rate just under the upstream limits.
+
+    Global token and request buckets refill at `utilization` of the
+    upstream's per-minute limits with only burst_seconds of headroom, so
+    calls are paced evenly instead of bursting into 429s and backing off.
+    Calls wait in a priority queue (interactive before standard before
+    bulk, FIFO within a priority) and are admitted by a dispatcher thread as
+    the buckets refill. A call whose estimated queueing time exceeds its
+    queue deadline is rejected immediately with a Retry-After, as is one
+    from a student who has used up their own bucket. Reservations are sized
+    for the worst case (prompt + max_tokens) and the unused part is returned
+    once the answer is known.
+    """
+
+    def __init__(self, tokens_per_minute: float, requests_per_minute: float,
+                 student_tokens_per_minute: float, queue_timeouts: Dict[str, float],
+                 utilization: float = 0.9, burst_seconds: float = 2.0, max_students: int = 10000,
+                 enabled: bool = True):
+        self.enabled = enabled
+        self.queue_timeouts = queue_timeouts
+        self.max_students = max_students
+        token_rate = tokens_per_minute * utilization / 60
+        request_rate = requests_per_minute * utilization / 60
+        self._tokens = TokenBucket(token_rate, max(token_rate * burst_seconds, 1.0))
+        self._requests = TokenBucket(request_rate, max(request_rate * burst_seconds, 1.0))
+        self._student_rate = student_tokens_per_minute / 60
+        # A student may spend a minute's allowance at once, then is paced
+        self._student_capacity = student_tokens_per_minute
+        self._students: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+        self._queue: List[_Waiter] = []
+        self._queued_tokens = [0] * len(PRIORITIES)
+        self._queued_requests = [0] * len(PRIORITIES)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._dispatcher: Optional[threading.Thread] = None
+        self.admitted = 0
+        self.rejected = {'queue_deadline': 0, 'student_limit': 0, 'timed_out': 0}
+        self.throttled = 0
+
+    def _student_bucket(self, student: str) -> TokenBucket:
+        bucket = self._students.get(student)
+        if bucket is None:
+            bucket = self._students[student] = TokenBucket(self._student_rate, self._student_capacity)
+            if len(self._students) > self.max_students:
+                self._students.popitem(last=False)
+        else:
+            self._students.move_to_end(student)
+        return bucket
+
+    def _estimated_wait(self, priority: int, cost: int, now: float) -> float:
+        """Seconds until a call queued now would be admitted, ignoring later higher-priority arrivals"""
+        tokens_ahead = sum(self._queued_tokens[:priority + 1])
+        requests_ahead = sum(self._queued_requests[:priority + 1])
+        return max(self._tokens.wait_time(tokens_ahead + cost, now),
+                   self._requests.wait_time(requests_ahead + 1, now))
+
+    def _queue_timeout(self, priority: str, timeout: Optional[float]) -> float:
+        if timeout is not None:
+            return timeout
+        return self.queue_timeouts.get(priority, self.queue_timeouts['standard'])
+
+    def _enqueue(self, cost: int, priority: str, student: Optional[str], timeout: float,
+                 notify: Callable[[], None]) -> _Waiter:
+        level = PRIORITIES.get(priority, PRIORITIES['standard'])
+        now = time.monotonic()
+        with self._cond:
+            if student is not None:
+                bucket = self._student_bucket(student)
+                student_wait = bucket.wait_time(min(cost, bucket.capacity), now)
+                if student_wait > 0:
+                    self.rejected['student_limit'] += 1
+                    raise AdmissionRejected("Too many AI requests from this student, please slow down",
+                                            student_wait)
+            wait = self._estimated_wait(level, cost, now)
+            if wait > timeout:
+                self.rejected['queue_deadline'] += 1
+                raise AdmissionRejected(f"AI service is at capacity, estimated wait {wait:.1f}s", wait)
+            student_reserved = 0
+            if student is not None:
+                student_reserved = min(cost, bucket.capacity)
+                bucket.take(student_reserved, now)
+            waiter = _Waiter(level, next(self._seq), cost, student, student_reserved, notify)
+            heapq.heappush(self._queue, waiter)
+            self._queued_tokens[level] += cost
+            self._queued_requests[level] += 1
+            self._ensure_dispatcher()
+            self._cond.notify()
+        return waiter
+
+    def _ensure_dispatcher(self) -> None:
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name='admission-dispatcher',
+                                                daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch_loop(self) -> None:
+        with self._cond:
+            while True:
+                sleep = self._dispatch(time.monotonic())
+                self._cond.wait(sleep)
+
+    def _dispatch(self, now: float) -> Optional[float]:
+        """Admit queued calls in priority order while the buckets cover them; returns seconds to sleep"""
+        while self._queue:
+            head = self._queue[0]
+            if head.abandoned:
+                heapq.heappop(self._queue)
+                continue
+            # A call bigger than the whole bucket is admitted once the bucket is full
+            cost = min(head.cost, self._tokens.capacity)
+            wait = max(self._tokens.wait_time(cost, now), self._requests.wait_time(1, now))
+            if wait > 0:
+                return wait
+            heapq.heappop(self._queue)
+            self._tokens.take(cost, now)
+            self._requests.take(1, now)
+            self._queued_tokens[head.priority] -= head.cost
+            self._queued_requests[head.priority] -= 1
+            head.ticket = AdmissionTicket(self, head.cost, head.student, cost, head.student_reserved)
+            head.ticket.waited = now - head.enqueued
+            self.admitted += 1
+            head.notify()
+        return None
+
+    def _abandon(self, waiter: _Waiter) -> Optional[AdmissionTicket]:
+        """Drop a waiter whose deadline passed; returns its ticket if it was admitted meanwhile"""
+        with self._cond:
+            if waiter.ticket is not None:
+                return waiter.ticket
+            waiter.abandoned = True
+            self._queued_tokens[waiter.priority] -= waiter.cost
+            self._queued_requests[waiter.priority] -= 1
+            if waiter.student is not None and waiter.student in self._students:
+                self._students[waiter.student].give(waiter.student_reserved)
+            self.rejected['timed_out'] += 1
+        return None
+
+    def _refund(self, ticket: AdmissionTicket, tokens: int) -> None:
+        if tokens <= 0:
+            return
+        with self._cond:
+            # Never hand back more than was taken
+            self._tokens.give(min(tokens, ticket.reserved))
+            if ticket.student is not None and ticket.student in self._students:
+                self._students[ticket.student].give(min(tokens, ticket.student_reserved))
+            self._cond.notify()
+
+    def _timed_out(self, waiter: _Waiter) -> AdmissionRejected:
+        with self._cond:
+            retry_after = self._estimated_wait(waiter.priority, waiter.cost, time.monotonic())
+        return AdmissionRejected("AI service is at capacity, timed out waiting in queue", max(retry_after, 1.0))
+
+    def acquire(self, cost: int, priority: str = 'standard', student: Optional[str] = None,
+                timeout: Optional[float] = None) -> AdmissionTicket:
+        """Block until the call is admitted; raises AdmissionRejected instead of waiting past the deadline"""
+        if not self.enabled:
+            return AdmissionTicket(None, cost, student)
+        timeout = self._queue_timeout(priority, timeout)
+        admitted = threading.Event()
+        waiter = self._enqueue(cost, priority, student, timeout, admitted.set)
+        if not admitted.wait(timeout):
+            ticket = self._abandon(waiter)
+            if ticket is None:
+                raise self._timed_out(waiter)
+        return waiter.ticket
+
+    async def acquire_async(self, cost: int, priority: str = 'standard', student: Optional[str] = None,
+                            timeout: Optional[float] = None) -> AdmissionTicket:
+        """Async counterpart of acquire"""
+        if not self.enabled:
+            return AdmissionTicket(None, cost, student)
+        loop = asyncio.get_running_loop()
+        admitted = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: admitted.done() or admitted.set_result(None))
+
+        timeout = self._queue_timeout(priority, timeout)
+        waiter = self._enqueue(cost, priority, student, timeout, notify)
+        try:
+            await asyncio.wait_for(asyncio.shield(admitted), timeout)
+        except asyncio.TimeoutError:
+            if self._abandon(waiter) is None:
+                raise self._timed_out(waiter)
+        except asyncio.CancelledError:
+            ticket = self._abandon(waiter)
+            if ticket is not None:
+                ticket.settle(0)
+            raise
+        return waiter.ticket
+
+    def upstream_throttled(self, retry_after: float) -> None:
+        """The upstream answered 429: admit nothing more until retry_after has passed"""
+        with self._cond:
+            self.throttled += 1
+            now = time.monotonic()
+            self._tokens._refill(now)
+            self._tokens.level = min(self._tokens.level, -self._tokens.rate * max(retry_after, 1.0))
+            self._cond.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'enabled': self.enabled,
+                'queued': {name: self._queued_requests[level] for name, level in PRIORITIES.items()},
+                'queued_tokens': sum(self._queued_tokens),
+                'tokens_available': int(self._tokens.level),
+                'admitted': self.admitted,
+                'rejected': dict(self.rejected),
+                'upstream_throttled': self.throttled,
+            }
@@ -0,0 +1,406 @@
+import httpx
+from openai import AsyncOpenAI, OpenAIError
+from config import (SIMPLE_TASK_MODEL, OPENAI_API_KEY, COMPLETION_CACHE_ENABLED,
+                    COMPLETION_CACHE_MAX_ENTRIES, COMPLETION_CACHE_TTL_SECONDS,
+                    SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS, NEAR_DUPLICATE_CACHE_ENABLED,
+                    NEAR_DUPLICATE_MAX_ENTRIES, NEAR_DUPLICATE_THRESHOLD, UPSTREAM_MAX_CONCURRENCY,
+                    UPSTREAM_TIMEOUT_SECONDS, UPSTREAM_QUEUE_TIMEOUT_SECONDS, UPSTREAM_MAX_ATTEMPTS,
+                    UPSTREAM_RETRY_BASE_DELAY_SECONDS, UPSTREAM_RETRY_MAX_DELAY_SECONDS,
+                    CIRCUIT_BREAKER_FAILURE_THRESHOLD, CIRCUIT_BREAKER_RESET_SECONDS, SHARED_CACHE_IO_THREADS)
+from models.completion_cache import CompletionCache
+from models.near_duplicate_cache import NearDuplicateCache
+from models.single_flight import SingleFlightTimeout
+from models.model_router import ModelRouter
+from models.openai_client import (admission_controller, chat_messages, hedge_delay, settle_completion,
+                                  shared_completion_cache, upstream_limits, upstream_timeout)
+from models.admission import AdmissionController, estimate_tokens
+from models.resilience import CircuitBreaker, CircuitOpenError, HedgeStats, RetryPolicy, ahedged_call
+from services.instrumentation import LOOKUP, QUEUE, UPSTREAM, record_upstream_call, stage
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamBusy(Exception):
+    """Raised when no upstream slot frees up within the queue timeout"""
+
+
+class UpstreamTimeout(TimeoutError):
+    """Raised when an upstream call exceeds its deadline"""
+
+
+class AsyncCompletionStream:
+    """Async counterpart of CompletionStream; holds an upstream slot until exhausted or closed.
+
+    on_complete(text, usage, complete) runs once from close(), which iteration
+    always ends with, so cancelled streams are settled too.
+    """
+
+    def __init__(self, response=None, text=None, on_complete=None, release=None):
+        self._response = response
+        self._on_complete = on_complete
+        self._release = release
+        self.cached = response is None
+        self._parts = [text] if text else []
+        self.usage = None
+        self.finish_reason = None
+        self._closed = False
+
+    async def __aiter__(self):
+        if self._response is None:
+            if self._parts:
+                yield self._parts[0]
+            return
+
+        try:
+            async for chunk in self._response:
+                usage = getattr(chunk, 'usage', None)
+                if usage:
+                    self.usage = {
+                        'prompt_tokens': usage.prompt_tokens,
+                        'completion_tokens': usage.completion_tokens,
+                        'total_tokens': usage.total_tokens,
+                    }
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.finish_reason:
+                    self.finish_reason = choice.finish_reason
+                if choice.delta.content:
+                    self._parts.append(choice.delta.content)
+                    yield choice.delta.content
+        finally:
+            await self.close()
+
+    @property
+    def text(self):
+        """Text received so far (the full answer once iteration has finished)"""
+        return ''.join(self._parts)
+
+    async def close(self):
+        """Stop reading, release the upstream connection and the concurrency slot"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self._response is not None:
+                close = getattr(self._response, 'close', None) or self._response.response.aclose
+                result = close()
+                if asyncio.iscoroutine(result):
+                    await result
+        finally:
+            if self._release is not None:
+                self._release()
+            if self._on_complete:
+                self._on_complete(self.text, self.usage, self.finish_reason is not None)
+
+
+class AsyncOpenAIClient:
+    """AsyncOpenAI-based client for the ASGI serving path.
+
+    Upstream calls are bounded by a semaphore of UPSTREAM_MAX_CONCURRENCY
+    slots and a per-call deadline, so one process can hold hundreds of
+    in-flight completions without parking a thread on each. Retries, the
+    circuit breaker and hedging behave as in OpenAIClient; hedged duplicates
+    share the caller's slot. Calls are admitted through admission control
+    before they take a slot. Pass the sync client's caches, router, breaker
+    and admission controller to share answers, latency observations,
+    upstream health and the rate budget between the WSGI and ASGI routes.
+    """
+
+    def __init__(self, cache: Optional[CompletionCache] = None,
+                 near_duplicates: Optional[NearDuplicateCache] = None,
+                 router: Optional[ModelRouter] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 admission: Optional[AdmissionController] = None,
+                 max_concurrency: int = UPSTREAM_MAX_CONCURRENCY,
+                 timeout: float = UPSTREAM_TIMEOUT_SECONDS,
+                 queue_timeout: float = UPSTREAM_QUEUE_TIMEOUT_SECONDS):
+        self.client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0,
+                                  http_client=httpx.AsyncClient(limits=upstream_limits(),
+                                                                timeout=upstream_timeout()))
+        self.cache = cache or CompletionCache(max_entries=COMPLETION_CACHE_MAX_ENTRIES,
+                                              ttl_seconds=COMPLETION_CACHE_TTL_SECONDS,
+                                              shared=shared_completion_cache())
+        self.near_duplicates = near_duplicates or NearDuplicateCache(
+            max_entries=NEAR_DUPLICATE_MAX_ENTRIES, threshold=NEAR_DUPLICATE_THRESHOLD,
+            ttl_seconds=COMPLETION_CACHE_TTL_SECONDS)
+        self.router = router or ModelRouter()
+        self.breaker = breaker or CircuitBreaker(failure_threshold=CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                                                 reset_timeout=CIRCUIT_BREAKER_RESET_SECONDS)
+        self.admission = admission or admission_controller()
+        self.retry = RetryPolicy(self.breaker, max_attempts=UPSTREAM_MAX_ATTEMPTS,
+                                 base_delay=UPSTREAM_RETRY_BASE_DELAY_SECONDS,
+                                 max_delay=UPSTREAM_RETRY_MAX_DELAY_SECONDS,
+                                 on_throttled=self.admission.upstream_throttled)
+        self.hedges = HedgeStats()
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        # Created on first use so it binds to the serving event loop
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # The shared completion cache is SQLite: its reads and write-throughs run here, off the event loop
+        self._cache_io = ThreadPoolExecutor(max_workers=SHARED_CACHE_IO_THREADS, thread_name_prefix='shared-cache')
+        self.active = 0
+        self.waiting = 0
+        logger.info("Async OpenAI client initialized")
+
+    async def _cached(self, key):
+        """Completion cache lookup; a local miss is looked up in the shared store on a worker thread"""
+        value = self.cache.get_local(key)
+        if value is None and self.cache.shared is not None:
+            value = await asyncio.get_running_loop().run_in_executor(self._cache_io, self.cache.get_shared, key)
+        return value
+
+    def _store(self, key, value):
+        """Cache locally now and write through to the shared store in the background"""
+        self.cache.set_local(key, value)
+        if self.cache.shared is not None:
+            try:
+                self._cache_io.submit(self.cache.set_shared, key, value)
+            except RuntimeError:
+                # Shutting down: the answer is still cached in this process
+                pass
+
+    async def _admit(self, cost, priority, student):
+        with stage(QUEUE):
+            return await self.admission.acquire_async(cost, priority, student)
+
+    async def _acquire(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.waiting += 1
+        try:
+            with stage(QUEUE):
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise UpstreamBusy(f"No upstream slot free after {self.queue_timeout}s")
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def _release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    def _near_duplicate_scope(self, scope, cache_enabled, model, temperature, max_tokens, system_prompt):
+        # Requests without any curriculum scope (anonymous one-off questions) never share answers
+        if not (scope and any(scope)) or not (cache_enabled and NEAR_DUPLICATE_CACHE_ENABLED):
+            return None
+        return self.near_duplicates.make_scope(scope, model, temperature, max_tokens, system_prompt)
+
+    async def generate(self, prompt, model=None, system_prompt=None, temperature=0.7,
+                       max_tokens=500, use_cache=True, scope=None, priority='standard', student=None,
+                       history=None):
+        if model is None:
+            model = SIMPLE_TASK_MODEL
+        # use_cache=False opts out of both shared answers and coalescing
+        cache_enabled = use_cache and COMPLETION_CACHE_ENABLED and not history
+        cache_key = self.cache.make_key(prompt, model, temperature, max_tokens, system_prompt)
+        if cache_enabled:
+            with stage(LOOKUP):
+                cached = await self._cached(cache_key)
+            if cached is not None:
+                logger.info(f"Completion cache hit for model: {model}")
+                return cached
+        near_scope = self._near_duplicate_scope(scope, cache_enabled, model, temperature, max_tokens,
+                                                system_prompt)
+        if near_scope is not None:
+            with stage(LOOKUP):
+                similar = self.near_duplicates.get(prompt, near_scope)
+            if similar is not None:
+                logger.info(f"Near-duplicate cache hit for model: {model}")
+                return similar
+
+        messages = chat_messages(prompt, system_prompt, history)
+        cost = estimate_tokens(prompt, system_prompt, max_tokens, history)
+        if not use_cache or history:
+            return await self._complete(model, messages, temperature, max_tokens,
+                                        await self._admit(cost, priority, student))
+
+        async def fetch():
+            # Only the caller that reaches the upstream is admitted; coalesced callers wait on it
+            ticket = await self._admit(cost, priority, student)
+            content = await self._complete(model, messages, temperature, max_tokens, ticket)
+            if cache_enabled and content:
+                self._store(cache_key, content)
+                if near_scope is not None:
+                    self.near_duplicates.set(prompt, content, near_scope)
+            return content
+
+        return await self.coalesce(cache_key, fetch)
+
+    async def coalesce(self, key, fetch):
+        """Await fetch() once for concurrent callers sharing key; the others wait for its result"""
+        shared = self._inflight.get(key)
+        if shared is not None:
+            try:
+                return await asyncio.wait_for(asyncio.shield(shared), SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                raise SingleFlightTimeout(
+                    f"Timed out after {SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS}s waiting for a shared upstream call")
+
+        shared = asyncio.get_running_loop().create_future()
+        # Mark the exception as retrieved when nobody else was waiting
+        shared.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = shared
+        try:
+            result = await fetch()
+            shared.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            shared.set_exception(SingleFlightTimeout("Shared upstream call was cancelled"))
+            raise
+        except Exception as e:
+            shared.set_exception(e)
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _create(self, model, messages, temperature, max_tokens, timeout):
+        started = time.monotonic()
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=timeout
+        )
+        self.router.observe(model, time.monotonic() - started)
+        return response
+
+    async def _complete(self, model, messages, temperature, max_tokens, ticket):
+        try:
+            await self._acquire()
+        except BaseException:
+            ticket.settle(0)
+            raise
+        started = time.monotonic()
+        delay = hedge_delay(self.router, model)
+        response = None
+
+        async def attempt(remaining):
+            return await ahedged_call(lambda: self._create(model, messages, temperature, max_tokens, remaining),
+                                      delay, self.hedges)
+
+        try:
+            logger.info(f"Generating response with model: {model}")
+            with stage(UPSTREAM):
+                response = await asyncio.wait_for(self.retry.acall(attempt, started + self.timeout), self.timeout)
+            record_upstream_call(model, 'complete', time.monotonic() - started, response.usage)
+            return response.choices[0].message.content
+        except asyncio.TimeoutError:
+            # A timeout is a latency sample too: it is what the router needs to see
+            self.router.observe(model, time.monotonic() - started)
+            logger.error(f"OpenAI API call timed out after {time.monotonic() - started:.1f}s")
+            raise UpstreamTimeout(f"OpenAI API call timed out after {self.timeout}s")
+        except (OpenAIError, CircuitOpenError) as e:
+            logger.error(f"Error in OpenAI API call: {str(e)}")
+            raise
+        except Exception as e:
+            logger.error(f"Error in OpenAI API call: {str(e)}")
+            raise Exception(f"OpenAI API error: {str(e)}")
+        finally:
+            self._release()
+            settle_completion(ticket, response, max_tokens)
+
+    async def generate_stream(self, prompt, model=None, system_prompt=None, temperature=0.7,
+                              max_tokens=500, use_cache=True, scope=None, priority='standard',
+                              student=None, history=None) -> AsyncCompletionStream:
+        if model is None:
+            model = SIMPLE_TASK_MODEL
+        cache_enabled = use_cache and COMPLETION_CACHE_ENABLED and not history
+        cache_key = self.cache.make_key(prompt, model, temperature, max_tokens, system_prompt)
+        if cache_enabled:
+            with stage(LOOKUP):
+                cached = await self._cached(cache_key)
+            if cached is not None:
+                logger.info(f"Completion cache hit for model: {model}")
+                return AsyncCompletionStream(text=cached)
+        near_scope = self._near_duplicate_scope(scope, cache_enabled, model, temperature, max_tokens,
+                                                system_prompt)
+        if near_scope is not None:
+            with stage(LOOKUP):
+                similar = self.near_duplicates.get(prompt, near_scope)
+            if similar is not None:
+                logger.info(f"Near-duplicate cache hit for model: {model}")
+                return AsyncCompletionStream(text=similar)
+
+        cost = estimate_tokens(prompt, system_prompt, max_tokens, history)
+        ticket = await self._admit(cost, priority, student)
+        try:
+            await self._acquire()
+        except BaseException:
+            # Never reached the upstream: hand the reservation back
+            ticket.settle(0)
+            raise
+        started = time.monotonic()
+        response = None
+        try:
+            logger.info(f"Streaming response with model: {model}")
+            with stage(UPSTREAM):
+                response = await asyncio.wait_for(self.retry.acall(
+                    lambda remaining: self.client.chat.completions.create(
+                        model=model,
+                        messages=chat_messages(prompt, system_prompt, history),
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        stream=True,
+                        extra_body={"stream_options": {"include_usage": True}},
+                        timeout=remaining
+                    ), started + self.timeout), self.timeout)
+        except asyncio.TimeoutError:
+            self._release()
+            raise UpstreamTimeout(f"OpenAI API call timed out after {self.timeout}s")
+        except (OpenAIError, CircuitOpenError) as e:
+            self._release()
+            logger.error(f"Error in OpenAI API call: {str(e)}")
+            raise
+        except Exception as e:
+            self._release()
+            logger.error(f"Error in OpenAI API call: {str(e)}")
+            raise Exception(f"OpenAI API error: {str(e)}")
+        except BaseException:
+            self._release()
+            raise
+        finally:
+            if response is None:
+                # The stream never started: keep only the prompt's share of the reservation
+                ticket.settle(cost - max_tokens)
+
+        def on_complete(text, usage, complete):
+            elapsed = time.monotonic() - started
+            self.router.observe(model, elapsed)
+            record_upstream_call(model, 'stream' if complete else 'stream_cancelled', elapsed, usage)
+            ticket.settle(usage['total_tokens'] if usage else cost - max_tokens + len(text) // 4)
+            # A cancelled or failed stream leaves a partial answer that must not be shared
+            if complete and cache_enabled and text:
+                self._store(cache_key, text)
+                if near_scope is not None:
+                    self.near_duplicates.set(prompt, text, near_scope)
+
+        return AsyncCompletionStream(response=response, on_complete=on_complete, release=self._release)
+
+    def upstream_stats(self):
+        return {
+            'circuit_breaker': self.breaker.stats(),
+            'retries': self.retry.retries,
+            'hedges': self.hedges.stats(),
+            'admission': self.admission.stats(),
+        }
+
+    async def aclose(self, grace_seconds: float = 0):
+        """Wait up to grace_seconds for in-flight calls to finish, then close the pool"""
+        deadline = time.monotonic() + grace_seconds
+        while self.active and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self.active:
+            logger.warning(f"Closing OpenAI client with {self.active} call(s) still in flight")
+        await self.client.close()
+        # Let queued shared cache writes finish without blocking the loop
+        await asyncio.get_running_loop().run_in_executor(None, self._cache_io.shutdown)
@@ -0,0 +1,210 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Tokens the chat format adds per message on top of its content
+MESSAGE_OVERHEAD_TOKENS = 4
+# Compaction shrinks the history to this fraction of its budget, so it runs every few turns, not every turn
+COMPACTION_TARGET = 0.5
+
+
+def count_tokens(text: str) -> int:
+    """Local token estimate (~4 characters per token, as in admission control), no tokenizer round trip"""
+    return len(text) // 4 + 1
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    if count_tokens(text) <= tokens:
+        return text
+    return text[:max(tokens - 1, 0) * 4].rstrip() + ' ...'
+
+
+def first_sentence(text: str, max_words: int) -> str:
+    sentence = re.split(r'(?<=[.!?])\s', ' '.join(text.split()), maxsplit=1)[0]
+    words = sentence.split()
+    return ' '.join(words[:max_words]) + (' ...' if len(words) > max_words else '')
+
+
+def extractive_summary(summary: str, turns: List[Dict[str, Any]], budget: int) -> str:
+    """Append one line per dropped turn to the summary, then drop its oldest lines to fit the budget"""
+    lines = summary.splitlines() if summary else []
+    for turn in turns:
+        speaker = 'Student' if turn['role'] == 'user' else 'Tutor'
+        lines.append(f"{speaker}: {first_sentence(turn['content'], 30)}")
+    while len(lines) > 1 and count_tokens('\n'.join(lines)) > budget:
+        lines.pop(0)
+    return truncate_to_tokens('\n'.join(lines), budget)
+
+
+class ChatSession:
+    """One student's conversation about one topic: a rolling summary plus the most recent turns"""
+    __slots__ = ('key', 'system_prompt', 'summary', 'turns', 'history_tokens', 'last_used', 'compactions')
+
+    def __init__(self, key: Hashable, system_prompt: str):
+        self.key = key
+        self.system_prompt = system_prompt
+        self.summary = ''
+        # {'role', 'content', 'tokens'}, oldest first; always whole user/assistant pairs
+        self.turns: List[Dict[str, Any]] = []
+        self.history_tokens = 0
+        self.last_used = time.monotonic()
+        self.compactions = 0
+
+
+class ChatSessionStore:
+    """Bounded, thread-safe store of chat sessions, evicted after ttl_seconds idle.
+
+    context() gives the system prompt (with the summary of older turns) and the
+    recent turns to send ahead of a new message. record() appends a completed
+    exchange; once the recent turns pass history_token_budget (or max_turns
+    exchanges), the oldest are folded into the summary until the history is
+    back to half its budget. The summary is extractive and immediate; with a
+    summarize callable, it is then rewritten by the model in the background.
+    A follow-up prompt is therefore at most the system prompt, summary_token_budget,
+    history_token_budget and the new message, however long the session runs.
+
+    Sessions live in the worker process that served them.
+    """
+
+    def __init__(self, max_sessions: int = 10000, ttl_seconds: float = 1800.0,
+                 history_token_budget: int = 1200, summary_token_budget: int = 250, max_turns: int = 12,
+                 summarize: Optional[Callable[[str, List[Dict[str, Any]]], str]] = None):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.history_token_budget = history_token_budget
+        self.summary_token_budget = summary_token_budget
+        self.max_turns = max_turns
+        self._summarize = summarize
+        self._summarizer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chat-summary') if summarize else None
+        self._lock = threading.Lock()
+        # key -> session, least recently used first
+        self._sessions: "OrderedDict[Hashable, ChatSession]" = OrderedDict()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+        self.compactions = 0
+        self.summaries = 0
+        self.summary_failures = 0
+
+    @staticmethod
+    def make_key(student: str, board: Optional[str], class_level: Optional[str], subject: Optional[str],
+                 topic: str) -> Tuple:
+        return (student, board, class_level, subject, ' '.join(topic.split()).casefold())
+
+    def _expire(self, now: float) -> None:
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_used < self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+            self.expired += 1
+
+    def get(self, key: Hashable, system_prompt: str) -> ChatSession:
+        """The live session for key, started with system_prompt if there is none"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._sessions[key] = ChatSession(key, system_prompt)
+                self.created += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._sessions.move_to_end(key)
+            session.last_used = now
+            return session
+
+    def reset(self, key: Hashable) -> None:
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def context(self, session: ChatSession) -> Tuple[str, List[Dict[str, str]]]:
+        """(system_prompt, history) to send ahead of the session's next message"""
+        with self._lock:
+            system_prompt = session.system_prompt
+            if session.summary:
+                system_prompt += f"\n\nSummary of the conversation so far:\n{session.summary}"
+            return system_prompt, [{'role': turn['role'], 'content': turn['content']} for turn in session.turns]
+
+    def record(self, session: ChatSession, question: str, answer: str) -> None:
+        """Append a completed exchange and compact the history if it is over budget"""
+        # A single exchange never takes more than the whole budget
+        answer = truncate_to_tokens(answer, max(self.history_token_budget - count_tokens(question)
+                                                - 2 * MESSAGE_OVERHEAD_TOKENS, self.history_token_budget // 2))
+        with self._lock:
+            for role, content in (('user', question), ('assistant', answer)):
+                tokens = count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+                session.turns.append({'role': role, 'content': content, 'tokens': tokens})
+                session.history_tokens += tokens
+            session.last_used = time.monotonic()
+            dropped = self._compact(session)
+            if not dropped:
+                return
+            previous_summary = session.summary
+            session.summary = extractive_summary(previous_summary, dropped, self.summary_token_budget)
+            session.compactions += 1
+            self.compactions += 1
+            generation = session.compactions
+        if self._summarizer is not None:
+            self._summarizer.submit(self._rewrite_summary, session, generation, previous_summary, dropped)
+
+    def _compact(self, session: ChatSession) -> List[Dict[str, Any]]:
+        """Remove the oldest exchanges while over budget; returns the removed turns"""
+        if (session.history_tokens <= self.history_token_budget
+                and len(session.turns) <= 2 * self.max_turns):
+            return []
+        target_tokens = self.history_token_budget * COMPACTION_TARGET
+        target_turns = max(int(2 * self.max_turns * COMPACTION_TARGET), 2)
+        dropped = []
+        # Keep at least the latest exchange
+        while len(session.turns) > 2 and (session.history_tokens > target_tokens
+                                           or len(session.turns) > target_turns):
+            for turn in session.turns[:2]:
+                session.history_tokens -= turn['tokens']
+            dropped.extend(session.turns[:2])
+            del session.turns[:2]
+        return dropped
+
+    def _rewrite_summary(self, session: ChatSession, generation: int, previous_summary: str,
+                         dropped: List[Dict[str, Any]]) -> None:
+        try:
+            summary = self._summarize(previous_summary, dropped)
+        except Exception as e:
+            logger.warning(f"Chat summary failed, keeping the extractive one: {str(e)}")
+            with self._lock:
+                self.summary_failures += 1
+            return
+        if not summary:
+            return
+        with self._lock:
+            # A later compaction has already folded more turns into the extractive summary
+            if session.compactions != generation:
+                return
+            session.summary = truncate_to_tokens(summary.strip(), self.summary_token_budget)
+            self.summaries += 1
+
+    def close(self) -> None:
+        if self._summarizer is not None:
+            self._summarizer.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                'sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'created': self.created,
+                'expired': self.expired,
+                'evicted': self.evicted,
+                'compactions': self.compactions,
+                'model_summaries': self.summaries,
+                'summary_failures': self.summary_failures,
+            }
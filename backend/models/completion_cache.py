@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace and case so trivially different prompts share an entry"""
+    return ' '.join(prompt.split()).casefold()
+
+
+class CompletionCache:
+    """Bounded, thread-safe LRU cache of completions with a per-entry TTL.
+
+    With a shared store (SharedCompletionCache), local misses are looked up
+    there and every set is written through, so a completion fetched by one
+    worker process is served by all of them. Local hits never touch it.
+    Callers that must not block on the shared store (the event loop) use the
+    local and shared halves separately.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 3600.0, shared=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        self._lock = threading.Lock()
+        # key -> (expires_at, value), least recently used first
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(prompt: str, model: str, temperature: float, max_tokens: int,
+                 system_prompt: Optional[str] = None) -> Tuple:
+        return (normalize_prompt(prompt), model, float(temperature), int(max_tokens),
+                normalize_prompt(system_prompt) if system_prompt else None)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        value = self.get_local(key)
+        if value is None and self.shared is not None:
+            value = self.get_shared(key)
+        return value
+
+    def get_local(self, key: Hashable) -> Optional[Any]:
+        """In-process lookup only; never blocks on I/O"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+        return None
+
+    def get_shared(self, key: Hashable) -> Optional[Any]:
+        """Shared-store lookup (SQLite I/O); a hit is kept locally too"""
+        if self.shared is None:
+            return None
+        shared = self.shared.get(key)
+        if shared is None:
+            return None
+        value, expires_at = shared
+        # Keep it locally for the rest of its shared lifetime
+        self._set_local(key, value, expires_at - time.time())
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        self.set_local(key, value, ttl_seconds)
+        self.set_shared(key, value, ttl_seconds)
+
+    def set_local(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        self._set_local(key, value, self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+
+    def set_shared(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """Write through to the shared store (SQLite I/O), if there is one"""
+        if self.shared is not None:
+            self.shared.set(key, value, self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+
+    def _set_local(self, key: Hashable, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+        if self.shared is not None:
+            stats['shared'] = self.shared.stats()
+        return stats
@@ -0,0 +1,189 @@
+import json
+import logging
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+from agents.validator_agent import ValidatorAgent
+from config import GENERATION_BUDGETS_ENABLED, GENERATION_BUDGET_LOG_PATH
+from models.model_router import ModelRouter
+from services.instrumentation import record_file
+
+logger = logging.getLogger(__name__)
+
+# Rough sizes of model output in English: characters per token and per word (with the space), tokens per word
+CHARS_PER_TOKEN = 4
+CHARS_PER_WORD = 6
+TOKENS_PER_WORD = 1.35
+# max_tokens is this much above the word target, so the instruction ends the answer, not the cut-off
+TOKEN_HEADROOM = 1.5
+# Answers, and so max_tokens, stay within this fraction of the validator's maximum
+VALIDATOR_MARGIN = 0.9
+# An answer this close to max_tokens was most likely cut off
+TRUNCATION_RATIO = 0.95
+
+# Word target (for the oldest classes), temperature and length instruction per intent.
+# Quiz generation keeps the old fixed settings: its length follows the number of questions asked for.
+INTENT_BUDGETS = {
+    'arithmetic': {'words': 40, 'temperature': 0.2,
+                   'instruction': "Give the result with at most a line or two of working, in under {words} words."},
+    'definition': {'words': 90, 'temperature': 0.5,
+                   'instruction': "Give a short definition and one example, in under {words} words."},
+    'question': {'words': 160, 'temperature': 0.7,
+                 'instruction': "Answer in under {words} words."},
+    'explanation': {'words': 240, 'temperature': 0.7,
+                    'instruction': "Explain in short paragraphs, in under {words} words."},
+    'quiz': {'words': None, 'temperature': 0.7, 'max_tokens': 500, 'instruction': None},
+}
+# Intent assumed per endpoint when the question itself gives no stronger hint
+ENDPOINT_DEFAULT_INTENTS = {'explain': 'explanation'}
+# Younger classes get shorter answers: the word target is scaled by min(1, base + step * class number)
+CLASS_SCALE_BASE = 0.5
+CLASS_SCALE_STEP = 0.1
+MIN_WORDS = 25
+
+_ARITHMETIC_PATTERN = re.compile(
+    r"^\s*(?:what\s+is|what's|how\s+much\s+is|calculate|compute|solve|find)?\s*"
+    r"(?P<expression>[\d\s.,()+\-*/x×÷^=]+?)\s*[?.!]?\s*$", re.IGNORECASE)
+_OPERATION_PATTERN = re.compile(r'\d\s*[+\-*/x×÷^]\s*\d', re.IGNORECASE)
+_EXPLANATION_PATTERN = re.compile(r'\b(explain|describe|tell me about|elaborate)\b', re.IGNORECASE)
+
+
+def detect_intent(prompt: str, endpoint: Optional[str] = None) -> str:
+    """arithmetic, definition, explanation, quiz or question, from the wording of the prompt"""
+    match = _ARITHMETIC_PATTERN.match(prompt)
+    if match and _OPERATION_PATTERN.search(match.group('expression')):
+        return 'arithmetic'
+    intent = ModelRouter.features(prompt)['intent']
+    if intent == 'reasoning' or (intent == 'question' and _EXPLANATION_PATTERN.search(prompt)):
+        intent = 'explanation'
+    if intent == 'question':
+        intent = ENDPOINT_DEFAULT_INTENTS.get(endpoint, intent)
+    return intent
+
+
+class GenerationBudget:
+    """Output limits for one upstream call: max_tokens, temperature and the length instruction"""
+    __slots__ = ('endpoint', 'intent', 'class_number', 'words', 'max_tokens', 'temperature', 'instruction')
+
+    def __init__(self, endpoint: str, intent: str, class_number: Optional[int], words: Optional[int],
+                 max_tokens: int, temperature: float, instruction: Optional[str]):
+        self.endpoint = endpoint
+        self.intent = intent
+        self.class_number = class_number
+        self.words = words
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.instruction = instruction
+
+    def arguments(self, settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Generation arguments: settings (system_prompt, history, ...) with this budget's limits applied"""
+        arguments = dict(settings or {})
+        if self.instruction:
+            system_prompt = arguments.get('system_prompt')
+            arguments['system_prompt'] = f"{system_prompt} {self.instruction}" if system_prompt else self.instruction
+        arguments['max_tokens'] = self.max_tokens
+        arguments['temperature'] = self.temperature
+        return arguments
+
+
+class GenerationBudgetPolicy:
+    """Sizes each upstream call by endpoint, class level and intent.
+
+    Every answer used to be generated with max_tokens=500, and anything over
+    the validator's 2000 characters was thrown away after it had been paid
+    for. Here each intent has a word target, scaled down for younger classes,
+    that the model is asked to stay under; max_tokens leaves some headroom
+    above it and never allows more than the validator accepts. Short answers
+    finish sooner.
+
+    observe() compares each answer with its budget. The totals are in stats(),
+    and if GENERATION_BUDGET_LOG_PATH is set every answer is appended to that
+    file as a JSON line (by a background writer), so the targets can be
+    tuned against real usage.
+    """
+
+    def __init__(self, intents: Optional[Dict[str, Dict[str, Any]]] = None,
+                 max_chars: int = ValidatorAgent.MAX_LENGTH, log_path: Optional[str] = GENERATION_BUDGET_LOG_PATH,
+                 enabled: bool = GENERATION_BUDGETS_ENABLED):
+        self.intents = intents or INTENT_BUDGETS
+        self.max_chars = max_chars
+        self.log_path = log_path
+        self._log_file = record_file(log_path) if log_path else None
+        self.enabled = enabled
+        # No budget may allow an answer the validator would reject
+        self.max_tokens_ceiling = int(max_chars * VALIDATOR_MARGIN / CHARS_PER_TOKEN)
+        self.max_words_ceiling = int(max_chars * VALIDATOR_MARGIN / CHARS_PER_WORD)
+        self._lock = threading.Lock()
+        # (endpoint, intent) -> running totals
+        self._usage: Dict[tuple, Dict[str, int]] = defaultdict(
+            lambda: {'answers': 0, 'budget_tokens': 0, 'used_tokens': 0, 'truncated': 0, 'over_length': 0})
+
+    @staticmethod
+    def class_scale(class_number: Optional[int]) -> float:
+        if class_number is None:
+            return 1.0
+        return min(1.0, CLASS_SCALE_BASE + CLASS_SCALE_STEP * class_number)
+
+    def choose(self, endpoint: str, prompt: str, class_level: Optional[str] = None,
+               intent: Optional[str] = None) -> Optional[GenerationBudget]:
+        """Budget for this request, or None while budgets are disabled"""
+        if not self.enabled:
+            return None
+        intent = intent or detect_intent(prompt, endpoint)
+        class_number = ModelRouter.features('', class_level)['class_number']
+        spec = self.intents.get(intent) or self.intents['question']
+        if spec['words'] is None:
+            return GenerationBudget(endpoint, intent, class_number, None, spec['max_tokens'],
+                                    spec['temperature'], spec['instruction'])
+        words = max(int(spec['words'] * self.class_scale(class_number)), MIN_WORDS)
+        words = min(words, self.max_words_ceiling)
+        max_tokens = min(math.ceil(words * TOKENS_PER_WORD * TOKEN_HEADROOM), self.max_tokens_ceiling)
+        return GenerationBudget(endpoint, intent, class_number, words, max_tokens, spec['temperature'],
+                                spec['instruction'].format(words=words))
+
+    def observe(self, budget: Optional[GenerationBudget], text: Optional[str]) -> None:
+        """Record how much of its budget an answer used"""
+        if budget is None or not text:
+            return
+        used_tokens = len(text) // CHARS_PER_TOKEN + 1
+        truncated = used_tokens >= budget.max_tokens * TRUNCATION_RATIO
+        over_length = len(text) > self.max_chars
+        with self._lock:
+            usage = self._usage[(budget.endpoint, budget.intent)]
+            usage['answers'] += 1
+            usage['budget_tokens'] += budget.max_tokens
+            usage['used_tokens'] += used_tokens
+            usage['truncated'] += truncated
+            usage['over_length'] += over_length
+        logger.info(f"Generation budget {budget.endpoint}/{budget.intent}: ~{used_tokens} of {budget.max_tokens} "
+                    f"tokens, {len(text)} chars" + (" (truncated)" if truncated else ""))
+        if self._log_file is not None:
+            self._log_file.info(json.dumps({
+                'time': time.time(),
+                'endpoint': budget.endpoint,
+                'intent': budget.intent,
+                'class_number': budget.class_number,
+                'words_target': budget.words,
+                'words': len(text.split()),
+                'chars': len(text),
+                'max_tokens': budget.max_tokens,
+                'used_tokens': used_tokens,
+                'truncated': truncated,
+                'over_length': over_length,
+            }))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            usage = [
+                {'endpoint': endpoint, 'intent': intent, **totals}
+                for (endpoint, intent), totals in sorted(self._usage.items())
+            ]
+        return {
+            'enabled': self.enabled,
+            'max_tokens_ceiling': self.max_tokens_ceiling,
+            'usage': usage,
+        }
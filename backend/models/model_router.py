@@ -0,0 +1,164 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Optional
+
+from config import (MODEL_TIERS, MODEL_ROUTER_ENABLED, ENDPOINT_LATENCY_BUDGETS_MS, MODEL_ROUTER_LATENCY_WINDOW,
+                    MODEL_ROUTER_MIN_SAMPLES, MODEL_ROUTER_DECISIONS_PATH, SIMPLE_TASK_MODEL)
+from services.instrumentation import record_file
+
+logger = logging.getLogger(__name__)
+
+# Subjects where answers need multi-step reasoning more often than recall
+REASONING_SUBJECTS = frozenset(['mathematics', 'science', 'physics', 'chemistry', 'biology'])
+
+_QUIZ_PATTERN = re.compile(r'\b(quiz|mcq|multiple choice|test me|practice questions?)\b', re.IGNORECASE)
+_REASONING_PATTERN = re.compile(
+    r'\b(why|how does|how do|prove|derive|compare|difference between|step by step|solve|calculate)\b',
+    re.IGNORECASE)
+_DEFINITION_PATTERN = re.compile(r'^\s*(what is|what are|define|meaning of|who is|who was)\b', re.IGNORECASE)
+_CLASS_NUMBER = re.compile(r'\d+')
+
+# While the strong tier is over budget, every Nth fallback still goes to it,
+# so its p95 keeps being measured and the router notices when it recovers
+PROBE_EVERY = 20
+
+
+class ModelRouter:
+    """Chooses a model tier per request from cheap local features.
+
+    A complexity score built from prompt length, class level, subject and
+    intent (quiz, reasoning or definition) picks the 'fast' or 'strong'
+    tier. If the strong tier's observed p95 latency is over the endpoint's
+    budget, the request falls back to the fast tier (except for periodic
+    probes that keep the p95 current). Every decision is kept in a short
+    in-memory history and, if MODEL_ROUTER_DECISIONS_PATH is set, appended
+    to that file as JSON lines for tuning by a background writer.
+    """
+
+    def __init__(self, tiers: Optional[Dict[str, str]] = None,
+                 budgets_ms: Optional[Dict[str, float]] = None,
+                 window: int = MODEL_ROUTER_LATENCY_WINDOW,
+                 min_samples: int = MODEL_ROUTER_MIN_SAMPLES,
+                 decisions_path: Optional[str] = MODEL_ROUTER_DECISIONS_PATH,
+                 enabled: bool = MODEL_ROUTER_ENABLED):
+        self.tiers = tiers or MODEL_TIERS
+        self.budgets_ms = budgets_ms or ENDPOINT_LATENCY_BUDGETS_MS
+        self.window = window
+        self.min_samples = min_samples
+        self.decisions_path = decisions_path
+        self._decisions_file = record_file(decisions_path) if decisions_path else None
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self.recent_decisions: Deque[Dict[str, Any]] = deque(maxlen=200)
+        self.decision_counts: Counter = Counter()
+        self._fallbacks = 0
+
+    @staticmethod
+    def features(prompt: str, class_level: Optional[str] = None, subject: Optional[str] = None,
+                 intent: Optional[str] = None) -> Dict[str, Any]:
+        """Routing features; intent is inferred from the prompt unless given"""
+        if intent is None:
+            if _QUIZ_PATTERN.search(prompt):
+                intent = 'quiz'
+            elif _REASONING_PATTERN.search(prompt):
+                intent = 'reasoning'
+            elif _DEFINITION_PATTERN.search(prompt):
+                intent = 'definition'
+            else:
+                intent = 'question'
+        class_number = _CLASS_NUMBER.search(str(class_level or ''))
+        return {
+            'words': len(prompt.split()),
+            'class_number': int(class_number.group()) if class_number else None,
+            'subject': (subject or '').lower() or None,
+            'intent': intent,
+        }
+
+    @staticmethod
+    def complexity(features: Dict[str, Any]) -> int:
+        score = 0
+        if features['words'] > 120:
+            score += 2
+        elif features['words'] > 40:
+            score += 1
+        if features['class_number'] is not None and features['class_number'] >= 4:
+            score += 1
+        if features['subject'] in REASONING_SUBJECTS:
+            score += 1
+        score += {'quiz': 1, 'reasoning': 1, 'definition': -1}.get(features['intent'], 0)
+        return score
+
+    def observe(self, model: str, seconds: float) -> None:
+        """Record how long a completed upstream call took"""
+        with self._lock:
+            samples = self._latencies.get(model)
+            if samples is None:
+                samples = self._latencies[model] = deque(maxlen=self.window)
+            samples.append(seconds * 1000)
+
+    def p95_ms(self, model: str) -> Optional[float]:
+        """Observed p95 latency of model in ms, or None until min_samples calls have completed"""
+        with self._lock:
+            samples = sorted(self._latencies.get(model, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def choose(self, endpoint: str, prompt: str, class_level: Optional[str] = None,
+               subject: Optional[str] = None, intent: Optional[str] = None,
+               default: str = SIMPLE_TASK_MODEL, record: bool = True) -> str:
+        """Model to use for this request; record=False leaves it out of the decision log and counts"""
+        if not self.enabled:
+            return default
+        features = self.features(prompt, class_level, subject, intent)
+        score = self.complexity(features)
+        tier = 'strong' if score >= 2 else 'fast'
+        reason = 'complexity'
+        budget = self.budgets_ms.get(endpoint)
+        p95 = self.p95_ms(self.tiers['strong'])
+        if tier == 'strong' and budget is not None and p95 is not None and p95 > budget:
+            with self._lock:
+                self._fallbacks += 1
+                probe = self._fallbacks % PROBE_EVERY == 0
+            if probe:
+                reason = 'probe'
+            else:
+                tier = 'fast'
+                reason = 'strong_p95_over_budget'
+        model = self.tiers[tier]
+        if not record:
+            return model
+        self._record({
+            'time': time.time(),
+            'endpoint': endpoint,
+            'features': features,
+            'score': score,
+            'tier': tier,
+            'model': model,
+            'reason': reason,
+            'budget_ms': budget,
+            'strong_p95_ms': p95,
+        })
+        return model
+
+    def _record(self, decision: Dict[str, Any]) -> None:
+        with self._lock:
+            self.recent_decisions.append(decision)
+            self.decision_counts[(decision['endpoint'], decision['tier'], decision['reason'])] += 1
+        if self._decisions_file is not None:
+            self._decisions_file.info(json.dumps(decision, ensure_ascii=False))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'p95_ms': {tier: self.p95_ms(model) for tier, model in self.tiers.items()},
+            'decisions': [
+                {'endpoint': endpoint, 'tier': tier, 'reason': reason, 'count': count}
+                for (endpoint, tier, reason), count in sorted(self.decision_counts.items())
+            ],
+        }
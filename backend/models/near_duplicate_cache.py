@@ -0,0 +1,214 @@
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+# Words that frame a question rather than say what it is about
+QUESTION_STOPWORDS = frozenset("""
+a an and are as at be by can could define definition describe do does explain for from give how i in is
+it me mean meaning means my of on or please show tell that the this to understand us we what whats
+when where which who why with you your
+""".split())
+
+# What a question asks for. The words are dropped from the shingles (they frame every question),
+# but two questions only match if they ask for the same kind of answer
+QUESTION_WORDS = {'what': 'what', 'whats': 'what', 'where': 'where', 'when': 'when', 'who': 'who',
+                  'whom': 'who', 'whose': 'who', 'which': 'which', 'why': 'why', 'how': 'how'}
+# A question opening with one of these (and no question word) asks yes or no
+YES_NO_OPENERS = frozenset("am are can could did do does has have is may should was were will would".split())
+
+# Words and symbols that say what to do with the numbers in a question. They are kept as terms,
+# and two questions only match if their numbers and these appear in the same order
+ARITHMETIC_WORDS = frozenset("""
+plus minus times x multiplied divided over squared cubed power root percent sum difference product quotient
+""".split())
+_TOKEN = re.compile(r'\w+|[+\-*/×÷^=<>%√]')
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def tokenize(question: str) -> List[str]:
+    """Casefolded words and arithmetic symbols, in order"""
+    return _TOKEN.findall(unicodedata.normalize('NFKC', question).casefold().replace('\u2212', '-'))
+
+
+def is_arithmetic(term: str) -> bool:
+    return term.isdigit() or term in ARITHMETIC_WORDS or not term.isalnum()
+
+
+def question_terms(question: str) -> List[str]:
+    """Content words and arithmetic symbols of a question: framing words dropped, plural 's' stripped"""
+    words = tokenize(question)
+    terms = []
+    for word in words:
+        if word in QUESTION_STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss') and word not in ARITHMETIC_WORDS:
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def question_kind(question: str) -> str:
+    """The first question word ('what', 'why', ...), else 'yes/no' or, for requests (define, explain), 'what'"""
+    words = re.findall(r'\w+', unicodedata.normalize('NFKC', question).casefold())
+    for word in words:
+        if word in QUESTION_WORDS:
+            return QUESTION_WORDS[word]
+    if words and words[0] in YES_NO_OPENERS:
+        return 'yes/no'
+    return 'what'
+
+
+def shingles(terms: List[str]) -> List[str]:
+    """Word unigrams and bigrams, so word order matters a little but not much"""
+    return terms + [f"{a} {b}" for a, b in zip(terms, terms[1:])]
+
+
+class NearDuplicateCache:
+    """Serves answers to questions that are worded differently but mean the same.
+
+    Questions are reduced to MinHash signatures over word shingles and
+    indexed in an LSH band table, so a lookup only compares against the few
+    stored questions that share a band instead of scanning them all. Entries
+    are scoped (e.g. by board/class/subject and generation settings): a
+    question only matches earlier questions with the same scope, and only if
+    both ask the same kind of question (what, where, why, how, yes/no, ...)
+    and have the same numbers and operators in the same order ("5+3" never
+    answers "5-3"). Oldest entries are overwritten first.
+    """
+
+    def __init__(self, max_entries: int = 100000, threshold: float = 0.7, num_perm: int = 64,
+                 bands: int = 16, ttl_seconds: float = 3600.0, max_bucket: int = 64, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.ttl_seconds = ttl_seconds
+        self.max_bucket = max_bucket
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 31, num_perm).astype(np.uint64)
+        self._b = rng.randint(0, 1 << 31, num_perm).astype(np.uint64)
+
+        self._lock = threading.Lock()
+        self._signatures = np.zeros((min(max_entries, 1024), num_perm), np.uint32)
+        self._scopes: List[Hashable] = []
+        # (question kind, numbers and operators) of each entry; must be equal for a match
+        self._exact: List[Tuple[str, Tuple[str, ...]]] = []
+        self._answers: List[Any] = []
+        self._expires: List[float] = []
+        self._next_slot = 0
+        # band key -> slots, oldest first
+        self._buckets: Dict[int, List[int]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def signature(self, question: str) -> Optional[Tuple[np.ndarray, Tuple[str, Tuple[str, ...]]]]:
+        """MinHash signature, and the question kind and arithmetic (numbers and operators, in order)
+        that a match must share; None if the question has no content words"""
+        terms = question_terms(question)
+        if not terms:
+            return None
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in set(shingles(terms))), np.uint64)
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % _MERSENNE_PRIME
+        signature = (permuted.min(axis=1) & _MAX_HASH).astype(np.uint32)
+        return signature, (question_kind(question), tuple(term for term in terms if is_arithmetic(term)))
+
+    @staticmethod
+    def make_scope(scope: Hashable, model: str, temperature: float, max_tokens: int,
+                   system_prompt: Optional[str] = None) -> Tuple:
+        """Scope plus the generation settings, which change the answer as much as the question does"""
+        return (scope, model, float(temperature), int(max_tokens), system_prompt)
+
+    def _band_keys(self, scope: Hashable, signature: np.ndarray) -> List[int]:
+        rows = self.rows
+        return [hash((scope, band, signature[band * rows:(band + 1) * rows].tobytes()))
+                for band in range(self.bands)]
+
+    def get(self, question: str, scope: Hashable = None) -> Optional[Any]:
+        """The stored answer for the most similar earlier question in scope, or None"""
+        computed = self.signature(question)
+        if computed is None:
+            return None
+        signature, exact = computed
+        now = time.monotonic()
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(scope, signature):
+                candidates.update(self._buckets.get(key, ()))
+            candidates = [slot for slot in candidates
+                          if self._scopes[slot] == scope and self._exact[slot] == exact
+                          and self._expires[slot] > now]
+            if candidates:
+                similarity = (self._signatures[candidates] == signature).mean(axis=1)
+                best = int(similarity.argmax())
+                if similarity[best] >= self.threshold:
+                    self.hits += 1
+                    return self._answers[candidates[best]]
+            self.misses += 1
+            return None
+
+    def set(self, question: str, answer: Any, scope: Hashable = None) -> None:
+        computed = self.signature(question)
+        if computed is None:
+            return
+        signature, exact = computed
+        with self._lock:
+            slot = self._next_slot
+            self._next_slot = (slot + 1) % self.max_entries
+            if slot < len(self._answers):
+                self._unindex(slot)
+            else:
+                if slot >= len(self._signatures):
+                    grown = np.zeros((min(len(self._signatures) * 2, self.max_entries), self.num_perm),
+                                     np.uint32)
+                    grown[:len(self._signatures)] = self._signatures
+                    self._signatures = grown
+                self._scopes.append(None)
+                self._exact.append(('', ()))
+                self._answers.append(None)
+                self._expires.append(0.0)
+
+            self._signatures[slot] = signature
+            self._scopes[slot] = scope
+            self._exact[slot] = exact
+            self._answers[slot] = answer
+            self._expires[slot] = time.monotonic() + self.ttl_seconds
+            for key in self._band_keys(scope, signature):
+                bucket = self._buckets.setdefault(key, [])
+                bucket.append(slot)
+                if len(bucket) > self.max_bucket:
+                    del bucket[0]
+
+    def _unindex(self, slot: int) -> None:
+        for key in self._band_keys(self._scopes[slot], self._signatures[slot]):
+            bucket = self._buckets.get(key)
+            if bucket and slot in bucket:
+                bucket.remove(slot)
+                if not bucket:
+                    del self._buckets[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._scopes, self._exact, self._answers, self._expires = [], [], [], []
+            self._buckets.clear()
+            self._next_slot = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'size': len(self._answers),
+                'max_entries': self.max_entries,
+                'threshold': self.threshold,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
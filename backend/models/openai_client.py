@@ -1,29 +1,365 @@
-from openai import OpenAI
-from config import SIMPLE_TASK_MODEL, OPENAI_API_KEY
+import httpx
+from openai import OpenAI, OpenAIError
+from config import (SIMPLE_TASK_MODEL, OPENAI_API_KEY, COMPLETION_CACHE_ENABLED,
+                    COMPLETION_CACHE_MAX_ENTRIES, COMPLETION_CACHE_TTL_SECONDS,
+                    SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS, NEAR_DUPLICATE_CACHE_ENABLED,
+                    NEAR_DUPLICATE_MAX_ENTRIES, NEAR_DUPLICATE_THRESHOLD, UPSTREAM_TIMEOUT_SECONDS,
+                    UPSTREAM_MAX_CONNECTIONS, UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+                    UPSTREAM_KEEPALIVE_EXPIRY_SECONDS, UPSTREAM_CONNECT_TIMEOUT_SECONDS,
+                    UPSTREAM_MAX_ATTEMPTS, UPSTREAM_RETRY_BASE_DELAY_SECONDS, UPSTREAM_RETRY_MAX_DELAY_SECONDS,
+                    CIRCUIT_BREAKER_FAILURE_THRESHOLD, CIRCUIT_BREAKER_RESET_SECONDS,
+                    UPSTREAM_HEDGING_ENABLED, UPSTREAM_HEDGE_MIN_DELAY_SECONDS, ADMISSION_CONTROL_ENABLED,
+                    UPSTREAM_TOKENS_PER_MINUTE, UPSTREAM_REQUESTS_PER_MINUTE, ADMISSION_WORKER_PROCESSES,
+                    ADMISSION_UTILIZATION, ADMISSION_BURST_SECONDS, STUDENT_TOKENS_PER_MINUTE,
+                    ADMISSION_QUEUE_TIMEOUTS_SECONDS, SHARED_CACHE_ENABLED, SHARED_CACHE_PATH,
+                    SHARED_CACHE_MAX_ENTRIES, SHARED_CACHE_MAX_MB)
+from models.admission import AdmissionController, estimate_tokens
+from models.completion_cache import CompletionCache
+from models.near_duplicate_cache import NearDuplicateCache
+from models.shared_cache import SharedCompletionCache
+from models.single_flight import SingleFlight
+from models.model_router import ModelRouter
+from models.resilience import CircuitBreaker, CircuitOpenError, HedgeStats, RetryPolicy, hedged_call
+from services.instrumentation import LOOKUP, QUEUE, UPSTREAM, record_upstream_call, stage
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import sqlite3
+import time
 
 logger = logging.getLogger(__name__)
 
+
+class CompletionStream:
+    """Iterates over the text deltas of a streamed completion.
+
+    Once iteration finishes, text holds the full answer and usage the token
+    counts reported by the upstream (None if it did not report any).
+    on_complete(text, usage, complete) runs exactly once when the stream ends,
+    whether it was exhausted, failed or closed early; complete is False
+    unless the upstream finished the answer.
+    """
+
+    def __init__(self, response=None, text=None, on_complete=None):
+        self._response = response
+        self._on_complete = on_complete
+        self.cached = response is None
+        self._parts = [text] if text else []
+        self.usage = None
+        self.finish_reason = None
+        self._closed = False
+
+    def __iter__(self):
+        if self._response is None:
+            if self._parts:
+                yield self._parts[0]
+            return
+
+        try:
+            for chunk in self._response:
+                usage = getattr(chunk, 'usage', None)
+                if usage:
+                    self.usage = {
+                        'prompt_tokens': usage.prompt_tokens,
+                        'completion_tokens': usage.completion_tokens,
+                        'total_tokens': usage.total_tokens,
+                    }
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.finish_reason:
+                    self.finish_reason = choice.finish_reason
+                if choice.delta.content:
+                    self._parts.append(choice.delta.content)
+                    yield choice.delta.content
+        finally:
+            self.close()
+
+    @property
+    def text(self):
+        """Text received so far (the full answer once iteration has finished)"""
+        return ''.join(self._parts)
+
+    def close(self):
+        """Stop reading, release the upstream connection and settle the call"""
+        if self._closed or self._response is None:
+            return
+        self._closed = True
+        try:
+            close = getattr(self._response, 'close', None) or self._response.response.close
+            close()
+        finally:
+            if self._on_complete:
+                self._on_complete(self.text, self.usage, self.finish_reason is not None)
+
+
+def chat_messages(prompt, system_prompt=None, history=None):
+    """Messages for a completion: the system prompt, earlier turns of a conversation, then prompt"""
+    messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+    if history:
+        messages.extend(history)
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+
+def upstream_limits() -> httpx.Limits:
+    """Connection pool limits shared by the sync and async clients"""
+    return httpx.Limits(max_connections=UPSTREAM_MAX_CONNECTIONS,
+                        max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY_SECONDS)
+
+
+def upstream_timeout() -> httpx.Timeout:
+    return httpx.Timeout(UPSTREAM_TIMEOUT_SECONDS, connect=UPSTREAM_CONNECT_TIMEOUT_SECONDS)
+
+
+def admission_controller() -> AdmissionController:
+    """Admission control for this process's share of the upstream rate limits"""
+    return AdmissionController(tokens_per_minute=UPSTREAM_TOKENS_PER_MINUTE / ADMISSION_WORKER_PROCESSES,
+                               requests_per_minute=UPSTREAM_REQUESTS_PER_MINUTE / ADMISSION_WORKER_PROCESSES,
+                               student_tokens_per_minute=STUDENT_TOKENS_PER_MINUTE,
+                               queue_timeouts=ADMISSION_QUEUE_TIMEOUTS_SECONDS,
+                               utilization=ADMISSION_UTILIZATION, burst_seconds=ADMISSION_BURST_SECONDS,
+                               enabled=ADMISSION_CONTROL_ENABLED)
+
+
+def shared_completion_cache():
+    """The host-wide completion store under this process's cache, or None when disabled or unavailable"""
+    if not (SHARED_CACHE_ENABLED and COMPLETION_CACHE_ENABLED):
+        return None
+    try:
+        return SharedCompletionCache(SHARED_CACHE_PATH, max_entries=SHARED_CACHE_MAX_ENTRIES,
+                                     max_bytes=int(SHARED_CACHE_MAX_MB * 1024 * 1024))
+    except sqlite3.Error as e:
+        logger.error(f"Shared completion cache unavailable, caching per process: {str(e)}")
+        return None
+
+
+def settle_completion(ticket, response, max_tokens: int) -> None:
+    """Settle a completion's reservation with its reported usage; a failed call keeps only its prompt's share"""
+    if response is None:
+        ticket.settle(ticket.cost - max_tokens)
+    else:
+        ticket.settle(response.usage.total_tokens if response.usage else None)
+
+
+def hedge_delay(router: ModelRouter, model: str):
+    """Seconds before a duplicate request is fired, or None when hedging is off or p95 is unknown"""
+    if not UPSTREAM_HEDGING_ENABLED:
+        return None
+    p95 = router.p95_ms(model)
+    if p95 is None:
+        return None
+    return max(p95 / 1000, UPSTREAM_HEDGE_MIN_DELAY_SECONDS)
+
+
 class OpenAIClient:
+    """The application's single upstream client.
+
+    One keep-alive connection pool is shared by all threads. Every call has a
+    deadline of UPSTREAM_TIMEOUT_SECONDS, retries transient failures (connection
+    errors, 429, 5xx) with jittered exponential backoff inside it, and fails
+    fast with CircuitOpenError while the upstream is unhealthy. Non-streaming
+    calls can be hedged (UPSTREAM_HEDGING_ENABLED). Calls that reach the
+    upstream first pass admission control (priority queue plus global and
+    per-student token buckets) and may be rejected with AdmissionRejected.
+    """
+
     def __init__(self):
-        # Initialize the OpenAI client with the API key
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        # Retries are ours (RetryPolicy), so the SDK's own are turned off
+        self.client = OpenAI(api_key=OPENAI_API_KEY, max_retries=0,
+                             http_client=httpx.Client(limits=upstream_limits(), timeout=upstream_timeout()))
+        self.breaker = CircuitBreaker(failure_threshold=CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                                      reset_timeout=CIRCUIT_BREAKER_RESET_SECONDS)
+        self.admission = admission_controller()
+        self.retry = RetryPolicy(self.breaker, max_attempts=UPSTREAM_MAX_ATTEMPTS,
+                                 base_delay=UPSTREAM_RETRY_BASE_DELAY_SECONDS,
+                                 max_delay=UPSTREAM_RETRY_MAX_DELAY_SECONDS,
+                                 on_throttled=self.admission.upstream_throttled)
+        self.hedges = HedgeStats()
+        self._hedge_executor = ThreadPoolExecutor(max_workers=UPSTREAM_MAX_CONNECTIONS,
+                                                  thread_name_prefix='openai-hedge')
+        # Cache of completions for repeated prompts, backed by the store shared with the other workers
+        self.cache = CompletionCache(max_entries=COMPLETION_CACHE_MAX_ENTRIES,
+                                     ttl_seconds=COMPLETION_CACHE_TTL_SECONDS, shared=shared_completion_cache())
+        # Answers to earlier questions worded differently
+        self.near_duplicates = NearDuplicateCache(max_entries=NEAR_DUPLICATE_MAX_ENTRIES,
+                                                  threshold=NEAR_DUPLICATE_THRESHOLD,
+                                                  ttl_seconds=COMPLETION_CACHE_TTL_SECONDS)
+        # Identical concurrent requests share one upstream call
+        self.inflight = SingleFlight()
+        # Picks a model tier per request; fed with observed call latencies
+        self.router = ModelRouter()
         logger.info("OpenAI client initialized")
 
-    def generate(self, prompt, model=None):
+    def upstream_stats(self):
+        return {
+            'circuit_breaker': self.breaker.stats(),
+            'retries': self.retry.retries,
+            'hedges': self.hedges.stats(),
+            'admission': self.admission.stats(),
+        }
+
+    def _near_duplicate_scope(self, scope, cache_enabled, model, temperature, max_tokens, system_prompt):
+        """Scope key for the near-duplicate stage, or None when it does not apply"""
+        # Requests without any curriculum scope (anonymous one-off questions) never share answers
+        if not (scope and any(scope)) or not (cache_enabled and NEAR_DUPLICATE_CACHE_ENABLED):
+            return None
+        return self.near_duplicates.make_scope(scope, model, temperature, max_tokens, system_prompt)
+
+    def generate(self, prompt, model=None, system_prompt=None, temperature=0.7,
+                 max_tokens=500, use_cache=True, scope=None, priority='standard', student=None,
+                 history=None):
+        """Complete prompt. Pass a scope (e.g. (board, class, subject)) to also
+        answer from earlier questions in that scope worded differently.
+        priority and student place the upstream call in the admission queue.
+        history holds earlier turns of a conversation (role/content dicts);
+        answers that depend on one are neither cached nor coalesced."""
         if model is None:
             model = SIMPLE_TASK_MODEL
+        # use_cache=False opts out of both shared answers and coalescing
+        cache_enabled = use_cache and COMPLETION_CACHE_ENABLED and not history
+        cache_key = self.cache.make_key(prompt, model, temperature, max_tokens, system_prompt)
+        if cache_enabled:
+            with stage(LOOKUP):
+                cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Completion cache hit for model: {model}")
+                return cached
+        near_scope = self._near_duplicate_scope(scope, cache_enabled, model, temperature, max_tokens,
+                                                system_prompt)
+        if near_scope is not None:
+            with stage(LOOKUP):
+                similar = self.near_duplicates.get(prompt, near_scope)
+            if similar is not None:
+                logger.info(f"Near-duplicate cache hit for model: {model}")
+                return similar
+
+        messages = chat_messages(prompt, system_prompt, history)
+        cost = estimate_tokens(prompt, system_prompt, max_tokens, history)
+        if not use_cache or history:
+            return self._complete(model, messages, temperature, max_tokens, self._admit(cost, priority, student))
+
+        def fetch():
+            # Only the caller that reaches the upstream is admitted; coalesced callers wait on it
+            content = self._complete(model, messages, temperature, max_tokens,
+                                     self._admit(cost, priority, student))
+            if cache_enabled and content:
+                self.cache.set(cache_key, content)
+                if near_scope is not None:
+                    self.near_duplicates.set(prompt, content, near_scope)
+            return content
+
+        return self.inflight.do(cache_key, fetch, timeout=SINGLE_FLIGHT_WAIT_TIMEOUT_SECONDS)
+
+    def generate_stream(self, prompt, model=None, system_prompt=None, temperature=0.7,
+                        max_tokens=500, use_cache=True, scope=None, priority='standard', student=None,
+                        history=None):
+        """Like generate, but returns a CompletionStream of text deltas.
+
+        Cached answers are replayed as a single delta. Streams read and fill
+        the completion cache but are not coalesced with other requests. The
+        admission ticket is settled when the stream ends, even if the caller
+        stops reading early.
+        """
+        if model is None:
+            model = SIMPLE_TASK_MODEL
+        cache_enabled = use_cache and COMPLETION_CACHE_ENABLED and not history
+        cache_key = self.cache.make_key(prompt, model, temperature, max_tokens, system_prompt)
+        if cache_enabled:
+            with stage(LOOKUP):
+                cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Completion cache hit for model: {model}")
+                return CompletionStream(text=cached)
+        near_scope = self._near_duplicate_scope(scope, cache_enabled, model, temperature, max_tokens,
+                                                system_prompt)
+        if near_scope is not None:
+            with stage(LOOKUP):
+                similar = self.near_duplicates.get(prompt, near_scope)
+            if similar is not None:
+                logger.info(f"Near-duplicate cache hit for model: {model}")
+                return CompletionStream(text=similar)
+
+        messages = chat_messages(prompt, system_prompt, history)
+        cost = estimate_tokens(prompt, system_prompt, max_tokens, history)
+        ticket = self._admit(cost, priority, student)
+        started = time.monotonic()
+        response = None
+        try:
+            logger.info(f"Streaming response with model: {model}")
+            with stage(UPSTREAM):
+                response = self.retry.call(lambda remaining: self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    # Ask for a final usage chunk; passed raw for older SDK versions
+                    extra_body={"stream_options": {"include_usage": True}},
+                    timeout=remaining
+                ), started + UPSTREAM_TIMEOUT_SECONDS)
+        except (OpenAIError, CircuitOpenError) as e:
+            logger.error(f"Error in OpenAI API call: {str(e)}")
+            raise
+        except Exception as e:
+            logger.error(f"Error in OpenAI API call: {str(e)}")
+            raise Exception(f"OpenAI API error: {str(e)}")
+        finally:
+            if response is None:
+                # The stream never started: keep only the prompt's share of the reservation
+                ticket.settle(cost - max_tokens)
+
+        def on_complete(text, usage, complete):
+            elapsed = time.monotonic() - started
+            self.router.observe(model, elapsed)
+            record_upstream_call(model, 'stream' if complete else 'stream_cancelled', elapsed, usage)
+            ticket.settle(usage['total_tokens'] if usage else cost - max_tokens + len(text) // 4)
+            # A cancelled or failed stream leaves a partial answer that must not be shared
+            if complete and cache_enabled and text:
+                self.cache.set(cache_key, text)
+                if near_scope is not None:
+                    self.near_duplicates.set(prompt, text, near_scope)
+
+        return CompletionStream(response=response, on_complete=on_complete)
+
+    def _admit(self, cost, priority, student):
+        with stage(QUEUE):
+            return self.admission.acquire(cost, priority, student)
+
+    def _create(self, model, messages, temperature, max_tokens, timeout):
+        started = time.monotonic()
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=timeout
+        )
+        self.router.observe(model, time.monotonic() - started)
+        return response
+
+    def _complete(self, model, messages, temperature, max_tokens, ticket):
+        started = time.monotonic()
+        deadline = started + UPSTREAM_TIMEOUT_SECONDS
+        delay = hedge_delay(self.router, model)
+        response = None
+
+        def attempt(remaining):
+            return hedged_call(lambda: self._create(model, messages, temperature, max_tokens, remaining),
+                               delay, self._hedge_executor, self.hedges)
+
         try:
             logger.info(f"Generating response with model: {model}")
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=500
-            )
+            with stage(UPSTREAM):
+                response = self.retry.call(attempt, deadline)
+            record_upstream_call(model, 'complete', time.monotonic() - started, response.usage)
             return response.choices[0].message.content
+        except (OpenAIError, CircuitOpenError) as e:
+            # Keep the OpenAI error type so callers can map it to a status code
+            logger.error(f"Error in OpenAI API call: {str(e)}")
+            raise
         except Exception as e:
             logger.error(f"Error in OpenAI API call: {str(e)}")
             raise Exception(f"OpenAI API error: {str(e)}")
+        finally:
+            settle_completion(ticket, response, max_tokens)
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, TimeoutError as FutureTimeout, wait
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the upstream while the circuit breaker is open"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Fails fast after repeated upstream failures.
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    raise CircuitOpenError immediately. Once reset_timeout has passed, one
+    trial call is let through (half-open): success closes the circuit,
+    failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half_open'
+            return 'open'
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            waited = time.monotonic() - self._opened_at
+            if waited >= self.reset_timeout and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            retry_after = max(self.reset_timeout - waited, 1.0)
+        raise CircuitOpenError("OpenAI API is unavailable, failing fast", retry_after)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def abandon_trial(self) -> None:
+        """The half-open trial call ended without an answer either way (e.g. it was cancelled)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    self.times_opened += 1
+                    logger.warning(f"Circuit breaker opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {'state': self.state, 'consecutive_failures': self._failures,
+                'times_opened': self.times_opened}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Connection problems, timeouts, 429s and 5xx are worth retrying; other errors are not"""
+    # Imported here so that importing CircuitOpenError does not load the SDK
+    import openai
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_after(error: BaseException) -> float:
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers.get('retry-after', 0)) if response is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class RetryPolicy:
+    """Jittered exponential backoff under an overall deadline, guarded by a circuit breaker"""
+
+    def __init__(self, breaker: CircuitBreaker, max_attempts: int = 3, base_delay: float = 0.5,
+                 max_delay: float = 8.0, on_throttled: Optional[Callable[[float], None]] = None):
+        self.breaker = breaker
+        # Called with the Retry-After seconds whenever the upstream answers 429
+        self.on_throttled = on_throttled
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+
+    def _next_delay(self, error: BaseException, attempt: int, deadline: float) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None if the error should be raised"""
+        if not is_retryable(error):
+            # The upstream answered, so it is healthy even if the request was bad
+            self.breaker.record_success()
+            return None
+        self.breaker.record_failure()
+        from openai import RateLimitError
+        if self.on_throttled is not None and isinstance(error, RateLimitError):
+            self.on_throttled(_retry_after(error))
+        if attempt >= self.max_attempts:
+            return None
+        # Full jitter keeps retrying clients from synchronizing; honour the server's Retry-After
+        delay = max(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))),
+                    _retry_after(error))
+        if time.monotonic() + delay >= deadline:
+            return None
+        self.retries += 1
+        logger.warning(f"Retrying OpenAI call in {delay:.2f}s after: {str(error)}")
+        return delay
+
+    def call(self, fn: Callable[[float], Any], deadline: float) -> Any:
+        """Call fn(remaining_seconds) until it succeeds, fails permanently or the deadline passes"""
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            attempt += 1
+            try:
+                result = fn(max(deadline - time.monotonic(), 0.001))
+            except Exception as e:
+                delay = self._next_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.abandon_trial()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def acall(self, fn: Callable[[float], Awaitable[Any]], deadline: float) -> Any:
+        """Async counterpart of call"""
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            attempt += 1
+            try:
+                result = await fn(max(deadline - time.monotonic(), 0.001))
+            except Exception as e:
+                delay = self._next_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.abandon_trial()
+                raise
+            self.breaker.record_success()
+            return result
+
+
+class HedgeStats:
+    def __init__(self):
+        self.fired = 0
+        self.won = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {'fired': self.fired, 'won': self.won}
+
+
+def hedged_call(fn: Callable[[], Any], hedge_delay: Optional[float], executor: Executor,
+                stats: HedgeStats) -> Any:
+    """Run fn; if it has not finished after hedge_delay, start a duplicate and return whichever succeeds first"""
+    if hedge_delay is None:
+        return fn()
+    first = executor.submit(fn)
+    try:
+        return first.result(timeout=hedge_delay)
+    except FutureTimeout:
+        pass
+    stats.fired += 1
+    second = executor.submit(fn)
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is second:
+                    stats.won += 1
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+async def ahedged_call(fn: Callable[[], Awaitable[Any]], hedge_delay: Optional[float],
+                       stats: HedgeStats) -> Any:
+    """Async counterpart of hedged_call; the losing request is cancelled"""
+    if hedge_delay is None:
+        return await fn()
+    first = asyncio.ensure_future(fn())
+    done, _ = await asyncio.wait({first}, timeout=hedge_delay)
+    if done:
+        return first.result()
+    stats.fired += 1
+    second = asyncio.ensure_future(fn())
+    pending = {first, second}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        stats.won += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,29 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class ExplanationRequest(BaseModel):
+    topic: str
+    question: str
+    student_id: Optional[str] = None
+
+
+class ProgressData(BaseModel):
+    student_id: str
+    board: str
+    class_level: str
+    subject: str
+    topic: str
+    understanding_level: int  # 1-5 scale
+    questions_asked: int
+    time_spent: int  # in minutes
+
+
+class ChatRequest(BaseModel):
+    message: str
+    studentId: str = None
+    board: str = None
+    classLevel: str = None
+    subject: str = None
+    skipValidation: bool = False
@@ -0,0 +1,215 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS completions (
+    key BLOB PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    last_used REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS completions_by_last_used ON completions (last_used);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals (id, entries, bytes) VALUES (0, 0, 0);
+CREATE TRIGGER IF NOT EXISTS completions_added AFTER INSERT ON completions BEGIN
+    UPDATE totals SET entries = entries + 1, bytes = bytes + new.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS completions_removed AFTER DELETE ON completions BEGIN
+    UPDATE totals SET entries = entries - 1, bytes = bytes - old.size WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS completions_resized AFTER UPDATE OF size ON completions BEGIN
+    UPDATE totals SET bytes = bytes + new.size - old.size WHERE id = 0;
+END;
+"""
+
+UPSERT_COMPLETION = """
+INSERT INTO completions (key, value, size, expires_at, last_used) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    value = excluded.value,
+    size = excluded.size,
+    expires_at = excluded.expires_at,
+    last_used = excluded.last_used
+"""
+
+# Value encoding: one codec byte, then UTF-8 text, zlib-compressed when that makes it smaller
+_RAW = 0
+_ZLIB = 1
+COMPRESS_MIN_BYTES = 256
+# Per-row overhead counted against max_bytes (key, timestamps, b-tree cells)
+ROW_OVERHEAD_BYTES = 64
+# Eviction brings entries and bytes down to this fraction of their limits, so it does not run on every write
+EVICT_TO = 0.9
+
+
+def encode_value(text: str) -> bytes:
+    data = text.encode('utf-8')
+    if len(data) >= COMPRESS_MIN_BYTES:
+        packed = zlib.compress(data, 6)
+        if len(packed) < len(data):
+            return bytes((_ZLIB,)) + packed
+    return bytes((_RAW,)) + data
+
+
+def decode_value(blob: bytes) -> str:
+    if blob[0] == _ZLIB:
+        return zlib.decompress(blob[1:]).decode('utf-8')
+    return blob[1:].decode('utf-8')
+
+
+def digest_key(key: Hashable) -> bytes:
+    """16-byte key for a CompletionCache key tuple; the same in every process"""
+    return hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).digest()
+
+
+class SharedCompletionCache:
+    """Completions shared by every worker process on a host, in one SQLite file (WAL mode).
+
+    Readers never block each other or the writer; writes are short IMMEDIATE
+    transactions, so concurrent workers serialize on SQLite's file lock.
+    Values are stored compressed under a digest of the cache key, with a
+    wall-clock expiry. Entry count and bytes are kept in a totals row by
+    triggers, and a write that takes the store over max_entries or max_bytes
+    evicts expired entries, then the least recently used, until both are
+    back under 90% of their limit. Reads
+    refresh an entry's last use at most once per touch_interval seconds, so
+    hits rarely write.
+
+    This is a cache: a busy or broken file counts as a miss, never as an error.
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 200000, max_bytes: int = 256 * 1024 * 1024,
+                 touch_interval: float = 60.0, busy_timeout: float = 2.0):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def get(self, key: Hashable) -> Optional[Tuple[str, float]]:
+        """(value, expires_at as time.time()) or None"""
+        digest = digest_key(key)
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute("SELECT value, expires_at, last_used FROM completions WHERE key = ?",
+                               (digest,)).fetchone()
+            if row is None or row[1] <= now:
+                self._count('misses')
+                return None
+            if now - row[2] > self.touch_interval:
+                conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (now, digest))
+            value = decode_value(row[0])
+        except (sqlite3.Error, zlib.error, UnicodeDecodeError) as e:
+            logger.warning(f"Shared completion cache read failed: {str(e)}")
+            self._count('errors')
+            return None
+        self._count('hits')
+        return value, row[1]
+
+    def set(self, key: Hashable, value: str, ttl_seconds: float) -> None:
+        blob = encode_value(value)
+        now = time.time()
+        conn = self._connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(UPSERT_COMPLETION, (digest_key(key), blob, len(blob) + ROW_OVERHEAD_BYTES,
+                                                 now + ttl_seconds, now))
+                entries, size = conn.execute("SELECT entries, bytes FROM totals WHERE id = 0").fetchone()
+                evicted = 0
+                if entries > self.max_entries or size > self.max_bytes:
+                    evicted = self._evict(conn, now)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"Shared completion cache write failed: {str(e)}")
+            self._count('errors')
+            return
+        self._count('writes')
+        if evicted:
+            self._count('evictions', evicted)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> int:
+        """Delete expired entries, then the least recently used, until entries and bytes are under EVICT_TO"""
+        evicted = conn.execute("DELETE FROM completions WHERE expires_at <= ?", (now,)).rowcount
+        max_entries, max_bytes = int(self.max_entries * EVICT_TO), int(self.max_bytes * EVICT_TO)
+        while True:
+            entries, size = conn.execute("SELECT entries, bytes FROM totals WHERE id = 0").fetchone()
+            if entries <= max_entries and size <= max_bytes:
+                return evicted
+            # Rows over the entry target, or the rows of average size that hold the excess bytes
+            over_bytes = -(-(size - max_bytes) * entries // size) if size > max_bytes else 0
+            batch = max(entries - max_entries, over_bytes, 1)
+            deleted = conn.execute(
+                "DELETE FROM completions WHERE key IN "
+                "(SELECT key FROM completions ORDER BY last_used LIMIT ?)", (batch,)).rowcount
+            if not deleted:
+                return evicted
+            evicted += deleted
+
+    def clear(self) -> None:
+        try:
+            self._connection().execute("DELETE FROM completions")
+        except sqlite3.Error as e:
+            logger.warning(f"Shared completion cache clear failed: {str(e)}")
+
+    def close(self) -> None:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            entries, size = self._connection().execute("SELECT entries, bytes FROM totals WHERE id = 0").fetchone()
+        except sqlite3.Error:
+            entries, size = None, None
+        with self._lock:
+            return {
+                'entries': entries,
+                'bytes': size,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'writes': self.writes,
+                'evictions': self.evictions,
+                'errors': self.errors,
+            }
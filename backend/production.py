@@ -1,8 +1,157 @@
-from waitress import serve
-from app import app
+"""Production server.
+
+SERVER_MODE=wsgi serves the Flask app with waitress, SERVER_MODE=asgi serves
+asgi.py with uvicorn; WEB_CONCURRENCY sets the number of worker processes.
+
+With several workers (on platforms with fork), the parent imports the app,
+loads the read-only components (reference data, curriculum catalog and index, search
+index) once and then forks the workers, which share those pages
+copy-on-write and inherit one listening socket. Each worker builds its own
+clients, stores and background threads; /api/ready answers 503 until that
+warm-up has finished. Workers that die are restarted.
+"""
+import gc
+import logging
 import os
+import signal
+import socket
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for workers to exit after SIGTERM before killing them
+WORKER_SHUTDOWN_SECONDS = 30
+# Minimum seconds between restarts of crashed workers
+WORKER_RESTART_DELAY_SECONDS = 1.0
+
+
+def listen(port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("0.0.0.0", port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def serve_wsgi(sock: socket.socket) -> None:
+    from waitress import serve
+    from app import create_app
+    from services.startup import startup
+
+    startup.start()
+    serve(create_app(), sockets=[sock], threads=int(os.environ.get("WSGI_THREADS", 4)))
+
+
+def serve_asgi(sock: socket.socket) -> None:
+    # Async serving path: LLM routes run on asyncio, the rest on the mounted Flask app
+    import uvicorn
+    from asgi import app
+
+    uvicorn.Server(uvicorn.Config(app)).run(sockets=[sock])
+
+
+def preload(server_mode: str) -> None:
+    """Import the app and build the fork-safe components in the parent, before forking"""
+    if server_mode == "asgi":
+        import asgi  # noqa: F401  (FastAPI and the OpenAI SDK, shared with the workers)
+    else:
+        import app  # noqa: F401
+    from services.startup import startup
+
+    startup.preload()
+    # Keep the preloaded objects out of the collector's reach: collections would touch
+    # (and so copy) their pages in every worker
+    gc.freeze()
+
+
+def run_worker(serve, sock: socket.socket) -> None:
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    status = 0
+    try:
+        serve(sock)
+    except BaseException:
+        logger.exception("Worker crashed")
+        status = 1
+    finally:
+        logging.shutdown()
+        os._exit(status)
+
+
+def prefork(serve, sock: socket.socket, workers: int) -> None:
+    """Fork the workers and keep that many running until SIGTERM or SIGINT"""
+    children = set()
+    stopping = []
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            run_worker(serve, sock)
+        children.add(pid)
+
+    def stop(signum, frame):
+        if not stopping:
+            logger.info(f"Stopping {len(children)} workers")
+            stopping.append(time.monotonic())
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    logger.info(f"Started {workers} workers (parent pid {os.getpid()})")
+
+    last_restart = 0.0
+    while children:
+        if stopping and time.monotonic() - stopping[0] > WORKER_SHUTDOWN_SECONDS:
+            for pid in list(children):
+                os.kill(pid, signal.SIGKILL)
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(0.2)
+            continue
+        children.discard(pid)
+        if stopping:
+            continue
+        logger.warning(f"Worker {pid} exited with status {status}; restarting it")
+        time.sleep(max(0.0, last_restart + WORKER_RESTART_DELAY_SECONDS - time.monotonic()))
+        last_restart = time.monotonic()
+        spawn()
+
+
+def main() -> None:
+    port = int(os.environ.get("PORT", 4000))
+    server_mode = os.environ.get("SERVER_MODE", "wsgi").lower()
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    serve = serve_asgi if server_mode == "asgi" else serve_wsgi
+    logging.basicConfig(level=logging.INFO)
+
+    if workers > 1 and not hasattr(os, "fork"):
+        if server_mode == "asgi":
+            # No fork (Windows): uvicorn spawns the workers, each loading everything itself
+            import uvicorn
+            uvicorn.run("asgi:app", host="0.0.0.0", port=port, workers=workers)
+            return
+        logger.warning("WEB_CONCURRENCY > 1 needs fork(); serving from a single process")
+        workers = 1
+
+    sock = listen(port)
+    if workers > 1:
+        preload(server_mode)
+        prefork(serve, sock, workers)
+        sys.exit(0)
+    serve(sock)
+
 
 if __name__ == "__main__":
     # Production server configuration
-    port = int(os.environ.get("PORT", 4000))
-    serve(app, host="0.0.0.0", port=port, threads=4)
+    main()
@@ -0,0 +1,146 @@
+import json
+import logging
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EXPLANATION = 'explanation'
+QUIZ = 'quiz'
+
+# The opening requests the frontend sends for a topic (ConceptAgent and QuizAgent)
+_EXPLANATION_REQUEST = re.compile(r'^\s*explain the concept of\s+(.+?)\s*[.?!]?\s*$', re.IGNORECASE | re.DOTALL)
+_QUIZ_REQUEST = re.compile(r'^\s*generate a (?:simple )?quiz about\s+(.+?)\s+for\s+.+?\s+level\b',
+                           re.IGNORECASE | re.DOTALL)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    kind TEXT NOT NULL,
+    board TEXT NOT NULL,
+    class_level TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    topic TEXT NOT NULL COLLATE NOCASE,
+    content TEXT NOT NULL,
+    valid INTEGER NOT NULL,
+    validation TEXT,
+    fingerprint TEXT NOT NULL,
+    model TEXT,
+    generated_at TEXT,
+    PRIMARY KEY (kind, board, class_level, subject, topic)
+);
+"""
+
+UPSERT_ANSWER = """
+INSERT INTO answers
+    (kind, board, class_level, subject, topic, content, valid, validation, fingerprint, model, generated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (kind, board, class_level, subject, topic) DO UPDATE SET
+    content = excluded.content,
+    valid = excluded.valid,
+    validation = excluded.validation,
+    fingerprint = excluded.fingerprint,
+    model = excluded.model,
+    generated_at = excluded.generated_at
+"""
+
+TopicKey = Tuple[str, str, str, str]
+
+
+def match_precomputed(message: str) -> Optional[Tuple[str, str]]:
+    """(kind, topic) if message is one of the standard per-topic requests, else None"""
+    match = _EXPLANATION_REQUEST.match(message or '')
+    if match:
+        return EXPLANATION, match.group(1)
+    match = _QUIZ_REQUEST.match(message or '')
+    if match:
+        return QUIZ, match.group(1)
+    return None
+
+
+class AnswerStore:
+    """Explanations and quizzes generated ahead of time, per (board, class, subject, topic).
+
+    Filled by `python -m services.precompute` and read by the serving path
+    before it calls the model. Each row keeps the fingerprint of the prompt
+    and generation settings it was made with, so the pipeline can tell which
+    topics are new or changed. Only rows that passed validation are served.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def get(self, kind: str, board: str, class_level: str, subject: str, topic: str) -> Optional[Dict[str, Any]]:
+        """The stored answer if it passed validation, else None"""
+        row = self._connection().execute(
+            "SELECT content, validation, model, generated_at FROM answers "
+            "WHERE kind = ? AND board = ? AND class_level = ? AND subject = ? AND topic = ? AND valid = 1",
+            (kind, board, class_level, subject, topic)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {
+            'content': row[0],
+            'validation': json.loads(row[1]) if row[1] else None,
+            'model': row[2],
+            'generated_at': row[3],
+        }
+
+    def put(self, kind: str, key: TopicKey, content: str, validation: Dict[str, Any], fingerprint: str,
+            model: Optional[str] = None) -> None:
+        """Store one answer; committed immediately so an interrupted run keeps its progress"""
+        board, class_level, subject, topic = key
+        self._connection().execute(UPSERT_ANSWER, (
+            kind, board, class_level, subject, topic, content, int(bool(validation.get('is_valid'))),
+            json.dumps(validation, ensure_ascii=False), fingerprint, model, datetime.now().isoformat()))
+
+    def fingerprints(self, kind: str) -> Dict[TopicKey, Tuple[str, bool]]:
+        """(fingerprint, valid) of every stored answer of this kind"""
+        rows = self._connection().execute(
+            "SELECT board, class_level, subject, topic, fingerprint, valid FROM answers WHERE kind = ?", (kind,))
+        return {(board, class_level, subject, topic): (fingerprint, bool(valid))
+                for board, class_level, subject, topic, fingerprint, valid in rows}
+
+    def prune(self, kind: str, keep: Iterable[TopicKey]) -> int:
+        """Delete answers for topics no longer in the curriculum; returns how many were deleted"""
+        keep = {(board, class_level, subject, topic.casefold()) for board, class_level, subject, topic in keep}
+        stale = [key for key in self.fingerprints(kind)
+                 if (key[0], key[1], key[2], key[3].casefold()) not in keep]
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "DELETE FROM answers WHERE kind = ? AND board = ? AND class_level = ? AND subject = ? AND topic = ?",
+                [(kind,) + key for key in stale])
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        counts = self._connection().execute(
+            "SELECT kind, SUM(valid), COUNT(*) FROM answers GROUP BY kind").fetchall()
+        return {
+            'answers': {kind: {'valid': valid, 'total': total} for kind, valid, total in counts},
+            'hits': self.hits,
+            'misses': self.misses,
+        }
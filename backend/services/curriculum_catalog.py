@@ -0,0 +1,101 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SUBJECTS_FILE_SUFFIX = '-SUBJECTS.json'
+
+
+class CatalogEntry:
+    """Subjects for one (board, class) with its pre-serialized JSON and ETag"""
+
+    __slots__ = ('board', 'class_name', 'subjects', 'subjects_json', 'etag')
+
+    def __init__(self, board: str, class_name: str, subjects: Dict[str, List[str]]):
+        self.board = board
+        self.class_name = class_name
+        self.subjects = subjects
+        # Same key order as jsonify, so the wire format is unchanged
+        self.subjects_json = json.dumps(subjects, sort_keys=True, ensure_ascii=False,
+                                        separators=(',', ':')).encode('utf-8')
+        self.etag = hashlib.sha256(self.subjects_json).hexdigest()[:32]
+
+    def etag_for(self, logged_in_as: str) -> str:
+        """ETag of the response body, which also carries the caller's identity"""
+        return f"{self.etag}-{zlib.crc32(logged_in_as.encode('utf-8')):08x}"
+
+    def response_body(self, logged_in_as: str) -> bytes:
+        """Body of the /api/subjects response without re-serializing the subjects"""
+        return (b'{"logged_in_as":' + json.dumps(logged_in_as, ensure_ascii=False).encode('utf-8')
+                + b',"subjects":' + self.subjects_json + b'}\n')
+
+
+class CurriculumCatalog:
+    """Parsed and indexed view of every {board}-SUBJECTS.json file.
+
+    Each file is read once; lookups by (board, class) are dict hits. Boards
+    without a subjects file are filled in from the compiled curriculum index
+    (services.curriculum_index), when one is given.
+    Call reload() after editing the curriculum files.
+    """
+
+    def __init__(self, data_dir: str, index=None):
+        self.data_dir = data_dir
+        self.index = index
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], CatalogEntry] = {}
+        self._classes: Dict[str, List[str]] = {}
+        self.reload()
+
+    def _load_board(self, board: str, path: str, entries, classes) -> None:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        classes[board] = [item.get('class') for item in data]
+        for item in data:
+            key = (board, item.get('class'))
+            # The first entry wins, matching the old linear scan
+            if key not in entries:
+                entries[key] = CatalogEntry(board, item.get('class'), item.get('subjects', {}))
+
+    def _load_index(self, entries, classes) -> None:
+        """Add the boards the subjects files do not cover from the index's rows"""
+        subjects: Dict[Tuple[str, str], Dict[str, List[str]]] = {}
+        for board, class_name, subject, topic in self.index.rows():
+            if board in classes:
+                continue
+            subjects.setdefault((board, class_name), {}).setdefault(subject, []).append(topic)
+        for (board, class_name), class_subjects in subjects.items():
+            classes.setdefault(board, []).append(class_name)
+            entries[(board, class_name)] = CatalogEntry(board, class_name, class_subjects)
+
+    def reload(self) -> None:
+        """Re-read all subjects files and atomically swap in the new index"""
+        entries: Dict[Tuple[str, str], CatalogEntry] = {}
+        classes: Dict[str, List[str]] = {}
+        for path in sorted(glob.glob(os.path.join(self.data_dir, '*' + SUBJECTS_FILE_SUFFIX))):
+            board = os.path.basename(path)[:-len(SUBJECTS_FILE_SUFFIX)]
+            try:
+                self._load_board(board, path, entries, classes)
+            except (OSError, ValueError) as e:
+                logger.error(f"Error loading {os.path.basename(path)}: {str(e)}")
+        if self.index is not None:
+            self._load_index(entries, classes)
+        with self._lock:
+            self._entries = entries
+            self._classes = classes
+        logger.info(f"Loaded curriculum catalog: {len(classes)} boards, {len(entries)} classes")
+
+    def has_board(self, board: str) -> bool:
+        return board in self._classes
+
+    def available_classes(self, board: str) -> List[str]:
+        return self._classes.get(board, [])
+
+    def get(self, board: str, class_name: str) -> Optional[CatalogEntry]:
+        return self._entries.get((board, class_name))
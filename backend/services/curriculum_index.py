@@ -0,0 +1,483 @@
+"""Compiled curriculum catalog for every board, stored as one memory-mapped file.
+
+Build offline (from the backend directory), or let the app build it on first start:
+
+    python -m services.curriculum_index build
+    python -m services.curriculum_index query "frac" --board CBSE --class-level "Class 2"
+
+The curriculum comes in three overlapping shapes: {board}-SUBJECTS.json
+(class -> subject -> topics), per-board files like CBSE.json (subject ->
+class -> topics) and rawSubjectsData.json (subject -> board -> class ->
+topics, all boards). They are merged into (board, class, subject, topic)
+rows with integer IDs; a topic listed by several files is kept once.
+
+The file is a JSON header (board, class and subject labels, section
+offsets, source file stamps) followed by flat little-endian arrays: the
+rows, the topic names sorted by their normalized form (a topic's ID is its
+position, so a name prefix is one contiguous ID range found by binary
+search, like a flattened trie), the rows of each topic, and a sorted token
+table with the topics each token occurs in. Lookups read the arrays
+straight out of the mmap; nothing is parsed per query.
+"""
+import argparse
+import bisect
+import glob
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'EDUCURR\x01'
+PREFIX = struct.Struct('<8sQ')
+ALIGNMENT = 8
+
+SUBJECTS_FILE_SUFFIX = '-SUBJECTS.json'
+RAW_SUBJECTS_FILE = 'rawSubjectsData.json'
+BOARDS_FILE = 'boards.json'
+# Sorts after every UTF-8 encoded string that starts with a given prefix
+_PREFIX_END = b'\xff'
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; combining marks stay inside words so Indic scripts tokenize whole"""
+    text = unicodedata.normalize('NFKC', text or '').casefold()
+    tokens, current = [], []
+    for char in text:
+        if char.isalnum() or unicodedata.category(char).startswith('M'):
+            current.append(char)
+        elif current:
+            tokens.append(''.join(current))
+            current = []
+    if current:
+        tokens.append(''.join(current))
+    return tokens
+
+
+def normalize_topic(text: str) -> str:
+    """Case-, spacing- and punctuation-insensitive form of a topic name"""
+    return ' '.join(tokenize(text))
+
+
+def _read_json(path: str):
+    """Read a JSON file, ignoring trailing junk after the first value (e.g. a stray ';')"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    value, _ = json.JSONDecoder().raw_decode(content.lstrip())
+    return value
+
+
+def source_files(data_dir: str) -> List[str]:
+    """Curriculum files the index is compiled from, in merge order (the serving files first)"""
+    paths = sorted(glob.glob(os.path.join(data_dir, '*' + SUBJECTS_FILE_SUFFIX)))
+    for path in sorted(glob.glob(os.path.join(data_dir, '*.json'))):
+        name = os.path.basename(path)[:-len('.json')]
+        # Per-board files are named after the board: CBSE.json, not boards.json or CBSE-CLASS.json
+        if name.lower() != name and '-' not in name and name != RAW_SUBJECTS_FILE[:-len('.json')]:
+            paths.append(path)
+    paths.append(os.path.join(data_dir, RAW_SUBJECTS_FILE))
+    return [path for path in paths if os.path.exists(path) and os.path.getsize(path) > 0]
+
+
+def source_stamps(data_dir: str) -> Dict[str, List[int]]:
+    """(mtime_ns, size) of each source file, to tell when the compiled index is stale"""
+    stamps = {}
+    for path in source_files(data_dir) + [os.path.join(data_dir, BOARDS_FILE)]:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            stamps[os.path.basename(path)] = [stat.st_mtime_ns, stat.st_size]
+    return stamps
+
+
+def _file_rows(path: str) -> Iterator[Tuple[str, str, str, str]]:
+    name = os.path.basename(path)
+    data = _read_json(path)
+    if name == RAW_SUBJECTS_FILE:
+        return ((board, class_level, subject, topic)
+                for subject, boards in data.items()
+                for board, classes in boards.items()
+                for class_level, topics in classes.items()
+                for topic in topics)
+    if name.endswith(SUBJECTS_FILE_SUFFIX):
+        board = name[:-len(SUBJECTS_FILE_SUFFIX)]
+        return ((board, item.get('class'), subject, topic)
+                for item in data
+                for subject, topics in item.get('subjects', {}).items()
+                for topic in topics)
+    board = name[:-len('.json')]
+    return ((board, item.get('class'), subject, topic)
+            for subject, classes in data.items()
+            for item in classes
+            for topic in item.get('topics', []))
+
+
+def curriculum_rows(data_dir: str) -> List[Tuple[str, str, str, str]]:
+    """Distinct (board, class, subject, topic) rows across the curriculum files, in first-seen order"""
+    rows, seen = [], set()
+    for path in source_files(data_dir):
+        try:
+            for board, class_level, subject, topic in _file_rows(path):
+                if not (board and class_level and subject and topic):
+                    continue
+                board, class_level, subject, topic = (' '.join(str(value).split())
+                                                      for value in (board, class_level, subject, topic))
+                key = (board, class_level, subject, normalize_topic(topic))
+                if key not in seen:
+                    seen.add(key)
+                    rows.append((board, class_level, subject, topic))
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            logger.error(f"Error compiling {os.path.basename(path)}: {str(e)}")
+    return rows
+
+
+def _board_order(data_dir: str) -> List[str]:
+    path = os.path.join(data_dir, BOARDS_FILE)
+    try:
+        return [board['NAME'] for board in sorted(_read_json(path), key=lambda board: board['ID'])]
+    except (OSError, ValueError, KeyError, TypeError):
+        return []
+
+
+def _string_table(values: List[bytes]) -> Tuple[array, bytes]:
+    offsets = array('I', [0])
+    for value in values:
+        offsets.append(offsets[-1] + len(value))
+    return offsets, b''.join(values)
+
+
+def _posting_table(lists: List[List[int]]) -> Tuple[array, array]:
+    offsets, values = array('I', [0]), array('I')
+    for items in lists:
+        values.extend(items)
+        offsets.append(len(values))
+    return offsets, values
+
+
+def write_index(path: str, data_dir: str) -> Dict[str, int]:
+    """Compile the curriculum under data_dir into an index file, replacing path atomically"""
+    stamps = source_stamps(data_dir)
+    rows = curriculum_rows(data_dir)
+    labels: Dict[str, Dict[str, int]] = {'boards': {}, 'classes': {}, 'subjects': {}}
+    for board in _board_order(data_dir):
+        labels['boards'].setdefault(board, len(labels['boards']))
+    for board, class_level, subject, _ in rows:
+        labels['boards'].setdefault(board, len(labels['boards']))
+        labels['classes'].setdefault(class_level, len(labels['classes']))
+        labels['subjects'].setdefault(subject, len(labels['subjects']))
+
+    # Topic IDs follow the byte order of the normalized names, so a name prefix is an ID range
+    names: Dict[bytes, str] = {}
+    for _, _, _, topic in rows:
+        names.setdefault(normalize_topic(topic).encode('utf-8'), topic)
+    keys = sorted(names)
+    topic_ids = {key: topic_id for topic_id, key in enumerate(keys)}
+
+    # Rows grouped by board, class and subject; topics keep their curriculum order within a subject
+    coded = sorted(((labels['boards'][board], labels['classes'][class_level], labels['subjects'][subject], order,
+                     topic_ids[normalize_topic(topic).encode('utf-8')])
+                    for order, (board, class_level, subject, topic) in enumerate(rows)),
+                   key=lambda row: row[:4])
+    topic_rows: List[List[int]] = [[] for _ in keys]
+    for row_id, row in enumerate(coded):
+        topic_rows[row[4]].append(row_id)
+
+    token_topics: Dict[bytes, List[int]] = {}
+    for topic_id, key in enumerate(keys):
+        for token in dict.fromkeys(key.split(b' ')):
+            token_topics.setdefault(token, []).append(topic_id)
+    tokens = sorted(token_topics)
+
+    key_offsets, key_blob = _string_table(keys)
+    name_offsets, name_blob = _string_table([names[key].encode('utf-8') for key in keys])
+    topic_row_offsets, topic_row_ids = _posting_table(topic_rows)
+    token_offsets, token_blob = _string_table(tokens)
+    token_topic_offsets, token_topic_ids = _posting_table([token_topics[token] for token in tokens])
+    sections_data = [
+        ('row_board', array('H', (row[0] for row in coded))),
+        ('row_class', array('H', (row[1] for row in coded))),
+        ('row_subject', array('H', (row[2] for row in coded))),
+        ('row_topic', array('I', (row[4] for row in coded))),
+        ('topic_key_offsets', key_offsets),
+        ('topic_keys', key_blob),
+        ('topic_name_offsets', name_offsets),
+        ('topic_names', name_blob),
+        ('topic_row_offsets', topic_row_offsets),
+        ('topic_rows', topic_row_ids),
+        ('token_offsets', token_offsets),
+        ('tokens', token_blob),
+        ('token_topic_offsets', token_topic_offsets),
+        ('token_topics', token_topic_ids),
+    ]
+    sections, blobs, offset = {}, [], 0
+    for name, data in sections_data:
+        if isinstance(data, array):
+            typecode, count = data.typecode, len(data)
+            if sys.byteorder != 'little':
+                data = array(typecode, data)
+                data.byteswap()
+            data = data.tobytes()
+        else:
+            typecode, count = 'B', len(data)
+        sections[name] = [offset, typecode, count]
+        blobs.append(data + b'\0' * (-len(data) % ALIGNMENT))
+        offset += len(blobs[-1])
+
+    counts = {'boards': len(labels['boards']), 'classes': len(labels['classes']),
+              'subjects': len(labels['subjects']), 'topics': len(keys), 'rows': len(coded), 'tokens': len(tokens)}
+    header = json.dumps({
+        'built_at': time.time(),
+        'sources': stamps,
+        'counts': counts,
+        'labels': {field: list(values) for field, values in labels.items()},
+        'sections': sections,
+    }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    header += b' ' * (-(PREFIX.size + len(header)) % ALIGNMENT)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
+    logger.info(f"Wrote curriculum index {path}: {counts['boards']} boards, {counts['topics']} topics, "
+                f"{counts['rows']} rows, {counts['tokens']} tokens")
+    return counts
+
+
+class _StringTable:
+    """Sorted UTF-8 strings in the mmap, indexable (and so bisectable) without decoding them all"""
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> bytes:
+        return bytes(self._blob[self._offsets[i]:self._offsets[i + 1]])
+
+    def prefix_range(self, prefix: bytes) -> Tuple[int, int]:
+        """[lo, hi) of the strings starting with prefix"""
+        return bisect.bisect_left(self, prefix), bisect.bisect_left(self, prefix + _PREFIX_END)
+
+    def find(self, value: bytes) -> Optional[int]:
+        i = bisect.bisect_left(self, value)
+        return i if i < len(self) and self[i] == value else None
+
+
+class CurriculumIndex:
+    """Read-only view of a compiled curriculum index file.
+
+    Boards, classes and subjects are small label lists from the header;
+    topics, rows and the token table stay in the mmap, which every worker
+    process forked after opening it shares.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a curriculum index file")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _, header_len = PREFIX.unpack_from(self._map)
+        header = json.loads(self._map[PREFIX.size:PREFIX.size + header_len])
+        base = PREFIX.size + header_len
+
+        self.sources: Dict[str, List[int]] = header['sources']
+        self.counts: Dict[str, int] = header['counts']
+        self.boards: List[str] = header['labels']['boards']
+        self.classes: List[str] = header['labels']['classes']
+        self.subjects: List[str] = header['labels']['subjects']
+        self._ids = {field: {label: i for i, label in enumerate(header['labels'][field])}
+                     for field in ('boards', 'classes', 'subjects')}
+        self._view = memoryview(self._map)
+        self._arrays: Dict[str, Any] = {}
+        for name, (offset, typecode, count) in header['sections'].items():
+            itemsize = 1 if typecode == 'B' else array(typecode).itemsize
+            view = self._view[base + offset:base + offset + count * itemsize]
+            if typecode != 'B':
+                if sys.byteorder == 'little':
+                    view = view.cast(typecode)
+                else:
+                    view = array(typecode, view.tobytes())
+                    view.byteswap()
+            self._arrays[name] = view
+        a = self._arrays
+        self._topic_keys = _StringTable(a['topic_key_offsets'], a['topic_keys'])
+        self._topic_names = _StringTable(a['topic_name_offsets'], a['topic_names'])
+        self._tokens = _StringTable(a['token_offsets'], a['tokens'])
+        self.searches = 0
+
+    @classmethod
+    def build(cls, path: str, data_dir: str) -> 'CurriculumIndex':
+        write_index(path, data_dir)
+        return cls(path)
+
+    @classmethod
+    def open(cls, path: str, data_dir: str) -> 'CurriculumIndex':
+        """Open the index at path, compiling it first if it is missing or older than the curriculum files"""
+        if os.path.exists(path):
+            try:
+                index = cls(path)
+                if index.sources == source_stamps(data_dir):
+                    return index
+                index.close()
+                logger.info("Curriculum files changed, recompiling the curriculum index")
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Unreadable curriculum index, recompiling: {str(e)}")
+        return cls.build(path, data_dir)
+
+    def __len__(self) -> int:
+        return self.counts['topics']
+
+    def topic_name(self, topic_id: int) -> str:
+        return self._topic_names[topic_id].decode('utf-8')
+
+    def _row(self, row_id: int) -> Tuple[int, int, int, int]:
+        a = self._arrays
+        return a['row_board'][row_id], a['row_class'][row_id], a['row_subject'][row_id], a['row_topic'][row_id]
+
+    def rows(self) -> Iterator[Tuple[str, str, str, str]]:
+        """Every (board, class, subject, topic), grouped by board, class and subject"""
+        for row_id in range(self.counts['rows']):
+            board, class_id, subject, topic_id = self._row(row_id)
+            yield self.boards[board], self.classes[class_id], self.subjects[subject], self.topic_name(topic_id)
+
+    def placements(self, topic_id: int, board: Optional[int] = None, class_id: Optional[int] = None,
+                   subject: Optional[int] = None) -> List[Dict[str, str]]:
+        """Where a topic is taught, optionally restricted to a board, class and subject ID"""
+        offsets = self._arrays['topic_row_offsets']
+        found = []
+        for row_id in self._arrays['topic_rows'][offsets[topic_id]:offsets[topic_id + 1]]:
+            row_board, row_class, row_subject, _ = self._row(row_id)
+            if ((board is None or row_board == board) and (class_id is None or row_class == class_id)
+                    and (subject is None or row_subject == subject)):
+                found.append({'board': self.boards[row_board], 'classLevel': self.classes[row_class],
+                              'subject': self.subjects[row_subject]})
+        return found
+
+    def _token_topics(self, lo: int, hi: int) -> Iterable[int]:
+        """Topics containing any of the tokens lo..hi-1"""
+        offsets = self._arrays['token_topic_offsets']
+        return self._arrays['token_topics'][offsets[lo]:offsets[hi]]
+
+    def search(self, query: str, limit: int = 10, board: Optional[str] = None, class_level: Optional[str] = None,
+               subject: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Topics matching query as you type, with where each is taught.
+
+        Topics whose name starts with the query come first, then topics
+        containing every query word, the last one possibly unfinished
+        ("add frac" finds "Adding Fractions"). Filters are exact labels;
+        an unknown label matches nothing.
+        """
+        with self._lock:
+            self.searches += 1
+        terms = tokenize(query)
+        if not terms or limit <= 0:
+            return []
+        filters = []
+        for field, value in (('boards', board), ('classes', class_level), ('subjects', subject)):
+            if value:
+                label_id = self._ids[field].get(value)
+                if label_id is None:
+                    return []
+                filters.append(label_id)
+            else:
+                filters.append(None)
+        encoded = [term.encode('utf-8') for term in terms]
+        # A query ending in a space or punctuation has a finished last word
+        last_complete = not (query[-1:].isalnum() or unicodedata.category(query[-1:] or ' ').startswith('M'))
+
+        results, seen = [], set()
+
+        def add(topic_id) -> bool:
+            if topic_id in seen:
+                return False
+            seen.add(topic_id)
+            placements = self.placements(topic_id, *filters)
+            if placements:
+                results.append({'id': topic_id, 'topic': self.topic_name(topic_id), 'placements': placements})
+            return len(results) >= limit
+
+        # 1. Name prefix: one ID range, starting with the exact name if there is one
+        lo, hi = self._topic_keys.prefix_range(b' '.join(encoded))
+        for topic_id in range(lo, hi):
+            if add(topic_id):
+                return results
+
+        # 2. Every word, in any position; the last word may be a prefix
+        candidates = None
+        for i, term in enumerate(encoded):
+            if i < len(encoded) - 1 or last_complete:
+                token = self._tokens.find(term)
+                topics = set() if token is None else set(self._token_topics(token, token + 1))
+            else:
+                lo, hi = self._tokens.prefix_range(term)
+                topics = set(self._token_topics(lo, hi))
+            candidates = topics if candidates is None else candidates & topics
+            if not candidates:
+                return results
+        for topic_id in sorted(candidates):
+            if add(topic_id):
+                break
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            searches = self.searches
+        return {**self.counts, 'bytes': len(self._map), 'searches': searches}
+
+    def close(self) -> None:
+        # Release the views into the mmap before unmapping it
+        self._topic_keys = self._topic_names = self._tokens = None
+        for view in self._arrays.values():
+            if isinstance(view, memoryview):
+                view.release()
+        self._arrays = {}
+        self._view.release()
+        self._map.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from config import CURRICULUM_INDEX_PATH, CURRICULUM_DATA_DIR
+
+    parser = argparse.ArgumentParser(description="Compile or query the curriculum index")
+    parser.add_argument('--index', default=CURRICULUM_INDEX_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="compile the index from the curriculum files")
+    build.add_argument('--data-dir', default=CURRICULUM_DATA_DIR)
+    query = commands.add_parser('query', help="print the topics matching a query")
+    query.add_argument('text')
+    query.add_argument('--limit', type=int, default=10)
+    query.add_argument('--board')
+    query.add_argument('--class-level')
+    query.add_argument('--subject')
+    commands.add_parser('stats', help="print the index's counts")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'build':
+        CurriculumIndex.build(args.index, args.data_dir).close()
+        return
+    index = CurriculumIndex(args.index)
+    if args.command == 'stats':
+        print(json.dumps(index.stats()))
+    else:
+        for hit in index.search(args.text, args.limit, args.board, args.class_level, args.subject):
+            print(json.dumps(hit, ensure_ascii=False))
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,383 @@
+"""Request instrumentation: per-stage timings, upstream usage and Prometheus text.
+
+Each request gets a RequestTimer; code wraps its stages (JSON parse, data
+lookup, admission queue, upstream call, validation, serialization) in
+`with stage(...)`, and when the request ends the per-stage totals are
+recorded in fixed-bucket histograms. Gauges that already live elsewhere
+(cache hit counters, queue depths) are read by collectors only when
+/api/metrics is scraped, so the request path pays for none of them.
+
+Metrics are per process: with several workers, each one reports its own.
+
+configure_logging() routes log records through a queue to a listener
+thread, so a slow stream or file never blocks a request thread;
+record_file() does the same for the JSON-lines logs kept for tuning.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Seconds; covers sub-millisecond parsing up to a full-length upstream call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Stages a request's time is split into
+PARSE = 'parse'
+LOOKUP = 'lookup'
+QUEUE = 'queue'
+UPSTREAM = 'upstream'
+VALIDATION = 'validation'
+SERIALIZE = 'serialize'
+
+# (labels, value) samples of one metric, as returned by collectors
+Samples = Iterable[Tuple[Dict[str, Any], float]]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and three additions under a lock"""
+    __slots__ = ('bounds', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, bounds: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class MetricFamily:
+    """A named metric with one child (Counter or Histogram) per label combination"""
+
+    def __init__(self, name: str, help_text: str, kind: str, label_names: Tuple[str, ...],
+                 factory: Callable[[], Any]):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.label_names = label_names
+        self._factory = factory
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: Any):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._factory())
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, child in children:
+            labels = dict(zip(self.label_names, key))
+            if self.kind == 'counter':
+                lines.append(f"{self.name}{_format_labels(labels)} {_format_value(child.value)}")
+                continue
+            counts, total, count = child.snapshot()
+            cumulative = 0
+            for bound, bucket in zip(child.bounds + (float('inf'),), counts):
+                cumulative += bucket
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(float(bound))})} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metrics recorded in-process plus collectors that read existing stats at scrape time"""
+
+    def __init__(self):
+        self._families: List[MetricFamily] = []
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Samples]]]] = []
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> MetricFamily:
+        family = MetricFamily(name, help_text, 'counter', labels, Counter)
+        self._families.append(family)
+        return family
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> MetricFamily:
+        family = MetricFamily(name, help_text, 'histogram', labels, lambda: Histogram(buckets))
+        self._families.append(family)
+        return family
+
+    def collector(self, collect: Callable[[], Iterable[Tuple[str, str, str, Samples]]]) -> None:
+        """Register collect(), which yields (name, 'counter' or 'gauge', help, samples) when scraped"""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        """Everything in the Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for family in self._families:
+            lines.extend(family.render())
+        for collect in self._collectors:
+            try:
+                metrics = list(collect())
+            except Exception as e:
+                logging.getLogger(__name__).error(f"Metrics collector failed: {str(e)}")
+                continue
+            for name, kind, help_text, samples in metrics:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REQUEST_SECONDS = REGISTRY.histogram('edu_http_request_duration_seconds',
+                                     'Time from request start to the last byte of the response',
+                                     ('endpoint', 'method', 'status'))
+STAGE_SECONDS = REGISTRY.histogram('edu_request_stage_duration_seconds',
+                                   'Time per request spent in each stage',
+                                   ('endpoint', 'stage'))
+UPSTREAM_SECONDS = REGISTRY.histogram('edu_upstream_call_duration_seconds',
+                                      'Duration of completed upstream LLM calls (streams until the last token)',
+                                      ('model', 'mode'))
+UPSTREAM_TOKENS = REGISTRY.counter('edu_upstream_tokens_total',
+                                   'Tokens reported by the upstream', ('model', 'type'))
+
+
+class RequestTimer:
+    """Stage totals of one request; recorded in the histograms by finish()"""
+    __slots__ = ('endpoint', 'method', 'started', 'stages', 'status')
+
+    def __init__(self, endpoint: str, method: str):
+        self.endpoint = endpoint
+        self.method = method
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.status: Optional[int] = None
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        """Server-Timing header value with the stage totals so far, in milliseconds"""
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ', '.join(parts)
+
+    def finish(self, status: Optional[int] = None) -> None:
+        if status is not None:
+            self.status = status
+        REQUEST_SECONDS.labels(self.endpoint, self.method, self.status or 500).observe(
+            time.perf_counter() - self.started)
+        for name, seconds in self.stages.items():
+            STAGE_SECONDS.labels(self.endpoint, name).observe(seconds)
+
+
+_current_timer: ContextVar[Optional[RequestTimer]] = ContextVar('request_timer', default=None)
+
+
+def start_request(endpoint: str, method: str) -> RequestTimer:
+    timer = RequestTimer(endpoint, method)
+    _current_timer.set(timer)
+    return timer
+
+
+def current_request() -> Optional[RequestTimer]:
+    return _current_timer.get()
+
+
+def finish_request(status: Optional[int] = None) -> None:
+    """Record the current request (once) and detach it from the context"""
+    timer = _current_timer.get()
+    if timer is not None:
+        _current_timer.set(None)
+        timer.finish(status)
+
+
+class stage:
+    """Context manager adding the time spent in its block to the current request's stage total.
+
+    Outside a request (background work, precompute runs) the time is recorded
+    directly under the endpoint "background".
+    """
+    __slots__ = ('name', '_started')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self._started
+        timer = _current_timer.get()
+        if timer is not None:
+            timer.add(self.name, elapsed)
+        else:
+            STAGE_SECONDS.labels('background', self.name).observe(elapsed)
+        return False
+
+
+def record_upstream_call(model: str, mode: str, seconds: float, usage: Any = None) -> None:
+    """Record one completed upstream call; usage is the SDK's usage object or our dict form"""
+    UPSTREAM_SECONDS.labels(model, mode).observe(seconds)
+    if usage is None:
+        return
+    if isinstance(usage, dict):
+        prompt, completion = usage.get('prompt_tokens'), usage.get('completion_tokens')
+    else:
+        prompt, completion = getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None)
+    if prompt:
+        UPSTREAM_TOKENS.labels(model, 'prompt').inc(prompt)
+    if completion:
+        UPSTREAM_TOKENS.labels(model, 'completion').inc(completion)
+
+
+def cache_samples(caches: Dict[str, Dict[str, Any]]) -> Samples:
+    """edu_cache_lookups_total samples from stats() dicts that carry hits and misses"""
+    for name, stats in caches.items():
+        yield {'cache': name, 'result': 'hit'}, stats['hits']
+        yield {'cache': name, 'result': 'miss'}, stats['misses']
+
+
+_log_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+
+
+def _start_listener(handlers) -> None:
+    global _log_listener
+    log_queue = queue.SimpleQueue()
+    _queue_handler.queue = log_queue
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+
+
+def _restart_listener_after_fork() -> None:
+    # The listener thread does not survive fork(); give the child its own queue and thread
+    _start_listener(_log_listener.handlers)
+
+
+def _stop_listener() -> None:
+    _log_listener.stop()
+
+
+# path -> (queue handler, listener) of each file opened with record_file()
+_record_files: Dict[str, Tuple[logging.handlers.QueueHandler, logging.handlers.QueueListener]] = {}
+_record_files_lock = threading.Lock()
+
+
+def _start_record_listener(path: str, queue_handler: logging.handlers.QueueHandler,
+                           file_handler: logging.Handler) -> None:
+    record_queue = queue.SimpleQueue()
+    queue_handler.queue = record_queue
+    listener = logging.handlers.QueueListener(record_queue, file_handler)
+    listener.start()
+    _record_files[path] = (queue_handler, listener)
+
+
+def _restart_record_listeners_after_fork() -> None:
+    for path, (queue_handler, listener) in list(_record_files.items()):
+        _start_record_listener(path, queue_handler, listener.handlers[0])
+
+
+def _stop_record_listeners() -> None:
+    for _, listener in _record_files.values():
+        listener.stop()
+
+
+def record_file(path: str) -> logging.Logger:
+    """Logger whose messages are appended to path, one per line, by a background thread.
+
+    Used for the JSON-lines decision logs: the caller only queues the line,
+    so a slow disk never holds up a request or a lock.
+    """
+    record_logger = logging.getLogger(f'records.{path}')
+    with _record_files_lock:
+        if path in _record_files:
+            return record_logger
+        file_handler = logging.FileHandler(path, encoding='utf-8', delay=True)
+        file_handler.setFormatter(logging.Formatter('%(message)s'))
+        queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+        record_logger.addHandler(queue_handler)
+        record_logger.setLevel(logging.INFO)
+        # Lines go only to the file, never to the application log
+        record_logger.propagate = False
+        first = not _record_files
+        _start_record_listener(path, queue_handler, file_handler)
+    if first:
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_restart_record_listeners_after_fork)
+        atexit.register(_stop_record_listeners)
+    return record_logger
+
+
+def configure_logging(level: str = 'INFO') -> None:
+    """Send log records through a queue to a listener thread that does the actual I/O.
+
+    Handlers already on the root logger (e.g. installed by the server) are
+    moved behind the queue; otherwise a stderr handler like basicConfig's is
+    used. Forked children get their own listener. Calling this again is a no-op.
+    """
+    global _queue_handler
+    if _queue_handler is not None:
+        return
+    root = logging.getLogger()
+    root.setLevel(level)
+    handlers = list(root.handlers)
+    if not handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+        handlers = [handler]
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    _queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    root.addHandler(_queue_handler)
+    _start_listener(handlers)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_restart_listener_after_fork)
+    atexit.register(_stop_listener)
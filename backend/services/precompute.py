@@ -0,0 +1,224 @@
+"""Offline precomputation of per-topic explanations and quizzes.
+
+Enumerates every (board, class, subject, topic) in the curriculum files,
+generates the opening explanation and a quiz for each with a bounded worker
+pool, validates them and writes them to the answer store that the serving
+path reads first. Runs are resumable and incremental: answers are committed
+as they complete, and a topic is only regenerated when it is new, its prompt
+or generation settings changed, or its last answer failed validation.
+
+Run with: python -m services.precompute [--kinds explanation quiz] [--workers 8]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+from models.admission import AdmissionRejected
+from models.resilience import CircuitOpenError
+from services.answer_store import EXPLANATION, QUIZ, AnswerStore, TopicKey
+from services.search_index import curriculum_passages
+
+logger = logging.getLogger(__name__)
+
+GENERATION = {
+    EXPLANATION: dict(
+        prompt="Explain the concept of {topic}",
+        system_prompt="You are a helpful educational assistant. Explain concepts clearly and concisely, "
+                      "using age-appropriate language and examples for a {class_level} student "
+                      "studying {subject} ({board} curriculum).",
+        max_tokens=500,
+        temperature=0.7,
+    ),
+    # Same format QuizAgent asks for, so its parser reads stored quizzes unchanged
+    QUIZ: dict(
+        prompt="""Generate a quiz about {topic} for {class_level} level. Format:
+1. Question 1
+a) Option 1
+b) Option 2
+c) Option 3
+d) Option 4
+[correct: d]
+
+2. Question 2
+a) Option 1
+b) Option 2
+c) Option 3
+d) Option 4
+[correct: b]
+
+Include 5 questions total. Keep questions concise. Mark correct answers using [correct: x] format after the options, where x is the letter of the correct option.""",
+        system_prompt="You are a helpful educational assistant writing {subject} quizzes for the {board} curriculum.",
+        max_tokens=700,
+        temperature=0.7,
+    ),
+}
+QUIZ_QUESTIONS = 5
+_CORRECT_MARKER = re.compile(r'\[correct:\s*[a-d]\]', re.IGNORECASE)
+
+# Attempts per topic while the upstream is saturated or failing fast
+MAX_ATTEMPTS = 5
+
+
+def curriculum_topics(data_dir: str, board: Optional[str] = None) -> List[TopicKey]:
+    """Every distinct (board, class, subject, topic) in the curriculum files, sorted"""
+    topics = {(p['board'], p['class_level'], p['subject'], p['topic']) for p in curriculum_passages(data_dir)
+              if p['board'] and p['class_level'] and p['subject'] and p['topic']}
+    return sorted(key for key in topics if board is None or key[0] == board)
+
+
+def render(kind: str, key: TopicKey) -> Dict[str, Any]:
+    board, class_level, subject, topic = key
+    settings = dict(GENERATION[kind])
+    fields = dict(board=board, class_level=class_level, subject=subject, topic=topic)
+    settings['prompt'] = settings['prompt'].format(**fields)
+    settings['system_prompt'] = settings['system_prompt'].format(**fields)
+    return settings
+
+
+def fingerprint(settings: Dict[str, Any], model: str) -> str:
+    """Changes whenever the prompt, the generation settings or the model change"""
+    return hashlib.sha256(json.dumps([settings, model], sort_keys=True, ensure_ascii=False)
+                          .encode('utf-8')).hexdigest()
+
+
+def validate(kind: str, content: str, validator) -> Dict[str, Any]:
+    """ValidatorAgent's result, plus a format check for quizzes"""
+    result = validator.validate(content)
+    if kind == QUIZ:
+        questions = len(_CORRECT_MARKER.findall(content))
+        check = {'valid': questions >= QUIZ_QUESTIONS}
+        if not check['valid']:
+            check['message'] = f'Quiz has {questions} marked answers, expected {QUIZ_QUESTIONS}'
+        result['validation_results']['quiz_format'] = check
+        result['is_valid'] = result['is_valid'] and check['valid']
+    return result
+
+
+class Precomputer:
+    """Generates, validates and stores answers for a list of topics"""
+
+    def __init__(self, store: AnswerStore, client, validator, workers: int = 8, model: Optional[str] = None):
+        self.store = store
+        self.client = client
+        self.validator = validator
+        self.workers = workers
+        self.model = model
+        self._lock = threading.Lock()
+        self.counts = {'generated': 0, 'invalid': 0, 'failed': 0}
+
+    def model_for(self, kind: str, key: TopicKey, settings: Dict[str, Any]) -> str:
+        if self.model:
+            return self.model
+        # The same tier choice the serving path would make; the offline run has no latency budget.
+        # Planning checks every topic, so these choices are not logged as routing decisions.
+        return self.client.router.choose('precompute', settings['prompt'], class_level=key[1], subject=key[2],
+                                         intent='quiz' if kind == QUIZ else None, record=False)
+
+    def plan(self, kinds: List[str], topics: List[TopicKey], force: bool = False) -> List[Dict[str, Any]]:
+        """Jobs for the topics whose stored answer is missing, stale or invalid"""
+        jobs = []
+        for kind in kinds:
+            stored = {} if force else self.store.fingerprints(kind)
+            for key in topics:
+                settings = render(kind, key)
+                model = self.model_for(kind, key, settings)
+                digest = fingerprint(settings, model)
+                if stored.get(key) == (digest, True):
+                    continue
+                jobs.append({'kind': kind, 'key': key, 'settings': settings, 'model': model,
+                             'fingerprint': digest})
+        return jobs
+
+    def _generate(self, job: Dict[str, Any]) -> str:
+        settings = job['settings']
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                return self.client.generate(settings['prompt'], model=job['model'],
+                                            system_prompt=settings['system_prompt'],
+                                            temperature=settings['temperature'],
+                                            max_tokens=settings['max_tokens'],
+                                            use_cache=False, priority='bulk')
+            except (AdmissionRejected, CircuitOpenError) as e:
+                # The pipeline waits for capacity rather than competing with live traffic
+                if attempt == MAX_ATTEMPTS:
+                    raise
+                time.sleep(e.retry_after)
+
+    def _run_job(self, job: Dict[str, Any]) -> bool:
+        content = self._generate(job)
+        validation = validate(job['kind'], content or '', self.validator)
+        self.store.put(job['kind'], job['key'], content or '', validation, job['fingerprint'], job['model'])
+        with self._lock:
+            self.counts['generated' if validation['is_valid'] else 'invalid'] += 1
+        return validation['is_valid']
+
+    def run(self, jobs: List[Dict[str, Any]]) -> Dict[str, int]:
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='precompute')
+        futures = {executor.submit(self._run_job, job): job for job in jobs}
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                job = futures[future]
+                try:
+                    if not future.result():
+                        logger.warning(f"{job['kind']} for {'/'.join(job['key'])} failed validation")
+                except Exception as e:
+                    with self._lock:
+                        self.counts['failed'] += 1
+                    logger.error(f"Error generating {job['kind']} for {'/'.join(job['key'])}: {str(e)}")
+                if done % 50 == 0 or done == len(jobs):
+                    logger.info(f"Precomputed {done}/{len(jobs)}: {self.counts}")
+        except KeyboardInterrupt:
+            logger.warning("Interrupted; finished answers are saved, rerun to resume")
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+        return self.counts
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from config import ANSWER_STORE_PATH, CURRICULUM_DATA_DIR, PRECOMPUTE_WORKERS
+
+    parser = argparse.ArgumentParser(description="Precompute explanations and quizzes for the curriculum")
+    parser.add_argument('--db', default=ANSWER_STORE_PATH)
+    parser.add_argument('--data-dir', default=CURRICULUM_DATA_DIR)
+    parser.add_argument('--kinds', nargs='+', choices=[EXPLANATION, QUIZ], default=[EXPLANATION, QUIZ])
+    parser.add_argument('--board', help="only topics of this board")
+    parser.add_argument('--workers', type=int, default=PRECOMPUTE_WORKERS)
+    parser.add_argument('--model', help="use this model instead of the router's choice")
+    parser.add_argument('--limit', type=int, help="generate at most this many answers")
+    parser.add_argument('--force', action='store_true', help="regenerate answers that are up to date")
+    parser.add_argument('--prune', action='store_true', help="delete answers for topics no longer in the curriculum")
+    parser.add_argument('--dry-run', action='store_true', help="only report what would be generated")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    from agents.validator_agent import ValidatorAgent
+    from models.openai_client import OpenAIClient
+
+    store = AnswerStore(args.db)
+    topics = curriculum_topics(args.data_dir, args.board)
+    precomputer = Precomputer(store, OpenAIClient(), ValidatorAgent(), args.workers, args.model)
+    if args.prune and not args.board:
+        for kind in args.kinds:
+            logger.info(f"Pruned {store.prune(kind, topics)} stale {kind} answers")
+    jobs = precomputer.plan(args.kinds, topics, args.force)
+    if args.limit is not None:
+        jobs = jobs[:args.limit]
+    logger.info(f"{len(topics)} topics, {len(jobs)} answers to generate")
+    if args.dry_run:
+        for job in jobs:
+            print(job['kind'], '/'.join(job['key']), job['model'])
+        return
+    counts = precomputer.run(jobs)
+    print(json.dumps({'topics': len(topics), 'jobs': len(jobs), **counts, 'store': store.stats()},
+                     ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Understanding levels run 1-5; 0 means "not reported"
+MAX_UNDERSTANDING_LEVEL = 5
+PERCENTILES = (25, 50, 75, 90)
+
+_COLUMNS = {
+    'student': np.int32,
+    'board': np.int32,
+    'class_level': np.int32,
+    'subject': np.int32,
+    'topic': np.int32,
+    'understanding': np.int8,
+    'time_spent': np.int64,
+    'questions': np.int64,
+}
+
+
+class _State:
+    """Columnar progress rows plus the string dictionaries behind the integer codes"""
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.columns = {name: np.zeros(capacity, dtype) for name, dtype in _COLUMNS.items()}
+        self.codes: Dict[str, Dict[str, int]] = {
+            name: {} for name in ('student', 'board', 'class_level', 'subject', 'topic')}
+        self.labels: Dict[str, List[str]] = {name: [] for name in self.codes}
+        # (student, subject, topic) codes -> row number
+        self.rows: Dict[tuple, int] = {}
+
+    def code(self, kind: str, value) -> int:
+        value = '' if value is None else str(value)
+        codes = self.codes[kind]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self.labels[kind])
+            self.labels[kind].append(value)
+        return code
+
+    def upsert(self, student_id, board, class_level, subject, topic,
+               understanding_level, questions_asked, time_spent) -> None:
+        student = self.code('student', student_id)
+        subject_code = self.code('subject', subject)
+        topic_code = self.code('topic', topic)
+        key = (student, subject_code, topic_code)
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = self.size
+            self.size += 1
+            if self.size > len(self.columns['student']):
+                for name, column in self.columns.items():
+                    grown = np.zeros(len(column) * 2, column.dtype)
+                    grown[:len(column)] = column
+                    self.columns[name] = grown
+
+        columns = self.columns
+        columns['student'][row] = student
+        columns['board'][row] = self.code('board', board)
+        columns['class_level'][row] = self.code('class_level', class_level)
+        columns['subject'][row] = subject_code
+        columns['topic'][row] = topic_code
+        columns['understanding'][row] = min(max(int(understanding_level or 0), 0), MAX_UNDERSTANDING_LEVEL)
+        columns['time_spent'][row] = int(time_spent or 0)
+        columns['questions'][row] = int(questions_asked or 0)
+
+
+class ProgressAnalytics:
+    """Class-wide progress aggregates over columnar NumPy arrays.
+
+    One row per (student, subject, topic), with strings interned to integer
+    codes, so filters and group-bys are vectorized mask/bincount/sort
+    operations instead of loops over nested dicts.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = _State()
+        self._refresher: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence]) -> 'ProgressAnalytics':
+        analytics = cls()
+        analytics.reload(rows)
+        return analytics
+
+    def reload(self, rows: Iterable[Sequence]) -> None:
+        """Rebuild from (student_id, board, class_level, subject, topic,
+        understanding_level, questions_asked, time_spent) rows and swap atomically"""
+        state = _State()
+        for row in rows:
+            state.upsert(*row)
+        with self._lock:
+            self._state = state
+        logger.info(f"Loaded progress analytics: {state.size} rows")
+
+    def start_refresher(self, load_rows: Callable[[], Iterable[Sequence]], interval: float) -> None:
+        """Periodically reload, picking up writes made by other worker processes"""
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload(load_rows())
+                except Exception as e:
+                    logger.error(f"Error refreshing progress analytics: {str(e)}")
+
+        self._refresher = threading.Thread(target=run, name='analytics-refresher', daemon=True)
+        self._refresher.start()
+
+    def upsert(self, student_id, board, class_level, subject, topic,
+               understanding_level, questions_asked, time_spent) -> None:
+        with self._lock:
+            self._state.upsert(student_id, board, class_level, subject, topic,
+                               understanding_level, questions_asked, time_spent)
+
+    def summary(self, board: Optional[str] = None, class_level: Optional[str] = None,
+                subject: Optional[str] = None, lagging_threshold: int = 2,
+                lagging_limit: int = 50) -> Dict[str, Any]:
+        """Aggregates for the rows matching the board/class/subject filter"""
+        with self._lock:
+            state = self._state
+            n = state.size
+            columns = {name: column[:n] for name, column in state.columns.items()}
+            mask = np.ones(n, dtype=bool)
+            for kind, value in (('board', board), ('class_level', class_level), ('subject', subject)):
+                if value:
+                    code = state.codes[kind].get(str(value))
+                    mask &= columns[kind] == (-1 if code is None else code)
+            selected = {name: column[mask] for name, column in columns.items()}
+            return self._aggregate(state, selected, lagging_threshold, lagging_limit)
+
+    @staticmethod
+    def _aggregate(state: _State, cols: Dict[str, np.ndarray], lagging_threshold: int,
+                   lagging_limit: int) -> Dict[str, Any]:
+        subject_labels = state.labels['subject']
+        topic_labels = state.labels['topic']
+        student_labels = state.labels['student']
+        result: Dict[str, Any] = {
+            'students': int(np.unique(cols['student']).size),
+            'rows': int(cols['student'].size),
+            # Rows with no understanding level yet, left out of the understanding statistics
+            'unrated_rows': int(np.count_nonzero(cols['understanding'] == 0)),
+            'subjects': {},
+            'topics': [],
+        }
+        if not cols['student'].size:
+            return result
+
+        # Per-subject totals
+        subject_codes, subject_inverse = np.unique(cols['subject'], return_inverse=True)
+        subject_time = np.bincount(subject_inverse, weights=cols['time_spent'])
+        subject_questions = np.bincount(subject_inverse, weights=cols['questions'])
+        subject_students = np.bincount(
+            np.unique(np.stack([subject_inverse, cols['student']]), axis=1)[0])
+        for i, code in enumerate(subject_codes):
+            result['subjects'][subject_labels[code]] = {
+                'total_time_spent': int(subject_time[i]),
+                'total_questions_asked': int(subject_questions[i]),
+                'students': int(subject_students[i]),
+            }
+
+        # Per-(subject, topic) groups
+        group_keys = cols['subject'].astype(np.int64) * max(len(topic_labels), 1) + cols['topic']
+        groups, inverse = np.unique(group_keys, return_inverse=True)
+        group_count = len(groups)
+        counts = np.bincount(inverse, minlength=group_count)
+        understanding = cols['understanding'].astype(np.int64)
+        histogram = np.bincount(inverse * (MAX_UNDERSTANDING_LEVEL + 1) + understanding,
+                                minlength=group_count * (MAX_UNDERSTANDING_LEVEL + 1)
+                                ).reshape(group_count, MAX_UNDERSTANDING_LEVEL + 1)
+        reported = histogram[:, 1:].sum(axis=1)
+        understanding_sum = np.bincount(inverse, weights=understanding, minlength=group_count)
+        time_sum = np.bincount(inverse, weights=cols['time_spent'], minlength=group_count)
+        rated = understanding > 0
+
+        def group_percentiles(values: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+            """Nearest-rank percentiles per group over the selected rows: shape (groups, len(PERCENTILES)).
+
+            Groups with no selected rows get 0; callers check the group size.
+            """
+            values, group_of = (values, inverse) if rows is None else (values[rows], inverse[rows])
+            sizes = np.bincount(group_of, minlength=group_count)
+            starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+            # Trailing 0 keeps the positions of empty groups in bounds
+            ordered = np.append(values[np.lexsort((values, group_of))], 0)
+            ranks = np.array(PERCENTILES) / 100.0
+            positions = starts[:, None] + np.floor(ranks[None, :] * np.maximum(sizes[:, None] - 1, 0)).astype(np.int64)
+            return ordered[positions]
+
+        understanding_percentiles = group_percentiles(understanding, rated)
+        time_percentiles = group_percentiles(cols['time_spent'])
+
+        # Lagging students: lowest reported understanding first
+        lagging = rated & (understanding <= lagging_threshold)
+        lagging_rows = np.nonzero(lagging)[0]
+        lagging_rows = lagging_rows[np.lexsort((understanding[lagging_rows], inverse[lagging_rows]))]
+        lagging_groups = inverse[lagging_rows]
+        rank_in_group = np.arange(lagging_rows.size) - np.searchsorted(lagging_groups, lagging_groups)
+        lagging_rows = lagging_rows[rank_in_group < lagging_limit]
+        lagging_by_group: Dict[int, List[str]] = {}
+        for row in lagging_rows:
+            lagging_by_group.setdefault(int(inverse[row]), []).append(student_labels[cols['student'][row]])
+
+        topic_count = max(len(topic_labels), 1)
+        for g, key in enumerate(groups):
+            result['topics'].append({
+                'subject': subject_labels[int(key // topic_count)],
+                'topic': topic_labels[int(key % topic_count)],
+                'students': int(counts[g]),
+                'unrated_students': int(counts[g] - reported[g]),
+                'understanding_histogram': {
+                    str(level): int(histogram[g, level]) for level in range(1, MAX_UNDERSTANDING_LEVEL + 1)},
+                'mean_understanding': round(float(understanding_sum[g] / reported[g]), 2) if reported[g] else None,
+                'understanding_percentiles': {
+                    f'p{p}': int(understanding_percentiles[g, i]) for i, p in enumerate(PERCENTILES)
+                } if reported[g] else None,
+                'total_time_spent': int(time_sum[g]),
+                'time_spent_percentiles': {
+                    f'p{p}': int(time_percentiles[g, i]) for i, p in enumerate(PERCENTILES)},
+                'lagging_students': lagging_by_group.get(g, []),
+            })
+        return result
@@ -0,0 +1,243 @@
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS students (
+    student_id TEXT PRIMARY KEY,
+    board TEXT,
+    class_level TEXT
+);
+CREATE TABLE IF NOT EXISTS topic_progress (
+    student_id TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    understanding_level INTEGER,
+    questions_asked INTEGER NOT NULL DEFAULT 0,
+    time_spent INTEGER NOT NULL DEFAULT 0,
+    last_updated TEXT,
+    last_accessed TEXT,
+    PRIMARY KEY (student_id, subject, topic)
+);
+CREATE INDEX IF NOT EXISTS topic_progress_by_topic ON topic_progress (student_id, topic);
+CREATE TABLE IF NOT EXISTS subject_totals (
+    student_id TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    total_time_spent INTEGER NOT NULL DEFAULT 0,
+    total_questions_asked INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (student_id, subject)
+);
+"""
+
+UPSERT_STUDENT = """
+INSERT INTO students (student_id, board, class_level) VALUES (?, ?, ?)
+ON CONFLICT (student_id) DO NOTHING
+"""
+
+UPSERT_TOPIC = """
+INSERT INTO topic_progress
+    (student_id, subject, topic, understanding_level, questions_asked, time_spent, last_updated)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (student_id, subject, topic) DO UPDATE SET
+    understanding_level = excluded.understanding_level,
+    questions_asked = excluded.questions_asked,
+    time_spent = excluded.time_spent,
+    last_updated = excluded.last_updated
+"""
+
+ADD_SUBJECT_TOTALS = """
+INSERT INTO subject_totals (student_id, subject, total_time_spent, total_questions_asked)
+VALUES (?, ?, ?, ?)
+ON CONFLICT (student_id, subject) DO UPDATE SET
+    total_time_spent = total_time_spent + excluded.total_time_spent,
+    total_questions_asked = total_questions_asked + excluded.total_questions_asked
+"""
+
+TOUCH_TOPIC = """
+UPDATE topic_progress
+SET questions_asked = questions_asked + 1, last_accessed = ?
+WHERE rowid = (SELECT rowid FROM topic_progress WHERE student_id = ? AND topic = ? LIMIT 1)
+"""
+
+
+class ProgressStore:
+    """Durable student progress storage backed by SQLite in WAL mode.
+
+    Rows are keyed by (student_id, subject, topic) and subject totals are
+    maintained incrementally, so neither writes nor reads scan a student's
+    history. Writes are queued and applied in batched transactions by a
+    background flusher; reads flush pending writes first, so callers always
+    see their own updates.
+    """
+
+    def __init__(self, db_path: str, flush_interval: float = 0.5, batch_size: int = 500):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._pending: List[Tuple[str, tuple]] = []
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+
+        self._flusher = threading.Thread(target=self._run_flusher, name='progress-flusher', daemon=True)
+        self._flusher.start()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _enqueue(self, *operations: Tuple[str, tuple]) -> None:
+        with self._pending_lock:
+            self._pending.extend(operations)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def pending_writes(self) -> int:
+        """Number of queued writes not yet flushed"""
+        with self._pending_lock:
+            return len(self._pending)
+
+    def _run_flusher(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logger.error(f"Error flushing progress updates: {str(e)}")
+
+    def flush(self) -> int:
+        """Apply all queued writes in one transaction; returns the number applied"""
+        with self._write_lock:
+            with self._pending_lock:
+                operations, self._pending = self._pending, []
+            if not operations:
+                return 0
+            conn = self._connection()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for sql, params in operations:
+                    try:
+                        conn.execute(sql, params)
+                    except (sqlite3.IntegrityError, sqlite3.ProgrammingError, sqlite3.InterfaceError) as e:
+                        # A bad row (constraint violation or unbindable value) fails the same way every
+                        # time: only this statement is rolled back and it is never retried
+                        logger.error(f"Dropping invalid progress update: {str(e)}")
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                # Put the batch back so the next flush retries it
+                with self._pending_lock:
+                    self._pending[:0] = operations
+                raise
+            return len(operations)
+
+    def close(self) -> None:
+        """Stop the background flusher and write out anything still queued"""
+        self._stopped.set()
+        self._wakeup.set()
+        self._flusher.join(timeout=5)
+        self.flush()
+
+    @staticmethod
+    def _topic_operations(student_id, board, class_level, subject, topic, understanding_level,
+                          questions_asked, time_spent, now) -> Tuple[Tuple[str, tuple], ...]:
+        return (
+            (UPSERT_STUDENT, (student_id, board, class_level)),
+            (UPSERT_TOPIC, (student_id, subject, topic, understanding_level,
+                            questions_asked, time_spent, now)),
+            (ADD_SUBJECT_TOTALS, (student_id, subject, time_spent, questions_asked)),
+        )
+
+    def record_topic(self, student_id: str, board: Optional[str], class_level: Optional[str],
+                     subject: str, topic: str, understanding_level: Optional[int],
+                     questions_asked: int = 0, time_spent: int = 0) -> None:
+        """Set a topic's progress and add its time and questions to the subject totals"""
+        self._enqueue(*self._topic_operations(
+            student_id, board, class_level, subject, topic, understanding_level,
+            questions_asked, time_spent, datetime.now().isoformat()))
+
+    def record_topics(self, events: List[Dict[str, Any]], flush: bool = True) -> None:
+        """Record many topic updates (dicts with the record_topic fields) as one batch.
+
+        With flush=True the batch is committed in a single transaction before returning.
+        """
+        now = datetime.now().isoformat()
+        operations = []
+        for event in events:
+            operations.extend(self._topic_operations(
+                event['student_id'], event.get('board'), event.get('class_level'),
+                event['subject'], event['topic'], event.get('understanding_level'),
+                event.get('questions_asked', 0), event.get('time_spent', 0), now))
+        self._enqueue(*operations)
+        if flush:
+            self.flush()
+
+    def touch_topic(self, student_id: str, topic: str) -> None:
+        """Count one more question on a topic the student has already studied"""
+        self._enqueue((TOUCH_TOPIC, (datetime.now().isoformat(), student_id, topic)))
+
+    def get_student(self, student_id: str) -> Optional[Dict[str, Any]]:
+        """Return the student's progress in the nested board/class/subjects shape, or None"""
+        self.flush()
+        conn = self._connection()
+        student = conn.execute(
+            "SELECT board, class_level FROM students WHERE student_id = ?", (student_id,)).fetchone()
+        if student is None:
+            return None
+
+        subjects: Dict[str, Dict[str, Any]] = {}
+        for subject, total_time, total_questions in conn.execute(
+                "SELECT subject, total_time_spent, total_questions_asked FROM subject_totals "
+                "WHERE student_id = ?", (student_id,)):
+            subjects[subject] = {
+                "topics": {},
+                "total_time_spent": total_time,
+                "total_questions_asked": total_questions
+            }
+        for subject, topic, level, questions, time_spent, last_updated, last_accessed in conn.execute(
+                "SELECT subject, topic, understanding_level, questions_asked, time_spent, "
+                "last_updated, last_accessed FROM topic_progress WHERE student_id = ?", (student_id,)):
+            entry = {
+                "understanding_level": level,
+                "questions_asked": questions,
+                "time_spent": time_spent,
+                "last_updated": last_updated
+            }
+            if last_accessed:
+                entry["last_accessed"] = last_accessed
+            subjects.setdefault(subject, {
+                "topics": {}, "total_time_spent": 0, "total_questions_asked": 0
+            })["topics"][topic] = entry
+
+        return {
+            "board": student[0],
+            "class_level": student[1],
+            "subjects": subjects
+        }
+
+    def all_topic_rows(self) -> List[Tuple]:
+        """Every topic row as (student_id, board, class_level, subject, topic,
+        understanding_level, questions_asked, time_spent), for analytics"""
+        self.flush()
+        return self._connection().execute(
+            "SELECT t.student_id, s.board, s.class_level, t.subject, t.topic, "
+            "t.understanding_level, t.questions_asked, t.time_spent "
+            "FROM topic_progress t JOIN students s ON s.student_id = t.student_id").fetchall()
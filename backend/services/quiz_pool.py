@@ -0,0 +1,351 @@
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from models.admission import AdmissionRejected
+from models.resilience import CircuitOpenError
+from models.single_flight import SingleFlight
+from services.answer_store import QUIZ, TopicKey
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quiz_questions (
+    id INTEGER PRIMARY KEY,
+    board TEXT NOT NULL,
+    class_level TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    topic TEXT NOT NULL COLLATE NOCASE,
+    fingerprint TEXT NOT NULL,
+    question TEXT NOT NULL,
+    options TEXT NOT NULL,
+    correct INTEGER NOT NULL,
+    model TEXT,
+    created_at TEXT,
+    UNIQUE (board, class_level, subject, topic, fingerprint)
+);
+CREATE TABLE IF NOT EXISTS quiz_served (
+    student_id TEXT NOT NULL,
+    question_id INTEGER NOT NULL,
+    served_at TEXT,
+    PRIMARY KEY (student_id, question_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS quiz_refills (
+    board TEXT NOT NULL,
+    class_level TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    topic TEXT NOT NULL COLLATE NOCASE,
+    started_at REAL NOT NULL,
+    PRIMARY KEY (board, class_level, subject, topic)
+);
+"""
+
+TOPIC_FILTER = "board = ? AND class_level = ? AND subject = ? AND topic = ?"
+
+SAMPLE_UNSEEN = f"""
+SELECT id, question, options, correct FROM quiz_questions q
+WHERE {TOPIC_FILTER}
+  AND NOT EXISTS (SELECT 1 FROM quiz_served s WHERE s.student_id = ? AND s.question_id = q.id)
+ORDER BY random() LIMIT ?
+"""
+
+INSERT_QUESTION = """
+INSERT OR IGNORE INTO quiz_questions
+    (board, class_level, subject, topic, fingerprint, question, options, correct, model, created_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Same format as the precomputed quizzes and QuizAgent's old prompt, so one parser reads all of them
+GENERATION = dict(
+    prompt="""Generate a quiz about {topic} for {class_level} level. Format:
+1. Question 1
+a) Option 1
+b) Option 2
+c) Option 3
+d) Option 4
+[correct: d]
+
+Include {count} questions total. Keep questions concise and make each one test a different idea. Mark correct answers using [correct: x] format after the options, where x is the letter of the correct option.""",
+    system_prompt="You are a helpful educational assistant writing {subject} quizzes for the {board} curriculum.",
+    temperature=0.9,
+)
+# Question stems listed in a refill prompt so the model writes new ones
+AVOID_PROMPT_QUESTIONS = 20
+MAX_TOKENS_PER_QUESTION = 120
+
+_QUESTION_LINE = re.compile(r'^(?:\d+[.)]|Question\s*\d*:)\s*', re.IGNORECASE)
+_OPTION_LINE = re.compile(r'^([a-d])[).]\s*', re.IGNORECASE)
+_CORRECT_MARKER = re.compile(r'\[correct:\s*([a-d])\]', re.IGNORECASE)
+
+
+def parse_quiz(text: str) -> List[Dict[str, Any]]:
+    """Questions with exactly four options and a marked answer, from a numbered quiz in the [correct: x] format"""
+    questions = []
+    current = None
+
+    def finish():
+        if current and len(current['options']) == 4 and current['correct'] is not None and current['question']:
+            questions.append(current)
+
+    for line in (text or '').splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        marker = _CORRECT_MARKER.search(line)
+        if _QUESTION_LINE.match(line):
+            finish()
+            current = {'question': _QUESTION_LINE.sub('', line), 'options': [], 'correct': None}
+        elif _OPTION_LINE.match(line) and current is not None:
+            option = _CORRECT_MARKER.sub('', _OPTION_LINE.sub('', line)).strip()
+            if len(current['options']) < 4:
+                current['options'].append(option)
+        if marker and current is not None:
+            current['correct'] = ord(marker.group(1).lower()) - ord('a')
+    finish()
+    return questions
+
+
+def question_text(question: Dict[str, Any]) -> str:
+    """A parsed question and its options as one text, the way a student reads them"""
+    return '\n'.join([question['question'], *(f"{letter}) {option}" for letter, option
+                                               in zip('abcd', question['options']))])
+
+
+def question_fingerprint(question: str) -> str:
+    """Same for questions that differ only in case, spacing or punctuation"""
+    normalized = ' '.join(re.findall(r'\w+', question.casefold()))
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def public_question(row) -> Dict[str, Any]:
+    question_id, question, options, correct = row
+    return {'id': question_id, 'question': question, 'options': json.loads(options), 'correctAnswer': correct}
+
+
+class QuizPool:
+    """Pools of parsed quiz questions per (board, class, subject, topic), shared by all workers in SQLite.
+
+    sample() serves a quiz from the pool: questions the student has not been
+    served yet, picked at random, so a student sees every question of a topic
+    before any repeats. Pools below low_watermark (or with too few questions
+    left for a student) are refilled to pool_size on a background thread, in
+    batches of batch_size questions per upstream call at bulk priority. A
+    refill lease in the database keeps workers from refilling the same topic
+    at once. A topic with no questions yet is seeded from its precomputed quiz,
+    or filled with one interactive batch before answering; concurrent requests
+    for a cold topic wait for the same seed. With a validator, each generated
+    question is checked with its options before it enters the pool
+    (precomputed quizzes were validated when they were stored).
+    """
+
+    def __init__(self, db_path: str, client, answer_store=None, pool_size: int = 40, low_watermark: int = 20,
+                 batch_size: int = 10, refill_workers: int = 2, lease_seconds: float = 120.0,
+                 model_for: Optional[Callable[[TopicKey, str], str]] = None, validator=None):
+        self.db_path = db_path
+        self.client = client
+        self.answer_store = answer_store
+        self.pool_size = pool_size
+        self.low_watermark = low_watermark
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self._model_for = model_for
+        self.validator = validator
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._refilling = set()
+        # Cold topics being seeded for a request, so concurrent requests share one interactive fill
+        self._seeds = SingleFlight()
+        self._executor = ThreadPoolExecutor(max_workers=refill_workers, thread_name_prefix='quiz-refill')
+        self.served = 0
+        self.generated = 0
+        self.rejected = 0
+        self.invalid = 0
+        self.refills = 0
+        self.refill_failures = 0
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def size(self, key: TopicKey) -> int:
+        return self._connection().execute(f"SELECT COUNT(*) FROM quiz_questions WHERE {TOPIC_FILTER}",
+                                          key).fetchone()[0]
+
+    def sample(self, key: TopicKey, student: str, count: int) -> List[Dict[str, Any]]:
+        """Up to count questions the student has not been served, marked as served.
+
+        Once the student has seen the whole pool for the topic, their history
+        for it is cleared and questions start repeating.
+        """
+        conn = self._connection()
+        rows = conn.execute(SAMPLE_UNSEEN, (*key, student, count)).fetchall()
+        if len(rows) < count and self.size(key) > len(rows):
+            conn.execute(f"DELETE FROM quiz_served WHERE student_id = ? AND question_id IN "
+                         f"(SELECT id FROM quiz_questions WHERE {TOPIC_FILTER})", (student, *key))
+            picked = {row[0] for row in rows}
+            rows += [row for row in conn.execute(SAMPLE_UNSEEN, (*key, student, count)).fetchall()
+                     if row[0] not in picked][:count - len(rows)]
+        now = datetime.now().isoformat()
+        conn.executemany("INSERT OR IGNORE INTO quiz_served (student_id, question_id, served_at) VALUES (?, ?, ?)",
+                         [(student, row[0], now) for row in rows])
+        with self._lock:
+            self.served += len(rows)
+        unseen = conn.execute(f"SELECT COUNT(*) FROM quiz_questions q WHERE {TOPIC_FILTER} AND NOT EXISTS "
+                              f"(SELECT 1 FROM quiz_served s WHERE s.student_id = ? AND s.question_id = q.id)",
+                              (*key, student)).fetchone()[0]
+        size = self.size(key)
+        if size < self.pool_size and (size < self.low_watermark or unseen < count):
+            self.schedule_refill(key)
+        return [public_question(row) for row in rows]
+
+    def ensure(self, key: TopicKey, count: int) -> str:
+        """Make sure the topic has at least count questions, seeding or generating them now if not.
+
+        Returns where they came from: 'pool', 'precomputed' or 'generated'.
+        """
+        if self.size(key) >= count:
+            return 'pool'
+        return self._seeds.do(key, lambda: self._seed(key, count))
+
+    def _seed(self, key: TopicKey, count: int) -> str:
+        # An earlier seed may have finished between the size check in ensure() and this one
+        if self.size(key) >= count:
+            return 'pool'
+        source = 'generated'
+        if self.answer_store is not None:
+            stored = self.answer_store.get(QUIZ, *key)
+            if stored is not None:
+                self.add(key, parse_quiz(stored['content']), stored.get('model'))
+                source = 'precomputed'
+        if self.size(key) < count:
+            self.fill(key, max(count, self.batch_size), priority='interactive')
+            source = 'generated'
+        self.schedule_refill(key)
+        return source
+
+    def add(self, key: TopicKey, questions: List[Dict[str, Any]], model: Optional[str] = None) -> int:
+        """Insert parsed questions, skipping ones already in the pool; returns how many were new"""
+        now = datetime.now().isoformat()
+        cursor = self._connection().executemany(INSERT_QUESTION, [
+            (*key, question_fingerprint(q['question']), q['question'], json.dumps(q['options'], ensure_ascii=False),
+             q['correct'], model, now) for q in questions])
+        return max(cursor.rowcount, 0)
+
+    def fill(self, key: TopicKey, count: int, priority: str = 'bulk') -> int:
+        """Generate one batch of count questions for the topic; returns how many new ones were added"""
+        board, class_level, subject, topic = key
+        fields = dict(board=board, class_level=class_level, subject=subject, topic=topic, count=count)
+        prompt = GENERATION['prompt'].format(**fields)
+        existing = [row[0] for row in self._connection().execute(
+            f"SELECT question FROM quiz_questions WHERE {TOPIC_FILTER} ORDER BY random() LIMIT ?",
+            (*key, AVOID_PROMPT_QUESTIONS))]
+        if existing:
+            prompt += "\n\nDo not repeat these questions:\n" + '\n'.join(f"- {q}" for q in existing)
+        model = self._model_for(key, prompt) if self._model_for else None
+        content = self.client.generate(prompt, model=model,
+                                       system_prompt=GENERATION['system_prompt'].format(**fields),
+                                       temperature=GENERATION['temperature'],
+                                       max_tokens=count * MAX_TOKENS_PER_QUESTION,
+                                       use_cache=False, priority=priority)
+        parsed = parse_quiz(content or '')
+        questions = self._valid(parsed)
+        added = self.add(key, questions, model)
+        with self._lock:
+            self.generated += added
+            self.rejected += len(questions) - added
+            self.invalid += len(parsed) - len(questions)
+        logger.info(f"Quiz pool {'/'.join(key)}: {len(parsed)} questions parsed, "
+                    f"{len(parsed) - len(questions)} failed validation, {added} new")
+        return added
+
+    def _valid(self, questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """The questions that pass the validator, with their options; all of them without one"""
+        if self.validator is None or not questions:
+            return questions
+        results = self.validator.validate_many([question_text(q) for q in questions])
+        return [q for q, result in zip(questions, results) if result['is_valid']]
+
+    def _acquire_lease(self, key: TopicKey) -> bool:
+        """Claim the topic's refill for this worker unless another one holds a live lease"""
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(f"SELECT started_at FROM quiz_refills WHERE {TOPIC_FILTER}", key).fetchone()
+            if row is not None and now - row[0] < self.lease_seconds:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute("INSERT OR REPLACE INTO quiz_refills (board, class_level, subject, topic, started_at) "
+                         "VALUES (?, ?, ?, ?, ?)", (*key, now))
+            conn.execute("COMMIT")
+            return True
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+    def schedule_refill(self, key: TopicKey) -> None:
+        with self._lock:
+            if key in self._refilling:
+                return
+            self._refilling.add(key)
+        self._executor.submit(self._refill, key)
+
+    def _refill(self, key: TopicKey) -> None:
+        try:
+            if not self._acquire_lease(key):
+                return
+            try:
+                with self._lock:
+                    self.refills += 1
+                # Stop early if the model keeps repeating questions the pool already has
+                while self.size(key) < self.pool_size:
+                    if not self.fill(key, min(self.batch_size, self.pool_size - self.size(key))):
+                        break
+            finally:
+                self._connection().execute(f"DELETE FROM quiz_refills WHERE {TOPIC_FILTER}", key)
+        except (AdmissionRejected, CircuitOpenError) as e:
+            logger.warning(f"Quiz pool refill for {'/'.join(key)} deferred: {str(e)}")
+            with self._lock:
+                self.refill_failures += 1
+        except Exception as e:
+            logger.error(f"Quiz pool refill for {'/'.join(key)} failed: {str(e)}")
+            with self._lock:
+                self.refill_failures += 1
+        finally:
+            with self._lock:
+                self._refilling.discard(key)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        questions, topics = self._connection().execute(
+            "SELECT COUNT(*), COUNT(DISTINCT board || '/' || class_level || '/' || subject || '/' || topic) "
+            "FROM quiz_questions").fetchone()
+        with self._lock:
+            return {
+                'questions': questions,
+                'topics': topics,
+                'served': self.served,
+                'generated': self.generated,
+                'duplicates_skipped': self.rejected,
+                'invalid_rejected': self.invalid,
+                'refills': self.refills,
+                'refill_failures': self.refill_failures,
+                'refilling': len(self._refilling),
+            }
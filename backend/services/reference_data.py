@@ -0,0 +1,127 @@
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Snapshot:
+    """One consistent, fully indexed generation of the reference data"""
+
+    __slots__ = ('mtimes', 'students_by_username', 'schools_by_id', 'boards_by_id')
+
+    def __init__(self, mtimes, students_by_username, schools_by_id, boards_by_id):
+        self.mtimes = mtimes
+        self.students_by_username = students_by_username
+        self.schools_by_id = schools_by_id
+        self.boards_by_id = boards_by_id
+
+
+class ReferenceDataStore:
+    """Hash-indexed view of students.json, schools.json and boards.json.
+
+    The files are parsed once and re-parsed only when one of their mtimes
+    changes. A reload builds a complete new snapshot before swapping it in,
+    so readers never observe a half-loaded roster.
+    """
+
+    def __init__(self, students_path: str, schools_path: str, boards_path: str,
+                 check_interval: float = 1.0):
+        self.students_path = students_path
+        self.schools_path = schools_path
+        self.boards_path = boards_path
+        # Minimum number of seconds between two mtime checks
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot: Optional[_Snapshot] = None
+        self._last_check = 0.0
+
+    def _mtimes(self) -> Tuple[int, int, int]:
+        return (
+            os.stat(self.students_path).st_mtime_ns,
+            os.stat(self.schools_path).st_mtime_ns,
+            os.stat(self.boards_path).st_mtime_ns,
+        )
+
+    @staticmethod
+    def _read(path: str):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _build(self, mtimes: Tuple[int, int, int]) -> _Snapshot:
+        students = self._read(self.students_path)
+        schools = self._read(self.schools_path)
+        boards = self._read(self.boards_path)
+
+        # The first entry wins on duplicates, matching the old linear scans
+        students_by_username = {}
+        for student in students:
+            students_by_username.setdefault(student['USERNAME'], student)
+        schools_by_id = {}
+        for school in schools:
+            schools_by_id.setdefault(school['ID'], school)
+        boards_by_id = {}
+        for board in boards:
+            boards_by_id.setdefault(board['ID'], board)
+
+        logger.info(f"Loaded reference data: {len(students_by_username)} students, "
+                    f"{len(schools_by_id)} schools, {len(boards_by_id)} boards")
+        return _Snapshot(mtimes, students_by_username, schools_by_id, boards_by_id)
+
+    def _current(self) -> _Snapshot:
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now - self._last_check < self.check_interval:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and now - self._last_check < self.check_interval:
+                return snapshot
+            try:
+                mtimes = self._mtimes()
+                if snapshot is None or snapshot.mtimes != mtimes:
+                    snapshot = self._build(mtimes)
+                    self._snapshot = snapshot
+            except (OSError, ValueError, KeyError) as e:
+                # Keep serving the previous generation if a file is mid-write
+                if snapshot is None:
+                    raise
+                logger.error(f"Error reloading reference data: {str(e)}")
+            self._last_check = now
+            return snapshot
+
+    def load(self) -> None:
+        """Eagerly load the data files"""
+        self._current()
+
+    def get_student(self, username: str) -> Optional[Dict[str, Any]]:
+        return self._current().students_by_username.get(username)
+
+    def get_school(self, school_id) -> Optional[Dict[str, Any]]:
+        return self._current().schools_by_id.get(school_id)
+
+    def get_board(self, board_id) -> Optional[Dict[str, Any]]:
+        return self._current().boards_by_id.get(board_id)
+
+    def authenticate(self, username: str, password: str) -> Optional[Dict[str, Any]]:
+        """Return the student's login profile, or None for bad credentials"""
+        snapshot = self._current()
+        student = snapshot.students_by_username.get(username)
+        if student is None or not hmac.compare_digest(
+                str(student['PASSWORD']).encode('utf-8'), str(password).encode('utf-8')):
+            return None
+
+        school = snapshot.schools_by_id.get(student['SCHOOL_ID'])
+        board = snapshot.boards_by_id.get(school['BOARD']) if school else None
+        return {
+            'studentFullName': student['FIRST_NAME'] + " " + student['LAST_NAME'],
+            'studentGrade': student['GRADE'],
+            'studentDivision': student['DIVISION'],
+            'schoolName': school['NAME'] if school else '',
+            'boardName': board['NAME'] if board else '',
+        }
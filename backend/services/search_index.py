@@ -0,0 +1,465 @@
+"""BM25 retrieval over the curriculum, stored as a memory-mapped index file.
+
+Build offline (from the backend directory):
+
+    python -m services.search_index build
+    python -m services.search_index query "fractions" --board CBSE --class-level "Class 2"
+
+The base index is a single file: a JSON header (vocabulary, labels, section
+offsets) followed by flat little-endian arrays (postings, document lengths,
+board/class/subject codes) and the stored passages. Queries read the arrays
+straight out of the mmap, so opening the index costs one header parse and
+scoring touches only the postings of the query terms.
+
+New or changed passages go to an append-only delta log next to the index
+and are searched alongside the base; compact() folds the delta back into a
+fresh base file.
+"""
+import argparse
+import glob
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'EDUBM25\x01'
+PREFIX = struct.Struct('<8sQ')
+ALIGNMENT = 8
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+FILTER_FIELDS = ('board', 'class_level', 'subject')
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from how in is it of on or that the this to was what when
+where which who why with explain tell me about please give example
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; combining marks stay inside words so Indic scripts tokenize whole"""
+    text = unicodedata.normalize('NFKC', text or '').casefold()
+    tokens, current = [], []
+    for char in text:
+        if char.isalnum() or unicodedata.category(char).startswith('M'):
+            current.append(char)
+        elif current:
+            tokens.append(''.join(current))
+            current = []
+    if current:
+        tokens.append(''.join(current))
+    return [token for token in tokens if token not in STOPWORDS]
+
+
+def _passage(board, class_level, subject, topic, text=None, title=None, doc_id=None) -> Dict[str, Any]:
+    title = title or topic
+    return {
+        'id': doc_id or f"{board}/{class_level}/{subject}/{topic}",
+        'board': board,
+        'class_level': class_level,
+        'subject': subject,
+        'topic': topic,
+        'title': title,
+        'text': text or f"{title}: {subject} topic for {class_level} ({board} curriculum).",
+    }
+
+
+def _read_json(path: str):
+    """Read a JSON file, ignoring trailing junk after the first value (e.g. a stray ';')"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    value, _ = json.JSONDecoder().raw_decode(content.lstrip())
+    return value
+
+
+def curriculum_passages(data_dir: str) -> List[Dict[str, Any]]:
+    """One passage per (board, class, subject, topic) across the curriculum files, plus content docs.
+
+    Content docs live in data_dir/content/*.json as lists of objects with
+    board, class_level, subject, topic, text and optionally id and title.
+    """
+    passages: Dict[str, Dict[str, Any]] = {}
+
+    def add(passage):
+        passages.setdefault(passage['id'], passage)
+
+    sources = [
+        ('rawSubjectsData.json', lambda data: (
+            (board, class_level, subject, topic)
+            for subject, boards in data.items()
+            for board, classes in boards.items()
+            for class_level, topics in classes.items()
+            for topic in topics)),
+    ]
+    for path in sorted(glob.glob(os.path.join(data_dir, '*-SUBJECTS.json'))):
+        board = os.path.basename(path)[:-len('-SUBJECTS.json')]
+        sources.append((os.path.basename(path), lambda data, board=board: (
+            (board, item.get('class'), subject, topic)
+            for item in data
+            for subject, topics in item.get('subjects', {}).items()
+            for topic in topics)))
+    for path in sorted(glob.glob(os.path.join(data_dir, '*.json'))):
+        board = os.path.basename(path)[:-len('.json')]
+        if board.lower() == board or '-' in board or board == 'rawSubjectsData':
+            continue
+        # Per-board files like CBSE.json: {subject: [{class, topics}]}
+        sources.append((os.path.basename(path), lambda data, board=board: (
+            (board, item.get('class'), subject, topic)
+            for subject, classes in data.items()
+            for item in classes
+            for topic in item.get('topics', []))))
+
+    for name, entries in sources:
+        path = os.path.join(data_dir, name)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            continue
+        try:
+            for board, class_level, subject, topic in entries(_read_json(path)):
+                add(_passage(board, class_level, subject, topic))
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            logger.error(f"Error indexing {name}: {str(e)}")
+
+    for path in sorted(glob.glob(os.path.join(data_dir, 'content', '*.json'))):
+        try:
+            for doc in _read_json(path):
+                add(_passage(doc.get('board'), doc.get('class_level'), doc.get('subject'),
+                             doc.get('topic'), doc.get('text'), doc.get('title'), doc.get('id')))
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            logger.error(f"Error indexing {os.path.basename(path)}: {str(e)}")
+
+    return list(passages.values())
+
+
+def _passage_tokens(passage: Dict[str, Any]) -> List[str]:
+    # Title and topic are counted twice so a topic name outranks a passing mention
+    return tokenize(' '.join(filter(None, (
+        passage.get('title'), passage.get('topic'), passage.get('subject'), passage.get('text')))))
+
+
+def write_index(path: str, passages: List[Dict[str, Any]]) -> None:
+    """Write a base index file for passages, replacing path atomically"""
+    labels: Dict[str, Dict[str, int]] = {field: {} for field in FILTER_FIELDS}
+    codes = {field: np.zeros(len(passages), np.uint32) for field in FILTER_FIELDS}
+    doc_len = np.zeros(len(passages), np.uint32)
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    records = []
+    for doc, passage in enumerate(passages):
+        counts = Counter(_passage_tokens(passage))
+        doc_len[doc] = sum(counts.values())
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((doc, min(tf, 0xFFFF)))
+        for field in FILTER_FIELDS:
+            value = str(passage.get(field) or '')
+            codes[field][doc] = labels[field].setdefault(value, len(labels[field]))
+        records.append(json.dumps(passage, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+    terms = {}
+    doc_ids, tfs = [], []
+    for term in sorted(postings):
+        entries = postings[term]
+        terms[term] = [len(doc_ids), len(entries)]
+        doc_ids.extend(doc for doc, _ in entries)
+        tfs.extend(tf for _, tf in entries)
+    record_offsets = np.zeros(len(records) + 1, np.uint64)
+    record_offsets[1:] = np.cumsum([len(record) for record in records])
+
+    arrays = [
+        ('doc_ids', np.array(doc_ids, np.uint32)),
+        ('tfs', np.array(tfs, np.uint16)),
+        ('doc_len', doc_len),
+        ('record_offsets', record_offsets),
+    ] + [(field, codes[field]) for field in FILTER_FIELDS]
+    sections, offset = {}, 0
+    for name, array in arrays:
+        sections[name] = [offset, str(array.dtype), int(array.size)]
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    sections['records'] = [offset, 'bytes', int(record_offsets[-1])]
+
+    header = json.dumps({
+        'doc_count': len(passages),
+        'avgdl': float(doc_len.mean()) if len(passages) else 0.0,
+        'terms': terms,
+        'ids': [passage['id'] for passage in passages],
+        'labels': {field: list(values) for field, values in labels.items()},
+        'sections': sections,
+    }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    header += b' ' * (-(PREFIX.size + len(header)) % ALIGNMENT)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, len(header)))
+        f.write(header)
+        for _, array in arrays:
+            data = array.astype(array.dtype.newbyteorder('<'), copy=False).tobytes()
+            f.write(data + b'\0' * (-len(data) % ALIGNMENT))
+        for record in records:
+            f.write(record)
+    os.replace(tmp_path, path)
+    logger.info(f"Wrote search index {path}: {len(passages)} passages, {len(terms)} terms")
+
+
+class _Segment:
+    """Read-only view of a base index file"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a search index file")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _, header_len = PREFIX.unpack_from(self._map)
+        header = json.loads(self._map[PREFIX.size:PREFIX.size + header_len])
+        base = PREFIX.size + header_len
+
+        self.doc_count = header['doc_count']
+        self.ids: List[str] = header['ids']
+        self.avgdl = header['avgdl']
+        self.terms: Dict[str, List[int]] = header['terms']
+        self.labels = header['labels']
+        self.codes = {field: {value: code for code, value in enumerate(values)}
+                      for field, values in self.labels.items()}
+        self._records_offset = base + header['sections']['records'][0]
+        self.arrays = {}
+        for name, (offset, dtype, count) in header['sections'].items():
+            if name != 'records':
+                self.arrays[name] = np.frombuffer(self._map, np.dtype(dtype).newbyteorder('<'),
+                                                  count, base + offset)
+        self.doc_len = self.arrays['doc_len']
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        start, count = self.terms.get(term, (0, 0))
+        return self.arrays['doc_ids'][start:start + count], self.arrays['tfs'][start:start + count]
+
+    def record(self, doc: int) -> Dict[str, Any]:
+        offsets = self.arrays['record_offsets']
+        start = self._records_offset + int(offsets[doc])
+        return json.loads(self._map[start:self._records_offset + int(offsets[doc + 1])])
+
+    def filter_mask(self, filters: Dict[str, Optional[str]]) -> Optional[np.ndarray]:
+        mask = None
+        for field, value in filters.items():
+            if not value:
+                continue
+            code = self.codes[field].get(str(value))
+            field_mask = (self.arrays[field] == code) if code is not None \
+                else np.zeros(self.doc_count, bool)
+            mask = field_mask if mask is None else mask & field_mask
+        return mask
+
+    def close(self):
+        # Drop the array views before unmapping
+        self.arrays = {}
+        self.doc_len = None
+        self._map.close()
+
+
+class SearchIndex:
+    """BM25 passage search over a memory-mapped base index plus an in-memory delta.
+
+    add() writes through to a delta log, so updates survive restarts without
+    rebuilding the base; a delta passage with the same id hides the base one.
+    The delta is compacted into the base once it holds max_delta passages.
+    """
+
+    def __init__(self, path: str, k1: float = BM25_K1, b: float = BM25_B, max_delta: int = 1000):
+        self.path = path
+        self.delta_path = f"{path}.delta"
+        self.max_delta = max_delta
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._base: Optional[_Segment] = None
+        self._base_ids: Dict[str, int] = {}
+        self._hidden: Optional[np.ndarray] = None
+        self._delta: Dict[str, Dict[str, Any]] = {}
+        self._delta_counts: Dict[str, Counter] = {}
+        self._delta_df: Counter = Counter()
+        self.open()
+
+    @classmethod
+    def build(cls, path: str, data_dir: str) -> 'SearchIndex':
+        """Index every curriculum passage under data_dir into a fresh base file"""
+        write_index(path, curriculum_passages(data_dir))
+        if os.path.exists(f"{path}.delta"):
+            os.remove(f"{path}.delta")
+        return cls(path)
+
+    def open(self) -> None:
+        """(Re)open the base file and replay the delta log"""
+        with self._lock:
+            if self._base is not None:
+                self._base.close()
+            self._base = _Segment(self.path) if os.path.exists(self.path) else None
+            self._base_ids = {doc_id: doc for doc, doc_id in enumerate(self._base.ids)} if self._base else {}
+            self._hidden = np.zeros(self._base.doc_count if self._base else 0, bool)
+            self._delta, self._delta_counts, self._delta_df = {}, {}, Counter()
+            if os.path.exists(self.delta_path):
+                with open(self.delta_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            self._apply(json.loads(line))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int((~self._hidden).sum()) + len(self._delta)
+
+    def _apply(self, passage: Dict[str, Any]) -> None:
+        doc_id = passage['id']
+        old = self._delta_counts.pop(doc_id, None)
+        if old:
+            self._delta_df.subtract(old.keys())
+        base_doc = self._base_ids.get(doc_id)
+        if base_doc is not None:
+            self._hidden[base_doc] = True
+        counts = Counter(_passage_tokens(passage))
+        self._delta[doc_id] = passage
+        self._delta_counts[doc_id] = counts
+        self._delta_df.update(counts.keys())
+
+    def add(self, passages: Iterable[Dict[str, Any]]) -> int:
+        """Add or replace passages (dicts with board, class_level, subject, topic, text, optional id/title)"""
+        normalized = [_passage(p.get('board'), p.get('class_level'), p.get('subject'), p.get('topic'),
+                               p.get('text'), p.get('title'), p.get('id')) for p in passages]
+        with self._lock:
+            with open(self.delta_path, 'a', encoding='utf-8') as f:
+                for passage in normalized:
+                    f.write(json.dumps(passage, ensure_ascii=False) + '\n')
+            for passage in normalized:
+                self._apply(passage)
+            # The delta is scored passage by passage, so keep it small
+            if len(self._delta) > self.max_delta:
+                self.compact()
+        return len(normalized)
+
+    def compact(self) -> None:
+        """Fold the delta into a new base file"""
+        with self._lock:
+            passages = []
+            if self._base is not None:
+                passages = [self._base.record(doc) for doc in range(self._base.doc_count)
+                            if not self._hidden[doc]]
+            passages.extend(self._delta.values())
+            write_index(self.path, passages)
+            if os.path.exists(self.delta_path):
+                os.remove(self.delta_path)
+            self.open()
+
+    def search(self, query: str, k: int = 3, board: Optional[str] = None,
+               class_level: Optional[str] = None, subject: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Top-k passages for query as dicts with a 'score', filtered by board/class/subject"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or k <= 0:
+            return []
+        filters = {'board': board, 'class_level': class_level, 'subject': subject}
+
+        with self._lock:
+            base = self._base
+            base_count = int((~self._hidden).sum())
+            delta_len = sum(sum(counts.values()) for counts in self._delta_counts.values())
+            doc_count = base_count + len(self._delta)
+            if not doc_count:
+                return []
+            base_len = float(base.doc_len[~self._hidden].sum()) if base is not None else 0.0
+            avgdl = (base_len + delta_len) / doc_count or 1.0
+
+            candidates: List[Tuple[float, Any]] = []
+            if base is not None and base_count:
+                scores = np.zeros(base.doc_count, np.float32)
+                norm = self.k1 * (1 - self.b + self.b * base.doc_len.astype(np.float32) / avgdl)
+                for term in terms:
+                    doc_ids, tfs = base.postings(term)
+                    df = doc_ids.size + self._delta_df.get(term, 0)
+                    if not df:
+                        continue
+                    idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                    tf = tfs.astype(np.float32)
+                    scores[doc_ids] += idf * tf * (self.k1 + 1) / (tf + norm[doc_ids])
+                scores[self._hidden] = 0
+                mask = base.filter_mask(filters)
+                if mask is not None:
+                    scores[~mask] = 0
+                top = min(k, int(np.count_nonzero(scores)))
+                if top:
+                    best = np.argpartition(-scores, top - 1)[:top]
+                    candidates.extend((float(scores[doc]), int(doc)) for doc in best)
+
+            for doc_id, counts in self._delta_counts.items():
+                passage = self._delta[doc_id]
+                if any(value and str(passage.get(field) or '') != str(value)
+                       for field, value in filters.items()):
+                    continue
+                length = sum(counts.values())
+                score = 0.0
+                for term in terms:
+                    tf = counts.get(term)
+                    if not tf:
+                        continue
+                    df = self._delta_df[term] + (base.postings(term)[0].size if base is not None else 0)
+                    idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                    score += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avgdl))
+                if score > 0:
+                    candidates.append((score, doc_id))
+
+            candidates.sort(key=lambda item: -item[0])
+            results = []
+            for score, doc in candidates[:k]:
+                passage = dict(base.record(doc) if isinstance(doc, int) else self._delta[doc])
+                passage['score'] = round(score, 4)
+                results.append(passage)
+            return results
+
+    def close(self) -> None:
+        with self._lock:
+            if self._base is not None:
+                self._base.close()
+                self._base = None
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from config import SEARCH_INDEX_PATH, CURRICULUM_DATA_DIR
+
+    parser = argparse.ArgumentParser(description="Build or query the curriculum search index")
+    parser.add_argument('--index', default=SEARCH_INDEX_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="rebuild the base index from the curriculum files")
+    build.add_argument('--data-dir', default=CURRICULUM_DATA_DIR)
+    add = commands.add_parser('add', help="add or update passages from a JSON file (list of passages)")
+    add.add_argument('file')
+    commands.add_parser('compact', help="fold the delta log into the base index")
+    query = commands.add_parser('query', help="print the top passages for a query")
+    query.add_argument('text')
+    query.add_argument('-k', type=int, default=3)
+    for field in FILTER_FIELDS:
+        query.add_argument(f"--{field.replace('_', '-')}")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'build':
+        SearchIndex.build(args.index, args.data_dir).close()
+    elif args.command == 'add':
+        index = SearchIndex(args.index)
+        print(f"Added {index.add(_read_json(args.file))} passages")
+        index.close()
+    elif args.command == 'compact':
+        index = SearchIndex(args.index)
+        index.compact()
+        index.close()
+    else:
+        index = SearchIndex(args.index)
+        for hit in index.search(args.text, args.k, args.board, args.class_level, args.subject):
+            print(json.dumps(hit, ensure_ascii=False))
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
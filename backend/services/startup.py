@@ -0,0 +1,179 @@
+"""Lazily built components, preloading before fork, and worker readiness.
+
+Heavy components (the OpenAI client, stores, indexes) are registered as Lazy
+placeholders and built on first use, so importing the app stays cheap.
+Components marked preload are fork-safe and read-only: production.py builds
+them once in the parent process and forked workers share their pages
+copy-on-write. Everything else owns threads, connection pools or SQLite
+connections and is built in each worker by warm_up(); /api/ready reports 503
+until that has finished. Components that failed are retried with backoff, and
+the worker reports ready again as soon as they have been built, whether by a
+retry or on first use.
+"""
+import importlib
+import logging
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Backoff between retries of components that failed to build (a locked file, an index being rebuilt, ...)
+RETRY_INITIAL_SECONDS = 1.0
+RETRY_MAX_SECONDS = 60.0
+
+
+class Lazy:
+    """Stands in for a component that is built on first attribute access.
+
+    Attributes are forwarded to the built object, so callers use the
+    placeholder like the component itself. The factory runs once, under a
+    lock; if it raises, the next access tries again.
+    """
+    __slots__ = ('name', '_factory', '_lock', '_value')
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._value = None
+
+    @property
+    def built(self) -> bool:
+        return self._value is not None
+
+    def resolve(self) -> Any:
+        value = self._value
+        if value is None:
+            with self._lock:
+                if self._value is None:
+                    self._value = self._factory()
+                value = self._value
+        return value
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.resolve(), attr)
+
+    def __repr__(self) -> str:
+        return f"<Lazy {self.name}{' (built)' if self.built else ''}>"
+
+
+class Startup:
+    """Registry of lazily built components and the warm-up that builds them before serving"""
+
+    def __init__(self):
+        self._preload: List[Lazy] = []
+        self._per_process: List[Lazy] = []
+        self._modules: List[str] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._done = threading.Event()
+        self.failed: Dict[str, str] = {}
+        self.warm_up_seconds: Optional[float] = None
+
+    def component(self, name: str, factory: Callable[[], Any], preload: bool = False) -> Lazy:
+        """Register a component; preload=True only for fork-safe, read-only ones"""
+        lazy = Lazy(name, factory)
+        (self._preload if preload else self._per_process).append(lazy)
+        return lazy
+
+    def preload_modules(self, *names: str) -> None:
+        """Modules to import before forking that no preloaded component imports itself"""
+        self._modules.extend(names)
+
+    def preload(self) -> float:
+        """Import the heavy modules and build the preload components; returns the seconds taken"""
+        started = time.perf_counter()
+        for name in self._modules:
+            importlib.import_module(name)
+        for lazy in self._preload:
+            lazy.resolve()
+        elapsed = time.perf_counter() - started
+        logger.info(f"Preloaded {len(self._preload)} components in {elapsed:.2f}s")
+        return elapsed
+
+    def _component(self, name: str) -> Optional[Lazy]:
+        return next((lazy for lazy in self._preload + self._per_process if lazy.name == name), None)
+
+    def _names(self) -> List[str]:
+        return self._modules + [lazy.name for lazy in self._preload + self._per_process]
+
+    def _build(self, name: str) -> None:
+        """Import the module or build the component called name; raises if that fails"""
+        lazy = self._component(name)
+        if lazy is None:
+            importlib.import_module(name)
+        else:
+            lazy.resolve()
+
+    def _built(self, name: str) -> bool:
+        lazy = self._component(name)
+        return name in sys.modules if lazy is None else lazy.built
+
+    def warm_up(self) -> None:
+        """Build every registered component, recording (not raising) failures"""
+        started = time.perf_counter()
+        for name in self._names():
+            try:
+                self._build(name)
+            except Exception as e:
+                logger.error(f"Error building {name} during warm-up: {str(e)}")
+                with self._lock:
+                    self.failed[name] = str(e)
+        self.warm_up_seconds = time.perf_counter() - started
+        self._done.set()
+        logger.info(f"Warm-up finished in {self.warm_up_seconds:.2f}s"
+                    + (f" with failures: {', '.join(self.failed)}" if self.failed else ""))
+
+    def retry_failed(self) -> None:
+        """Rebuild failed components with exponential backoff until none is left"""
+        delay = RETRY_INITIAL_SECONDS
+        while self._failures():
+            time.sleep(delay)
+            for name in self._failures():
+                try:
+                    self._build(name)
+                except Exception as e:
+                    logger.warning(f"Retrying {name} failed: {str(e)}")
+                    with self._lock:
+                        self.failed[name] = str(e)
+            delay = min(delay * 2, RETRY_MAX_SECONDS)
+        logger.info("All components built")
+
+    def _failures(self) -> List[str]:
+        """Names of the components that failed and have not been built since (e.g. on first use)"""
+        with self._lock:
+            for name in [name for name in self.failed if self._built(name)]:
+                del self.failed[name]
+            return list(self.failed)
+
+    def _warm_up_and_retry(self) -> None:
+        self.warm_up()
+        self.retry_failed()
+
+    def start(self) -> None:
+        """Run warm_up() on a background thread, once per process, then retry what failed"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._warm_up_and_retry, name='warm-up', daemon=True)
+                self._thread.start()
+
+    @property
+    def ready(self) -> bool:
+        """True once warm-up has finished and every component is built"""
+        return self._done.is_set() and not self._failures()
+
+    def status(self) -> Dict[str, Any]:
+        if not self._done.is_set():
+            return {'status': 'starting', 'ready': False}
+        failed = self._failures()
+        status = {'status': 'ready' if not failed else 'failed', 'ready': not failed,
+                  'warm_up_seconds': round(self.warm_up_seconds, 3)}
+        if failed:
+            with self._lock:
+                status['failed'] = {name: self.failed[name] for name in failed if name in self.failed}
+        return status
+
+
+startup = Startup()
@@ -0,0 +1,33 @@
+import pytest
+
+from models.near_duplicate_cache import NearDuplicateCache
+
+SCOPE = ('CBSE', 'Class 5', 'Mathematics')
+
+
+@pytest.fixture
+def cache():
+    return NearDuplicateCache(threshold=0.7)
+
+
+def test_rewording_matches(cache):
+    cache.set('What is photosynthesis?', 'How plants make food.', SCOPE)
+    assert cache.get('what is photosynthesis', SCOPE) == 'How plants make food.'
+
+
+@pytest.mark.parametrize('question', ['what is 5-3', 'what is 5*3', 'what is 5 / 3', 'what is 5 × 3',
+                                      'what is 5 − 3', 'what is 3+5', 'what is 5 times 3'])
+def test_questions_differing_only_in_the_operator_do_not_match(cache, question):
+    cache.set('what is 5+3', '5+3 = 8.', SCOPE)
+    assert cache.get(question, SCOPE) is None
+
+
+def test_same_arithmetic_reworded_matches(cache):
+    cache.set('what is 5+3', '5+3 = 8.', SCOPE)
+    assert cache.get('What is 5 + 3?', SCOPE) == '5+3 = 8.'
+
+
+def test_different_numbers_or_kind_do_not_match(cache):
+    cache.set('Why do plants need 2 hours of sunlight?', 'Because...', SCOPE)
+    assert cache.get('Why do plants need 3 hours of sunlight?', SCOPE) is None
+    assert cache.get('When do plants need 2 hours of sunlight?', SCOPE) is None
@@ -0,0 +1,44 @@
+from services.progress_analytics import ProgressAnalytics
+
+
+def row(student, topic, understanding, time_spent=10, subject='Mathematics'):
+    return (student, 'CBSE', 'Class 2', subject, topic, understanding, 1, time_spent)
+
+
+def topic(summary, name):
+    return next(t for t in summary['topics'] if t['topic'] == name)
+
+
+def test_understanding_percentiles_exclude_unrated_rows():
+    analytics = ProgressAnalytics.from_rows([
+        row('s1', 'Multiplication', 4),
+        row('s2', 'Multiplication', 5),
+        row('s3', 'Multiplication', 0),
+        row('s4', 'Multiplication', 0),
+        row('s5', 'Multiplication', 0),
+    ])
+    summary = analytics.summary()
+    multiplication = topic(summary, 'Multiplication')
+    assert multiplication['students'] == 5
+    assert multiplication['unrated_students'] == 3
+    assert summary['unrated_rows'] == 3
+    assert multiplication['mean_understanding'] == 4.5
+    assert multiplication['understanding_percentiles'] == {'p25': 4, 'p50': 4, 'p75': 4, 'p90': 4}
+    # Time spent still counts every row
+    assert multiplication['time_spent_percentiles']['p50'] == 10
+
+
+def test_topic_with_only_unrated_rows_has_no_understanding_percentiles():
+    analytics = ProgressAnalytics.from_rows([
+        row('s1', 'Addition', 0, time_spent=5),
+        row('s1', 'Multiplication', 2),
+        row('s2', 'Multiplication', 3),
+    ])
+    summary = analytics.summary()
+    addition = topic(summary, 'Addition')
+    assert addition['understanding_percentiles'] is None
+    assert addition['mean_understanding'] is None
+    assert addition['unrated_students'] == 1
+    assert addition['time_spent_percentiles']['p50'] == 5
+    assert topic(summary, 'Multiplication')['understanding_percentiles']['p90'] == 2
+    assert topic(summary, 'Multiplication')['lagging_students'] == ['s1']
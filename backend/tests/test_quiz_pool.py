@@ -0,0 +1,69 @@
+from agents.safety_filter import SafetyFilter
+from agents.validator_agent import ValidatorAgent
+from services.quiz_pool import QuizPool
+
+KEY = ('CBSE', 'Class 2', 'Mathematics', 'Multiplication')
+
+QUIZ = """1. What is 3 × 4?
+a) 7
+b) 12
+c) 34
+d) 1
+[correct: b]
+2. Which weapon helps you multiply?
+a) A sword
+b) A bow
+c) A spear
+d) An axe
+[correct: a]
+3. What is 2 × 5?
+a) 10
+b) 7
+c) 25
+d) 3
+[correct: a]
+"""
+
+
+class FakeClient:
+    def __init__(self, content):
+        self.content = content
+
+    def generate(self, prompt, **kwargs):
+        return self.content
+
+
+def make_pool(tmp_path, validator):
+    return QuizPool(str(tmp_path / 'quiz_pool.db'), FakeClient(QUIZ), validator=validator, refill_workers=1)
+
+
+def test_fill_skips_questions_that_fail_validation(tmp_path):
+    pool = make_pool(tmp_path, ValidatorAgent(SafetyFilter({'violence': ['weapon']})))
+    try:
+        assert pool.fill(KEY, 3) == 2
+        stats = pool.stats()
+        assert stats['questions'] == 2
+        assert stats['invalid_rejected'] == 1
+        assert stats['duplicates_skipped'] == 0
+        served = [q['question'] for q in pool.sample(KEY, 'student', 3)]
+        assert not any('weapon' in q for q in served)
+    finally:
+        pool.close()
+
+
+def test_fill_checks_options_too(tmp_path):
+    pool = make_pool(tmp_path, ValidatorAgent(SafetyFilter({'violence': ['sword']})))
+    try:
+        assert pool.fill(KEY, 3) == 2
+        assert pool.stats()['invalid_rejected'] == 1
+    finally:
+        pool.close()
+
+
+def test_fill_without_validator_keeps_every_question(tmp_path):
+    pool = make_pool(tmp_path, None)
+    try:
+        assert pool.fill(KEY, 3) == 3
+        assert pool.stats()['invalid_rejected'] == 0
+    finally:
+        pool.close()
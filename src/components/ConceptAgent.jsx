@@ -228,6 +228,7 @@ const ConceptAgent = ({ topic, onClose, studentId, board, classLevel, subject })
           board,
           classLevel,
           subject,
+          topic, // Follow-ups continue the server-side chat session for this topic
           skipValidation: true // Add flag to skip validation
         }),
       });
@@ -295,6 +296,7 @@ const ConceptAgent = ({ topic, onClose, studentId, board, classLevel, subject })
           board,
           classLevel,
           subject,
+          topic,
           skipValidation: true
         },
       });
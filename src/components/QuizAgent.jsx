@@ -32,36 +32,20 @@ const QuizAgent = ({ topic, onClose, studentId, board, classLevel, subject }) =>
   const generateQuiz = async () => {
     setIsLoading(true);
     setQuizState('ready');
+    setFeedback(null);
     try {
-      const timestamp = new Date().getTime();
-      const response = await fetch('http://localhost:8000/chat', {
+      const response = await fetch('http://localhost:8000/quiz', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({
-          message: `Generate a quiz about ${topic} for ${classLevel} level. Format:
-1. Question 1
-a) Option 1
-b) Option 2
-c) Option 3
-d) Option 4
-[correct: d]
-
-2. Question 2
-a) Option 1
-b) Option 2
-c) Option 3
-d) Option 4
-[correct: b]
-
-Include 5 questions total. Keep questions concise. Mark correct answers using [correct: x] format after the options, where x is the letter of the correct option.`,
+          topic,
           studentId,
           board,
           classLevel,
           subject,
-          skipValidation: true,
-          timestamp: timestamp
+          count: 5
         }),
       });
 
@@ -70,124 +54,27 @@ Include 5 questions total. Keep questions concise. Mark correct answers using [c
       }
 
       const data = await response.json();
-      const parsedQuestions = parseQuizResponse(data.response);
-      
-      // Validate that we have enough questions
-      if (parsedQuestions.length < 3) {
-        throw new Error('Not enough questions generated');
+      // Questions come parsed and checked by the server: 4 options, correctAnswer is the option index
+      const quizQuestions = data.questions || [];
+      if (quizQuestions.length === 0) {
+        throw new Error('No questions available');
       }
 
-      setQuestions(parsedQuestions);
+      setQuestions(quizQuestions);
       setLearningProgress(prev => ({
         ...prev,
-        totalQuestions: parsedQuestions.length
+        totalQuestions: quizQuestions.length
       }));
       setQuizState('active');
     } catch (error) {
       console.error('Error generating quiz:', error);
-      setFeedback('Failed to generate quiz. Please try again.');
-      // Retry quiz generation on error with a more specific prompt
-      setTimeout(async () => {
-        try {
-          const retryResponse = await fetch('http://localhost:8000/chat', {
-            method: 'POST',
-            headers: {
-              'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-              message: `Generate a simple quiz about ${topic} for ${classLevel} level. Format each question as:
-Question: [question text]
-a) [option 1]
-b) [option 2]
-c) [option 3]
-d) [option 4]
-[correct: x]
-
-Generate 5 questions. Keep them simple and clear. Mark correct answers using [correct: x] format after the options, where x is the letter of the correct option.`,
-              studentId,
-              board,
-              classLevel,
-              subject,
-              skipValidation: true
-            }),
-          });
-
-          if (!retryResponse.ok) {
-            throw new Error('Failed to generate quiz on retry');
-          }
-
-          const retryData = await retryResponse.json();
-          const retryQuestions = parseQuizResponse(retryData.response);
-          
-          if (retryQuestions.length >= 3) {
-            setQuestions(retryQuestions);
-            setLearningProgress(prev => ({
-              ...prev,
-              totalQuestions: retryQuestions.length
-            }));
-            setQuizState('active');
-            setFeedback(null);
-          } else {
-            throw new Error('Invalid quiz format on retry');
-          }
-        } catch (retryError) {
-          console.error('Error in retry:', retryError);
-          setFeedback('Unable to generate quiz. Please try again later.');
-          setQuizState('error');
-        }
-      }, 1000);
+      setFeedback('Unable to generate quiz. Please try again later.');
+      setQuizState('error');
     } finally {
       setIsLoading(false);
     }
   };
 
-  const parseQuizResponse = (response) => {
-    const questions = [];
-    const lines = response.split('\n');
-    let currentQuestion = null;
-    let questionCount = 0;
-
-    for (const line of lines) {
-      const trimmedLine = line.trim();
-      if (!trimmedLine) continue;
-
-      if (trimmedLine.match(/^\d+\./) || trimmedLine.startsWith('Question:')) {
-        if (currentQuestion) {
-          if (currentQuestion.options.length === 4 && currentQuestion.correctAnswer !== null) {
-            questions.push(currentQuestion);
-            questionCount++;
-          }
-        }
-        currentQuestion = {
-          question: trimmedLine.replace(/^\d+\.\s*|^Question:\s*/i, ''),
-          options: [],
-          correctAnswer: null
-        };
-      } else if (trimmedLine.match(/^[a-d]\)/i) && currentQuestion) {
-        const option = trimmedLine.replace(/^[a-d]\)\s*/i, '');
-        currentQuestion.options.push(option);
-      } else if (trimmedLine.match(/\[correct:\s*([a-d])\]/i) && currentQuestion) {
-        const match = trimmedLine.match(/\[correct:\s*([a-d])\]/i);
-        if (match) {
-          const correctLetter = match[1].toLowerCase();
-          currentQuestion.correctAnswer = correctLetter.charCodeAt(0) - 'a'.charCodeAt(0);
-        }
-      }
-    }
-
-    if (currentQuestion && currentQuestion.options.length === 4 && currentQuestion.correctAnswer !== null) {
-      questions.push(currentQuestion);
-      questionCount++;
-    }
-
-    // Ensure we have at least 3 questions with 4 options each
-    if (questionCount < 3 || questions.some(q => q.options.length < 4 || q.correctAnswer === null)) {
-      throw new Error('Invalid quiz format');
-    }
-
-    return questions;
-  };
-
   const handleAnswer = async (answerIndex) => {
     const currentQuestionData = questions[currentQuestion];
     const selectedAnswer = currentQuestionData.options[answerIndex];